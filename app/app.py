@@ -1,33 +1,185 @@
+import functools
+import sys
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 
+# Make the bizecon package (repo root) importable under `streamlit run app/app.py`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bizecon import forecasting, metrics, ml, multiseries, scenarios
+from bizecon.anomalies import DEFAULT_DETECTORS, DETECTORS
+from bizecon.dataset import Snapshot, open_dataset
+from bizecon.filters import Filters
+from bizecon.jobs import JobRunner
+from bizecon.profiler import RenderProfile
+from bizecon.store import CSV_PATH
+
+# Copy-on-write: columns added or assigned on a session's frame never write
+# into the shared, memory-mapped buffers (default from pandas 3)
+if pd.__version__.startswith("2."):
+    pd.set_option("mode.copy_on_write", True)
+
 # ----------------------------
-# Load Dataso gove me 
+# Load Data
 # ----------------------------
-@st.cache_data
-def load_data():
-    df = pd.read_csv("./data/transactions.csv")
+# One memory-mapped dataset per process, shared by every browser session.
+# cache_resource hands out the same object instead of pickling a copy per
+# call. All numbers below come from bizecon.metrics / bizecon.ml over this
+# dataset; this script only renders them. BIZECON_BACKEND=duckdb queries a
+# Parquet copy out of core instead of loading the rows (see bizecon.backends).
+@st.cache_resource
+def shared_dataset():
+    return open_dataset(CSV_PATH)
+
+# Cheap stat() per rerun; appended CSV rows are folded in, rewrites reload
+dataset = shared_dataset()
+dataset.refresh()
+base = dataset.snapshot()
+# Narrowed by the sidebar filters below, before any section reads it
+snap = base
 
-    # FIX: ensure Arrow-safe types for Streamlit performance
-    for col in df.columns:
-        if df[col].dtype == "object":
-            df[col] = df[col].astype(str)
+# ----------------------------
+# Lazy sections
+# ----------------------------
+# Tabs track which one is open and rerun on switch, so hidden tabs skip
+# their work. Sections that own widgets are fragments: moving their sliders
+# reruns only that section. Expensive results are memoized per dataset
+# fingerprint and shared by every session, so switching back is instant.
+def lazy_tabs(labels, key):
+    try:
+        return st.tabs(labels, key=key, on_change="rerun")
+    except TypeError:
+        # Older Streamlit without tab state: every tab computes
+        return st.tabs(labels)
+
+def is_open(tab):
+    return getattr(tab, "open", None) is not False
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def _memoized(fingerprint, name, args, _fn, _snap, _profile):
+    # Only runs on a cache miss
+    _profile.note_build(name)
+    return _fn(_snap, *args)
+
+def memoized(fn, snap, *args):
+    """fn(snap, *args), computed once per dataset version and arguments."""
+    return _memoized(snap.fingerprint, f"{fn.__module__}.{fn.__qualname__}", args, fn, snap, profile)
+
+def profiled(name, rows=None):
+    """Decorator for fragment bodies, under @st.fragment: times their own reruns.
+
+    On a full rerun the fragment is timed by its enclosing section. A
+    fragment-only rerun comes after the page's profile has finished, so it
+    gets a RenderProfile of its own, shown in the fragment and logged.
+    """
+    def wrap(body):
+        @functools.wraps(body)
+        def run(*args, **kwargs):
+            global profile
+            if not profile_sections or profile.enabled:
+                return body(*args, **kwargs)
+            page = profile
+            profile = RenderProfile(enabled=True, cols=page.cols)
+            try:
+                with profile.section(name, rows=rows):
+                    result = body(*args, **kwargs)
+                st.caption(f"Fragment rerun {profile.rerun_id} · {name}: {profile.total_ms():.0f} ms")
+                return result
+            finally:
+                profile.finish()
+                profile = page
+        return run
+    return wrap
 
-    return df
 
-df = load_data()
 # ----------------------------
-# Preprocess once (CRITICAL for speed)
+# Background ML jobs
 # ----------------------------
-@st.cache_data
-def preprocess_df(df):
-    df = df.copy()
-    df["date_dt"] = pd.to_datetime(df["date"])
-    df["date_only"] = df["date_dt"].dt.date
-    return df
-
-# Preprocess once (CRITICAL for speed)
-df = preprocess_df(df)
+# ML Lab fits run in a process pool shared by every session (bizecon.jobs),
+# so the script thread only renders. Identical fits requested by several
+# sessions run once; while a new data version trains, the previous result
+# under the same filters stays on screen, marked as refreshing.
+@st.cache_resource
+def shared_jobs():
+    return JobRunner()
+
+jobs = shared_jobs()
+
+@st.fragment(run_every=1.0)
+def watch_job(job, stale):
+    # Polls until the job finishes, then reruns the page to show its result
+    if job.done:
+        st.rerun()
+    what = "Refreshing (showing the previous data version)" if stale else "Training"
+    st.caption(f"⏳ {what} in the background · {job.status} · {job.elapsed():.0f}s")
+
+# Retry buttons drawn this run (a job can be rendered by more than one tab)
+_retry_keys = set()
+
+def retry_failed(job, stale):
+    """Shows a failed job's error with a Retry button; True when it was clicked."""
+    kept = " (showing the previous data version)" if stale else ""
+    st.error(f"⚠️ Background job '{job.name}' failed{kept}: {type(job.error).__name__}: {job.error}")
+    key = f"retry-{job.name}"
+    if key in _retry_keys:
+        return False
+    _retry_keys.add(key)
+    return st.button("Retry", key=key)
+
+def job_scope():
+    """Which earlier results may stand in for a job's: those under the same filters."""
+    return f"{CSV_PATH}|{filters.key()}"
+
+def background(name, snap, fn, *args):
+    """fn(*args) as a background job for this data version.
+
+    Returns the finished job to render: this version's, else the newest
+    earlier one under the same filters while this one runs or after it failed (None if there is
+    none yet). A failure is shown with a Retry button.
+    """
+    job = jobs.submit(name, snap.fingerprint, fn, *args, scope=job_scope())
+    stale = jobs.latest(name, job_scope())
+    if job.status == "failed":
+        if not retry_failed(job, stale is not None):
+            return stale
+        job = jobs.submit(name, snap.fingerprint, fn, *args, scope=job_scope(), retry=True)
+    if job.done:
+        return job
+    watch_job(job, stale is not None)
+    return stale
+
+def forecast_engine():
+    return "holt_winters" if fast_mode else "prophet"
+
+def revenue_fit(snap):
+    """(fit of daily revenue to render or None, still fitting?).
+
+    Fast Mode fits NumPy Holt-Winters in the script thread (milliseconds);
+    Prophet runs as a background job, showing the previous fit meanwhile.
+    """
+    if forecast_engine() == "holt_winters":
+        return ml.revenue_model(snap, "holt_winters"), False
+    job = background("forecast", snap, forecasting.fit_series,
+                     ml.daily_revenue(snap), forecasting.FORECAST_HORIZON, "prophet")
+    current = jobs.get("forecast", snap.fingerprint)
+    if job is not None and job is current:
+        fitted = job.result()
+        forecasting.SERVICE.put((snap.fingerprint, "revenue"), fitted)
+        return fitted, False
+    if job is None and current is None:
+        # Nothing to show and nothing running (e.g. the runner dropped the job)
+        return None, False
+    return (job.result() if job is not None else None), current is not None and not current.done
+
+def segment_fit(snap):
+    """Batch forecast of every city / source / city x source series, or None yet."""
+    if forecast_engine() == "holt_winters":
+        return memoized(ml.segment_forecasts, snap, "holt_winters")
+    job = background("segments-prophet", snap, multiseries.forecast_cube, snap.cube,
+                     forecasting.FORECAST_HORIZON, "prophet")
+    return job.result() if job is not None else None
 # ----------------------------
 # Performance defaults (defined BEFORE use)
 # ----------------------------
@@ -95,13 +247,16 @@ DISPLAY_NAME_MAP = {
     "total_spend": "Total Spend",
     "roi": "ROI",
     "flagIso": "Isolation Forest Flag",
-    "flagZRevenue": "Z-Score Revenue Flag",
-    "flagZProfit": "Z-Score Profit Flag",
-    "flagZCac": "Z-Score CAC Flag",
-    "flagMadRevenue": "MAD Revenue Flag",
-    "flagMadProfit": "MAD Profit Flag",
-    "flagMadCac": "MAD CAC Flag",
-    "flagProphet": "Prophet Flag",
+    "flagZRevenue": "Rolling Z-Score Revenue Flag",
+    "flagZProfit": "Rolling Z-Score Profit Flag",
+    "flagZCac": "Rolling Z-Score CAC Flag",
+    "flagEwmaRevenue": "EWMA Z-Score Revenue Flag",
+    "flagEwmaProfit": "EWMA Z-Score Profit Flag",
+    "flagEwmaCac": "EWMA Z-Score CAC Flag",
+    "flagMadRevenue": "Rolling MAD Revenue Flag",
+    "flagMadProfit": "Rolling MAD Profit Flag",
+    "flagMadCac": "Rolling MAD CAC Flag",
+    "flagForecast": "Forecast Interval Flag",
     "any_flag": "Any Flag",
 }
 
@@ -163,25 +318,9 @@ else:
     if _original_line_chart is not None:
         st.line_chart = _original_line_chart
 
-# --------------------------------------------
-# Synthetic user_id generation (non-destructive)
-# --------------------------------------------
-import numpy as np
-
-if not any(col.lower() in ["user_id","userid","customer_id","customer","user"] for col in df.columns):
-    num_users = max(50, len(df) // 5)  # approx one user per 5 orders
-    df["synthetic_user_id"] = np.random.randint(1, num_users + 1, size=len(df))
-    inferred_user_col = "synthetic_user_id"
-else:
-    # Use the real one
-    for c in df.columns:
-        if str(c).lower() in ["user_id","userid","customer_id","customer","user"]:
-            inferred_user_col = c
-            break
-
 # Try to infer a user identifier column (user-level metrics depend on this)
-# Use the inferred synthetic or real user column
-user_col = inferred_user_col
+# Use the inferred synthetic or real user column (see bizecon.dataset)
+user_col = snap.user_col
 
 # ----------------------------
 # Page Config
@@ -386,6 +525,29 @@ section[data-testid="stSidebar"] {
     backdrop-filter: blur(18px);
     border-right: 1px solid rgba(255,255,255,0.08);
 }
+
+/* -------- RENDER PROFILE WATERFALL -------- */
+.prof-row {
+    font-size: 11px;
+    color: #A0A0A0;
+    margin-bottom: 6px;
+}
+.prof-track {
+    position: relative;
+    height: 6px;
+    border-radius: 3px;
+    background: rgba(255,255,255,0.06);
+}
+.prof-bar {
+    position: absolute;
+    height: 6px;
+    min-width: 2px;
+    border-radius: 3px;
+    background: linear-gradient(90deg, #b6ffdd, #1a362a);
+}
+.prof-bar.miss {
+    background: linear-gradient(90deg, #ffb6b6, #5a1a1a);
+}
 </style>
 """, unsafe_allow_html=True)
 
@@ -396,7 +558,19 @@ with st.sidebar:
     st.markdown("### ⚡ Performance")
     enable_advanced = st.checkbox("Enable Advanced KPIs", value=False)
     enable_ml = st.checkbox("Enable ML Lab", value=False)
-    fast_mode = st.checkbox("Fast Mode (Disable display mapping)", value=True)
+    fast_mode = st.checkbox("Fast Mode (Disable display mapping, NumPy forecaster)", value=True)
+    profile_sections = st.checkbox("Profile sections", value=False,
+                                   help="Time each section of this rerun and log it to data/logs/render_profile.jsonl")
+    st.markdown("---")
+    st.markdown("### 🔎 Filters")
+    first_day, last_day = base.cube["day"].min().date(), base.cube["day"].max().date()
+    filter_dates = st.date_input("Date range", (first_day, last_day), min_value=first_day,
+                                 max_value=last_day, key="filter_dates")
+    filter_cities = st.multiselect("Cities", sorted(base.cube["city"].unique()), key="filter_cities")
+    filter_sources = st.multiselect("Marketing sources", sorted(base.cube["marketing_source"].unique()),
+                                    key="filter_sources")
+    filter_promo = st.radio("Promo orders", ["All", "Promo", "No promo"], horizontal=True, key="filter_promo")
+    rows_caption = st.empty()
     st.markdown("---")
     st.markdown("### 📊 Dashboard")
     st.write("Business Economics & Insights")
@@ -409,667 +583,614 @@ with st.sidebar:
     st.markdown("---")
     st.caption("Accent: #1A362A · Dark hybrid theme")
 
+# Per-section timings for this rerun (no-op unless enabled in the sidebar)
+profile = RenderProfile(enabled=profile_sections, cols=base.cols)
+
 # ----------------------------
-# Hero
+# Global filters
 # ----------------------------
-st.markdown('<p class="hero">Business Intelligence, Done Right.</p>', unsafe_allow_html=True)
-st.markdown('<div class="fade-in"><p class="subhero">Dark, focused, and built to show you what actually makes money.</p></div>', unsafe_allow_html=True)
+# Every section below reads the filtered snapshot. Filtering selects cube
+# cells at once; rows are only located (date-sorted binary search plus
+# dictionary codes) when a row-level section first needs them.
+# date_input yields a 1-tuple while the end date is being picked
+filter_start = filter_dates[0] if len(filter_dates) > 0 and filter_dates[0] != first_day else None
+filter_end = filter_dates[1] if len(filter_dates) > 1 and filter_dates[1] != last_day else None
+filters = Filters(
+    start=pd.Timestamp(filter_start) if filter_start else None,
+    end=pd.Timestamp(filter_end) if filter_end else None,
+    cities=tuple(filter_cities),
+    sources=tuple(filter_sources),
+    promo={"All": None, "Promo": True, "No promo": False}[filter_promo],
+)
+if filters.active:
+    with profile.section("Filters", rows=len(base.cube)):
+        snap = memoized(Snapshot.filtered, base, filters)
+
+sample_rows = snap.backend.head(50)
+n_rows = snap.backend.row_count()
+rows_caption.caption(f"Query backend: {snap.backend.name} · {n_rows:,} of {base.backend.row_count():,} rows")
 
 # ----------------------------
-# KPI Calculations
+# Hero
 # ----------------------------
-total_revenue = df["revenue"].sum()
-total_cogs = df["cogs"].sum()
-total_gross_margin = df["gross_margin"].sum()
-total_opex = df["opex_allocated"].sum()
-net_profit = total_gross_margin - total_opex - df["marketing_cost"].sum()
+st.markdown('<p class="hero">Business Intelligence, Done Right.</p>', unsafe_allow_html=True)
+st.markdown('<div class="fade-in"><p class="subhero">Dark, focused, and built to show you what actually makes money.</p></div>', unsafe_allow_html=True)
 
-# New KPIs
-best_city = df.groupby("city")["gross_margin"].mean().idxmax()
-top_marketing_source = df.groupby("marketing_source")["revenue"].sum().idxmax()
-avg_basket_size = df["revenue"].mean()
 
 # ----------------------------
-# KPI Row (Glass-style)
+# KPI Calculations (bizecon.metrics, from the rollup cube)
 # ----------------------------
-kpis_html = f"""
+if snap.cube.empty:
+    st.warning("No orders match the sidebar filters.")
+    profile.finish()
+    st.stop()
+
+with profile.section("KPI row", rows=len(snap.cube)):
+    kpi = metrics.kpis(snap)
+
+    # ----------------------------
+    # KPI Row (Glass-style)
+    # ----------------------------
+    kpis_html = f"""
 <div class="kpi-row">
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Revenue</div>
-        <div class="kpi-value">₹{total_revenue:,.0f}</div>
+        <div class="kpi-value">₹{kpi.total_revenue:,.0f}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">COGS</div>
-        <div class="kpi-value">₹{total_cogs:,.0f}</div>
+        <div class="kpi-value">₹{kpi.total_cogs:,.0f}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Gross Margin</div>
-        <div class="kpi-value">₹{total_gross_margin:,.0f}</div>
+        <div class="kpi-value">₹{kpi.total_gross_margin:,.0f}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">OPEX</div>
-        <div class="kpi-value">₹{total_opex:,.0f}</div>
+        <div class="kpi-value">₹{kpi.total_opex:,.0f}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Net Profit</div>
-        <div class="kpi-value">₹{net_profit:,.0f}</div>
+        <div class="kpi-value">₹{kpi.net_profit:,.0f}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Best City</div>
-        <div class="kpi-value">{best_city}</div>
+        <div class="kpi-value">{kpi.best_city}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Top Marketing Source</div>
-        <div class="kpi-value">{top_marketing_source}</div>
+        <div class="kpi-value">{kpi.top_marketing_source}</div>
     </div>
     <div class="kpi-card">
         <div class="kpi-accent"></div>
         <div class="kpi-label">Avg Basket Size</div>
-        <div class="kpi-value">₹{avg_basket_size:,.0f}</div>
+        <div class="kpi-value">₹{kpi.avg_basket_size:,.0f}</div>
     </div>
 </div>
 """
 
 
 
-st.markdown(kpis_html, unsafe_allow_html=True)
-st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown(kpis_html, unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
 st.markdown("")  # small spacing
 
 # ----------------------------
 # Tabs Layout
 # ----------------------------
-tab1, tab2, tab3, tab4 = st.tabs(["Overview", "Cities", "Marketing", "Profit + Simulator"])
+tab1, tab2, tab3, tab4 = lazy_tabs(["Overview", "Cities", "Marketing", "Profit + Simulator"], key="main_tab")
 
 # ----------------------------
 # TAB 1 — Overview
 # ----------------------------
-with tab1:
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">Revenue & Gross Margin Trend</div>', unsafe_allow_html=True)
-    st.markdown('<div class="section-caption">Daily view of top-line performance and contribution strength.</div>', unsafe_allow_html=True)
-
-    df["date_dt"] = pd.to_datetime(df["date"])
-    daily = df.groupby(df["date_dt"].dt.date).agg(
-        revenue=("revenue", "sum"),
-        gross_margin=("gross_margin", "sum")
-    ).reset_index()
+if is_open(tab1):
+    with tab1, profile.section("Overview", rows=len(snap.cube)):
+        st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+        st.markdown('<div class="section-title">Revenue & Gross Margin Trend</div>', unsafe_allow_html=True)
+        st.markdown('<div class="section-caption">Daily view of top-line performance and contribution strength.</div>', unsafe_allow_html=True)
 
-    st.line_chart(daily.set_index("date_dt")[["revenue", "gross_margin"]])
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.line_chart(metrics.daily_trend(snap))
+        st.markdown('</div>', unsafe_allow_html=True)
 
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">Sample Data (Head)</div>', unsafe_allow_html=True)
-    st.dataframe(df.head(50))
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+        st.markdown('<div class="section-title">Sample Data (Head)</div>', unsafe_allow_html=True)
+        st.dataframe(sample_rows)
+        st.markdown('</div>', unsafe_allow_html=True)
 
 # ----------------------------
 # TAB 2 — Cities
 # ----------------------------
-with tab2:
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">City-wise Revenue Breakdown</div>', unsafe_allow_html=True)
-    st.markdown('<div class="section-caption">Which markets actually drive your top-line?</div>', unsafe_allow_html=True)
+if is_open(tab2):
+    with tab2, profile.section("Cities", rows=len(snap.cube)):
+        st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+        st.markdown('<div class="section-title">City-wise Revenue Breakdown</div>', unsafe_allow_html=True)
+        st.markdown('<div class="section-caption">Which markets actually drive your top-line?</div>', unsafe_allow_html=True)
 
-    city_rev = df.groupby("city")["revenue"].sum().reset_index()
-    st.bar_chart(city_rev, x="city", y="revenue")
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.bar_chart(metrics.city_revenue(snap), x="city", y="revenue")
+        st.markdown('</div>', unsafe_allow_html=True)
 
 # ----------------------------
 # TAB 3 — Marketing
 # ----------------------------
-with tab3:
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">Marketing Source Performance</div>', unsafe_allow_html=True)
-    st.markdown('<div class="section-caption">CAC and ROI by acquisition channel.</div>', unsafe_allow_html=True)
+if is_open(tab3):
+    with tab3, profile.section("Marketing", rows=len(snap.cube)):
+        st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+        st.markdown('<div class="section-title">Marketing Source Performance</div>', unsafe_allow_html=True)
+        st.markdown('<div class="section-caption">CAC and ROI by acquisition channel.</div>', unsafe_allow_html=True)
 
-    marketing_stats = df.groupby("marketing_source").agg(
-        total_spend=("marketing_cost", "sum"),
-        orders=("marketing_cost", "count"),
-        revenue=("revenue", "sum"),
-        gross_margin=("gross_margin", "sum")
-    ).reset_index()
+        marketing_stats = metrics.marketing_performance(snap)
 
-    marketing_stats["CAC"] = marketing_stats["total_spend"] / marketing_stats["orders"]
-    marketing_stats["ROI"] = (marketing_stats["gross_margin"] - marketing_stats["total_spend"]) / marketing_stats["total_spend"]
+        st.dataframe(marketing_stats)
+        st.bar_chart(marketing_stats, x="marketing_source", y="CAC")
 
-    st.dataframe(marketing_stats)
-    st.bar_chart(marketing_stats, x="marketing_source", y="CAC")
-
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
 
 # ----------------------------
 # TAB 4 — Profit + Simulator
 # ----------------------------
-with tab4:
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">Profit Per Order Distribution</div>', unsafe_allow_html=True)
-    st.markdown('<div class="section-caption">How many orders are actually making you money?</div>', unsafe_allow_html=True)
-
-    df["profit_per_order"] = df["gross_margin"] - df["marketing_cost"] - df["opex_allocated"]
-
-    # ---------- FAST PROFIT DISTRIBUTION (BUCKETED) ----------
-    import numpy as np
-
-    # Limit data size for UI responsiveness
-    sample = df["profit_per_order"].dropna()
-    if len(sample) > 5000:
-        sample = sample.sample(5000, random_state=42)
-
-    # Create buckets instead of raw value counts
-    hist, bin_edges = np.histogram(sample, bins=30)
-    profit_bins = pd.Series(hist, index=[f"{int(bin_edges[i])} to {int(bin_edges[i+1])}" for i in range(len(hist))])
+if is_open(tab4):
+    with tab4, profile.section("Profit + Simulator", rows=n_rows):
+        st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+        st.markdown('<div class="section-title">Profit Per Order Distribution</div>', unsafe_allow_html=True)
+        st.markdown('<div class="section-caption">How many orders are actually making you money?</div>', unsafe_allow_html=True)
+
+        # ---------- FULL-DATA PROFIT DISTRIBUTION (per-day histogram sketch) ----------
+        st.bar_chart(memoized(metrics.profit_distribution, snap))
+
+        profit = memoized(metrics.profit_stats, snap)
+        p1, p2, p3, p4 = st.columns(4)
+        with p1:
+            st.metric("Loss-making Orders", f"{profit.loss_share:.1%}")
+        with p2:
+            st.metric("Median Profit / Order", f"₹{profit.percentiles[0.5]:,.2f}")
+        with p3:
+            st.metric("P5 Profit / Order", f"₹{profit.percentiles[0.05]:,.2f}")
+        with p4:
+            st.metric("P95 Profit / Order", f"₹{profit.percentiles[0.95]:,.2f}")
+        st.caption(f"All {profit.orders:,} orders; percentiles within 1%.")
+        st.markdown('</div>', unsafe_allow_html=True)
 
-    st.bar_chart(profit_bins)
-    st.markdown('</div>', unsafe_allow_html=True)
+        # Slider ranges; the AOV x CAC x OPEX sensitivity grid spans the same ones
+        SIM_AOV, SIM_CAC, SIM_OPEX = (50, 1000), (0, 500), (0, 200)
+
+        # Fragment: moving a slider reruns only the simulator
+        @st.fragment
+        @profiled("Scenario Simulator", rows=n_rows)
+        def scenario_simulator():
+            st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Scenario Simulator</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="section-caption">Tweak AOV, CAC, and OPEX: {scenarios.SCENARIOS:,} orders bootstrapped from your data, simulated per move.</div>', unsafe_allow_html=True)
+
+            # Order sample and sensitivity grid: once per dataset (bizecon.scenarios)
+            sample, grid = memoized(metrics.scenario_inputs, snap, SIM_AOV, SIM_CAC, SIM_OPEX)
+            if grid is None:
+                st.info("No orders to simulate.")
+                st.markdown('</div>', unsafe_allow_html=True)
+                return
+            # Sliders start at today's averages
+            start = lambda value, bounds: int(min(max(round(value), bounds[0]), bounds[1]))
+
+            col_sim1, col_sim2, col_sim3 = st.columns(3)
+            with col_sim1:
+                # Revenue can only be scaled (bizecon.scenarios): nothing to scale without any
+                aov = st.slider("Average Order Value (₹)", *SIM_AOV, start(sample.aov, SIM_AOV),
+                                disabled=sample.aov == 0,
+                                help="The selected orders have no revenue to scale." if sample.aov == 0 else None)
+            with col_sim2:
+                cac = st.slider("Customer Acquisition Cost (₹)", *SIM_CAC, start(sample.cac, SIM_CAC))
+            with col_sim3:
+                opex = st.slider("OPEX per order (₹)", *SIM_OPEX, start(sample.mean_opex, SIM_OPEX))
+
+            sim = scenarios.simulate(sample, aov, cac, opex)
+
+            c1, c2, c3, c4 = st.columns(4)
+            with c1:
+                st.metric("Gross Margin per Order", f"₹{sim.gross_margin:.2f}")
+            with c2:
+                st.metric("Profit per Order", f"₹{sim.expected_profit:.2f}")
+            with c3:
+                st.metric("P(Loss) per Order", f"{sim.loss_probability:.1%}")
+            with c4:
+                st.metric("P5 – P95 Profit / Order", f"₹{sim.band[0]:,.0f} – ₹{sim.band[1]:,.0f}")
+            st.caption(f"Average profit per order over a {scenarios.BASKET_ORDERS:,}-order run: "
+                       f"₹{sim.basket_band[0]:,.2f} to ₹{sim.basket_band[1]:,.2f} (90% band).")
+            st.bar_chart(sim.histogram())
+
+            st.markdown(f"**Profit per order by AOV × CAC (OPEX ₹{opex})**")
+            heat = grid.at_opex(opex).round({"aov": 0, "cac": 0, "expected_profit": 2, "loss_probability": 3})
+            st.vega_lite_chart(heat, {
+                "mark": "rect",
+                "encoding": {
+                    "x": {"field": "aov", "type": "ordinal", "title": "AOV (₹)"},
+                    "y": {"field": "cac", "type": "ordinal", "title": "CAC (₹)", "sort": "descending"},
+                    "color": {"field": "expected_profit", "type": "quantitative", "title": "Profit / order",
+                              "scale": {"scheme": "redyellowgreen", "domainMid": 0}},
+                    "tooltip": [{"field": "aov"}, {"field": "cac"}, {"field": "expected_profit"},
+                                {"field": "loss_probability", "format": ".1%"}],
+                },
+            })
 
-    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-    st.markdown('<div class="section-title">Scenario Simulator</div>', unsafe_allow_html=True)
-    st.markdown('<div class="section-caption">Tweak AOV, CAC, and OPEX to see per-order profitability.</div>', unsafe_allow_html=True)
-
-    col_sim1, col_sim2, col_sim3 = st.columns(3)
-    with col_sim1:
-        aov = st.slider("Average Order Value (₹)", 50, 1000, 250)
-    with col_sim2:
-        cac = st.slider("Customer Acquisition Cost (₹)", 0, 500, 100)
-    with col_sim3:
-        opex = st.slider("OPEX per order (₹)", 0, 200, 30)
-
-    new_gross_margin = aov * 0.25
-    new_profit = new_gross_margin - cac - opex
-
-    c1, c2 = st.columns(2)
-    with c1:
-        st.metric("Gross Margin per Order", f"₹{new_gross_margin:.2f}")
-    with c2:
-        st.metric("Profit per Order", f"₹{new_profit:.2f}")
+            st.markdown('</div>', unsafe_allow_html=True)
 
-    st.markdown('</div>', unsafe_allow_html=True)
+        scenario_simulator()
 
 # ----------------------------
 # Auto Insights (Under Tabs)
 # ----------------------------
-st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
-st.markdown('<div class="section-title">Auto Insights</div>', unsafe_allow_html=True)
-st.markdown('<div class="section-caption">Quick read on whether this business is healthy or burning cash.</div>', unsafe_allow_html=True)
-
-insights = []
-
-avg_cac = df["marketing_cost"].mean()
-if avg_cac > 120:
-    insights.append(f"🔴 Average CAC is high at ₹{avg_cac:.2f}. Paid channels need tightening.")
-else:
-    insights.append(f"🟢 CAC is healthy at ₹{avg_cac:.2f} for this mix.")
-
-negative_orders = (df["profit_per_order"] < 0).mean() * 100
-if negative_orders > 25:
-    insights.append(f"🔴 {negative_orders:.1f}% of orders are unprofitable. Either pricing, fees, or OPEX is off.")
-else:
-    insights.append(f"🟢 Only {negative_orders:.1f}% of orders lose money. Unit economics are reasonably under control.")
-
-city_margin = df.groupby("city")["gross_margin"].mean().idxmax()
-insights.append(f"🏙️ {city_margin} is your strongest margin city. Consider concentrating marketing there.")
-
-promo_margin = df[df["promo_used"] == True]["gross_margin"].mean()
-nonpromo_margin = df[df["promo_used"] == False]["gross_margin"].mean()
-if promo_margin < nonpromo_margin * 0.8:
-    insights.append("🔴 Promo-driven orders are dragging margins hard. Discounts are too aggressive.")
-else:
-    insights.append("🟢 Promo impact on gross margin looks acceptable at current levels.")
+with profile.section("Auto Insights", rows=0):
+    st.markdown('<div class="section-panel fade-in">', unsafe_allow_html=True)
+    st.markdown('<div class="section-title">Auto Insights</div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-caption">Quick read on whether this business is healthy or burning cash.</div>', unsafe_allow_html=True)
 
-for tip in insights:
-    st.write(tip)
+    for tip in metrics.auto_insights(kpi):
+        st.write(tip)
 
-st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
  # ===================== DATA DICTIONARY (Standalone Section) =====================
-st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-st.markdown('<div class="section-title">Data Dictionary (Standalone)</div>', unsafe_allow_html=True)
-st.markdown('<div class="section-caption">All dataset fields with meanings and example values.</div>', unsafe_allow_html=True)
+with profile.section("Data Dictionary", rows=1):
+    st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+    st.markdown('<div class="section-title">Data Dictionary (Standalone)</div>', unsafe_allow_html=True)
+    st.markdown('<div class="section-caption">All dataset fields with meanings and example values.</div>', unsafe_allow_html=True)
 
-dict_df_standalone = pd.DataFrame({
-    "Column": df.columns,
-    "Meaning": ["_" for _ in df.columns],
-    "Example": [df[col].iloc[0] for col in df.columns]
-})
+    dict_df_standalone = pd.DataFrame({
+        "Column": sample_rows.columns,
+        "Meaning": ["_" for _ in sample_rows.columns],
+        "Example": [str(sample_rows[col].iloc[0]) for col in sample_rows.columns]
+    })
 
-st.dataframe(dict_df_standalone)
+    st.dataframe(dict_df_standalone)
 
-st.markdown('</div>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # ------------------------------------------------------------
 # NEW TAB: Advanced KPIs
 # ------------------------------------------------------------
 if enable_advanced:
-    adv_tab1, adv_tab2, adv_tab4, adv_tab5, adv_tab6 = st.tabs([
+    adv_tab1, adv_tab2, adv_tab4, adv_tab5, adv_tab6 = lazy_tabs([
         "Pro KPIs", "Cohorts", "What-If Lab 2.0", "User Segments", "Data Dictionary"
-    ])
+    ], key="advanced_tab")
 
 
 if enable_advanced:
     # ===================== PRO KPIs SECTION =====================
-    with adv_tab1:
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Advanced KPIs</div>', unsafe_allow_html=True)
-        st.markdown('<div class="section-caption">Enterprise-level metrics layered on top of your existing KPIs.</div>', unsafe_allow_html=True)
-
-        cac = df["marketing_cost"].mean()
-
-        if user_col is not None:
-            repeat_rate = df[user_col].value_counts().mean()
-            ltv_simple = df["revenue"].mean() * repeat_rate
-            mau = df[user_col].nunique()
-            arpu = df["revenue"].sum() / max(mau, 1)
-        else:
-            repeat_rate = 0
-            ltv_simple = df["revenue"].mean()
-            mau = df["date_only"].nunique()
-            arpu = df["revenue"].mean()
-
-        ltv_cac_ratio = ltv_simple / cac if cac > 0 else 0
-
-        dau = df["date_only"].nunique()
-        stickiness = dau / mau if mau > 0 else 0
-
-        st.write("**CAC:**", round(cac, 2))
-        st.write("**LTV:**", round(ltv_simple, 2))
-        st.write("**LTV/CAC Ratio:**", round(ltv_cac_ratio, 2))
-        st.write("**Repeat Purchase Rate:**", round(repeat_rate, 2))
-        st.write("**DAU:**", dau)
-        st.write("**MAU:**", mau)
-        st.write("**Stickiness Ratio:**", round(stickiness, 3))
-        st.write("**ARPU:**", round(arpu, 2))
+    if is_open(adv_tab1):
+        with adv_tab1, profile.section("Pro KPIs", rows=len(snap.cube)):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Advanced KPIs</div>', unsafe_allow_html=True)
+            st.markdown('<div class="section-caption">Enterprise-level metrics layered on top of your existing KPIs.</div>', unsafe_allow_html=True)
+
+            @st.fragment
+            @profiled("Pro KPIs", rows=len(snap.cube))
+            def pro_kpis_panel():
+                # Date range, cities and sources come from the sidebar filters (snap)
+                exact = st.toggle("Exact user counts (scans every order)", value=False)
+                pro = memoized(metrics.pro_kpis, snap, None, None, (), (), exact)
+
+                # ~95% bound on the sketch-based user counts
+                err = 2 * pro.distinct_error
+                approx = lambda v, fmt: f"{v:{fmt}} ± {err * v:{fmt}}" if err else f"{v:{fmt}}"
+
+                st.write("**CAC:**", round(pro.cac, 2))
+                st.write("**LTV:**", approx(pro.ltv, ",.2f"))
+                st.write("**LTV/CAC Ratio:**", approx(pro.ltv_cac_ratio, ".2f"))
+                st.write("**Repeat Purchase Rate:**", approx(pro.repeat_rate, ".2f"))
+                st.write("**Users:**", approx(pro.users, ",.0f"))
+                window = f"last {metrics.MAU_WINDOW_DAYS} days"
+                st.write(f"**DAU (mean daily users, {window}):**", approx(pro.dau, ",.0f"))
+                st.write(f"**MAU (distinct users, {window}):**", approx(pro.mau, ",.0f"))
+                st.write("**Stickiness Ratio:**", approx(pro.stickiness, ".3f"))
+                st.write("**ARPU:**", approx(pro.arpu, ",.2f"))
+                counts = (f"User counts are HyperLogLog estimates (±{err:.1%} at ~95% confidence)" if err
+                          else "Exact user counts")
+                st.caption(f"{counts}, over the sidebar filters. DAU and MAU cover the {window} of the "
+                           "filtered range; stickiness is DAU / MAU.")
+
+            pro_kpis_panel()
 
-        st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
 
     # ===================== COHORTS TAB =====================
-    with adv_tab2:
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Cohort Retention Analysis</div>', unsafe_allow_html=True)
-
-        df["order_date"] = pd.to_datetime(df["date"])
-
-        if user_col is not None:
-            df["cohort_week"] = df.groupby(user_col)["order_date"].transform("min").dt.isocalendar().week
-            cohort = df.pivot_table(
-                index="cohort_week",
-                columns=df["order_date"].dt.isocalendar().week,
-                values=user_col,
-                aggfunc="nunique"
-            ).fillna(0)
-        else:
-            df["cohort_week"] = df["order_date"].dt.isocalendar().week
-            cohort = df.pivot_table(
-                index="cohort_week",
-                columns=df["order_date"].dt.isocalendar().week,
-                values="revenue",
-                aggfunc="count"
-            ).fillna(0)
-
-        st.dataframe(cohort)
-        st.line_chart(cohort.T)
+    if is_open(adv_tab2):
+        with adv_tab2, profile.section("Cohorts", rows=n_rows):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Cohort Retention Analysis</div>', unsafe_allow_html=True)
+            st.markdown('<div class="section-caption">Users (or revenue) still active N periods after their first order, per first-order cohort.</div>', unsafe_allow_html=True)
 
-        st.markdown('</div>', unsafe_allow_html=True)
+            @st.fragment
+            @profiled("Cohorts", rows=n_rows)
+            def cohort_retention():
+                colG, colV = st.columns(2)
+                with colG:
+                    grain = st.radio("Cohort grain", ["week", "month"], horizontal=True, format_func=str.title)
+                with colV:
+                    value = st.radio("Retention of", ["users", "revenue"], horizontal=True, format_func=str.title)
+
+                cohort = memoized(metrics.cohort_matrix, snap, grain, value)
+                date_labels = lambda d: d.strftime("%Y-%m-%d")
+
+                st.dataframe(cohort.matrix.rename(index=date_labels))
+                st.line_chart(cohort.retention.rename(index=date_labels).T)
+
+            cohort_retention()
+
+            st.markdown('</div>', unsafe_allow_html=True)
 
     # ===================== WHAT IF LAB =====================
-    with adv_tab4:
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">What-If Simulator</div>', unsafe_allow_html=True)
+    if is_open(adv_tab4):
+        with adv_tab4, profile.section("What-If Lab 2.0", rows=len(snap.cube)):
+            @st.fragment
+            @profiled("What-If Lab 2.0", rows=len(snap.cube))
+            def what_if_lab():
+                st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+                st.markdown('<div class="section-title">What-If Simulator</div>', unsafe_allow_html=True)
 
-        colA, colB, colC = st.columns(3)
-        with colA:
-            new_marketing = st.slider("Marketing Spend Increase (%)", 0, 300, 20)
-        with colB:
-            churn_reduction = st.slider("Churn Reduction (%)", 0, 50, 10)
-        with colC:
-            conv_rate_increase = st.slider("Conversion Rate Increase (%)", 0, 100, 10)
+                colA, colB, colC = st.columns(3)
+                with colA:
+                    new_marketing = st.slider("Marketing Spend Increase (%)", 0, 300, 20)
+                with colB:
+                    churn_reduction = st.slider("Churn Reduction (%)", 0, 50, 10)
+                with colC:
+                    conv_rate_increase = st.slider("Conversion Rate Increase (%)", 0, 100, 10)
 
-        baseline_orders = len(df)
-        baseline_aov = df["revenue"].mean()
-        baseline_gm_rate = 0.25
+                projected = metrics.what_if(snap, conv_rate_increase)
 
-        new_orders = baseline_orders * (1 + conv_rate_increase/100)
-        new_revenue = baseline_aov * new_orders
-        new_gross_margin = new_revenue * baseline_gm_rate
+                st.write("Projected Revenue:", round(projected.revenue, 2))
+                st.write("Projected Gross Margin:", round(projected.gross_margin, 2))
 
-        st.write("Projected Revenue:", round(new_revenue, 2))
-        st.write("Projected Gross Margin:", round(new_gross_margin, 2))
+                st.markdown('</div>', unsafe_allow_html=True)
 
-        st.markdown('</div>', unsafe_allow_html=True)
+            what_if_lab()
 
     # ===================== USER SEGMENTS TAB =====================
-    with adv_tab5:
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">User Segments</div>', unsafe_allow_html=True)
+    if is_open(adv_tab5):
+        with adv_tab5, profile.section("User Segments", rows=n_rows):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">User Segments</div>', unsafe_allow_html=True)
 
-        if user_col is not None:
-            user_freq = df.groupby(user_col).size()
-            st.write("One-time users:", int((user_freq == 1).sum()))
-            st.write("Repeat users:", int((user_freq >= 2).sum()))
+            if user_col is not None:
+                segments = memoized(metrics.user_segments, snap)
+                st.write("One-time users:", segments.one_time)
+                st.write("Repeat users:", segments.repeat)
 
-        st.markdown('</div>', unsafe_allow_html=True)
+            st.markdown('</div>', unsafe_allow_html=True)
 
     # ===================== DATA DICTIONARY TAB =====================
-    with adv_tab6:
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Data Dictionary</div>', unsafe_allow_html=True)
+    if is_open(adv_tab6):
+        with adv_tab6, profile.section("Data Dictionary (Advanced)", rows=1):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Data Dictionary</div>', unsafe_allow_html=True)
 
-        dict_df = pd.DataFrame({
-            "Column": df.columns,
-            "Example": [df[col].iloc[0] for col in df.columns]
-        })
+            dict_df = pd.DataFrame({
+                "Column": sample_rows.columns,
+                "Example": [str(sample_rows[col].iloc[0]) for col in sample_rows.columns]
+            })
 
-        st.dataframe(dict_df)
-        st.markdown('</div>', unsafe_allow_html=True)
+            st.dataframe(dict_df)
+            st.markdown('</div>', unsafe_allow_html=True)
 
 
 if enable_ml:
     # ===================== ML LAB TAB =====================
-    ml_tab, = st.tabs(["ML Lab"])
-
-    with ml_tab:
-        import numpy as np
-        from sklearn.model_selection import train_test_split
-        from sklearn.linear_model import LogisticRegression
-        from sklearn.ensemble import RandomForestRegressor, IsolationForest
-        from sklearn.metrics import (
-            accuracy_score, precision_score, recall_score,
-            mean_absolute_error, mean_squared_error
-        )
-
-        # Build user-level dataset
-        if user_col is None:
-            df["_ml_user"] = np.arange(len(df))
-            ml_user = "_ml_user"
-        else:
-            ml_user = user_col
-
-        df["date_dt"] = pd.to_datetime(df["date"])
-        cust = df.groupby(ml_user).agg(
-            total_orders=("revenue","count"),
-            total_revenue=("revenue","sum"),
-            avg_basket=("revenue","mean"),
-            first_order=("date_dt","min"),
-            last_order=("date_dt","max"),
-            promo_rate=("promo_used","mean")
-        ).reset_index()
-
-        cust["days_since_first"] = (cust["last_order"] - cust["first_order"]).dt.days
-        cust["days_since_last"] = (df["date_dt"].max() - cust["last_order"]).dt.days
-
-        # --------------------------------------------------------
-        # 1️⃣ CHURN MODEL — PREMIUM CLEAN VERSION
-        # --------------------------------------------------------
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Churn Prediction</div>', unsafe_allow_html=True)
-
-        # -------- FIXED: Robust dynamic churn logic --------
-
-        # -------- RFM SCORING (ADDED CLEAN PREMIUM SECTION) --------
-        # Recency: days since last order
-        cust["R_score"] = pd.qcut(cust["days_since_last"], 4, labels=[4,3,2,1]).astype(int)
-
-        # Frequency: total orders
-        cust["F_score"] = pd.qcut(cust["total_orders"].rank(method="first"), 4, labels=[1,2,3,4]).astype(int)
-
-        # Monetary: total revenue
-        cust["M_score"] = pd.qcut(cust["total_revenue"].rank(method="first"), 4, labels=[1,2,3,4]).astype(int)
-
-        # Weighted RFM composite
-        cust["RFM"] = (cust["R_score"]*0.5) + (cust["F_score"]*0.25) + (cust["M_score"]*0.25)
-
-        # RFM-based churn label before adaptive logic
-        cust["rfm_churn"] = (cust["RFM"] <= cust["RFM"].median()).astype(int)
-
-        # -------- HYBRID CHURN MODEL (RFM + Behavioral) --------
-        CHURN_DAYS = max(7, int(cust["days_since_last"].quantile(0.70)))
-
-        cust["behavior_churn"] = (
-            (cust["days_since_last"] >= CHURN_DAYS) &
-            (cust["total_orders"] <= cust["total_orders"].median())
-        ).astype(int)
-
-        # Combine RFM churn + behavioral churn
-        cust["churned"] = (
-            (cust["rfm_churn"] + cust["behavior_churn"]) >= 1
-        ).astype(int)
-
-        # Safety fallback
-        if cust["churned"].nunique() < 2:
-            cust["churned"] = cust["behavior_churn"]
-
-        # Safety check
-        if cust["churned"].nunique() < 2:
-            st.warning("⚠️ Not enough churn variation in the dataset to train a meaningful model.")
-        else:
-            churn_features = ["total_orders","total_revenue","avg_basket","promo_rate","days_since_first","days_since_last"]
-            X = cust[churn_features].fillna(0)
-            y = cust["churned"]
-
-            Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=42)
-            churn_model = LogisticRegression(max_iter=400)
-            churn_model.fit(Xtr, ytr)
-
-            pred = churn_model.predict(Xte)
-            st.write(f"Accuracy: {accuracy_score(yte,pred):.3f} | Precision: {precision_score(yte,pred):.3f} | Recall: {recall_score(yte,pred):.3f}")
-
-            cust["churn_probability"] = churn_model.predict_proba(X)[:,1]
-            top = cust.sort_values("churn_probability", ascending=False).head(5)[[ml_user,"churn_probability","total_orders","total_revenue"]]
-            st.markdown("### 🔥 Highest-Risk Users (Hybrid RFM + Behavior)")
-            top_display = top.copy()
-            top_display["churn_probability"] = top_display["churn_probability"].round(2)
-            st.dataframe(top_display)
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        # --------------------------------------------------------
-        # 2️⃣ LTV MODEL — PREMIUM CLEAN VERSION
-        # --------------------------------------------------------
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">LTV Prediction</div>', unsafe_allow_html=True)
-
-        cust["ltv_actual"] = cust["total_revenue"]
-        ltv_features = ["total_orders","avg_basket","promo_rate","days_since_first"]
-
-        Xl = cust[ltv_features].fillna(0)
-        yl = cust["ltv_actual"]
-
-        if len(cust) > 5:
-            Xtr, Xte, ytr, yte = train_test_split(Xl, yl, test_size=0.2, random_state=42)
-            model = RandomForestRegressor(n_estimators=80, random_state=42)
-            model.fit(Xtr, ytr)
-            pred = model.predict(Xte)
-
-            st.write(f"MAE: {mean_absolute_error(yte,pred):.2f} | RMSE: {(mean_squared_error(yte,pred)**0.5):.2f}")
-
-            cust["ltv_pred"] = model.predict(Xl)
-            st.write("Top Predicted LTV (5)")
-            st.dataframe(cust.sort_values("ltv_pred", ascending=False).head(5)[[ml_user,"ltv_actual","ltv_pred"]])
-        else:
-            st.info("Not enough customers for LTV modelling.")
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        # --------------------------------------------------------
-        # 3️⃣ REVENUE FORECAST — PROPHET CORPORATE-GRADE VERSION
-        # --------------------------------------------------------
-
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Revenue Forecast</div>', unsafe_allow_html=True)
-        st.markdown('<div class="section-caption">Prophet-based corporate forecasting with trend + seasonality.</div>', unsafe_allow_html=True)
-
-        from prophet import Prophet
-
-        # Prepare data
-        dailyRevenue = df.groupby(df["date_dt"].dt.date)["revenue"].sum().reset_index()
-        dailyRevenue.columns = ["ds", "y"]
-        dailyRevenue["ds"] = pd.to_datetime(dailyRevenue["ds"])
-
-        # Forecast horizon
-        forecastHorizon = st.slider("Forecast Days", 7, 60, 21)
-
-        # Build Prophet model
-        prophetModel = Prophet(
-            yearly_seasonality=False,
-            weekly_seasonality=True,
-            daily_seasonality=False,
-            changepoint_prior_scale=0.3,
-            seasonality_prior_scale=10
-        )
-
-        prophetModel.fit(dailyRevenue)
-
-        # Future DF
-        futureDF = prophetModel.make_future_dataframe(periods=forecastHorizon)
-
-        # Forecast
-        forecastDF = prophetModel.predict(futureDF)
-
-        # Display chart (Streamlit native)
-        forecastPlot = forecastDF.set_index("ds")[["yhat"]]
-        historyPlot = dailyRevenue.set_index("ds")[["y"]]
-
-        mergedForecast = historyPlot.join(forecastPlot, how="outer")
-
-        st.line_chart(mergedForecast)
-
-        st.markdown('</div>', unsafe_allow_html=True)
-
-        # --------------------------------------------------------
-        # 4️⃣ ANOMALY DETECTION — CORPORATE-GRADE ENGINE
-        # --------------------------------------------------------
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Anomaly Detection</div>', unsafe_allow_html=True)
-        st.markdown('<div class="section-caption">Multiple detectors (IsolationForest, Z-score, MAD and Prophet interval). Flags are combined for robust alerts.</div>', unsafe_allow_html=True)
-
-        # ensure profit per order exists
-        df["profit_per_order"] = df.get("profit_per_order", df.get("gross_margin", 0) - df.get("marketing_cost", 0) - df.get("opex_allocated", 0))
-
-        # build daily operations frame
-        daily_ops = df.groupby(df["date_dt"].dt.date).agg(
-            revenue=("revenue", "sum"),
-            profit=("profit_per_order", "mean"),
-            cac=("marketing_cost", "mean")
-        ).rename_axis("date_dt").reset_index()
-
-        # Defensive: require at least 10 days for meaningful stats
-        if len(daily_ops) < 10:
-            st.info("Not enough daily history for corporate-grade anomaly detection (need >= 10 days).")
+    # One tab per panel so only the open one trains / fits
+    ml_churn_tab, ml_ltv_tab, ml_forecast_tab, ml_anomaly_tab, ml_summary_tab = lazy_tabs([
+        "Churn", "LTV", "Revenue Forecast", "Anomaly Detection", "Executive Summary"
+    ], key="ml_tab")
+
+    # --------------------------------------------------------
+    # 1️⃣ CHURN MODEL — PREMIUM CLEAN VERSION
+    # --------------------------------------------------------
+    if is_open(ml_churn_tab):
+        with ml_churn_tab, profile.section("ML: Churn", rows=n_rows):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Churn Prediction</div>', unsafe_allow_html=True)
+
+            job = background("churn", snap, ml.train_churn, memoized(metrics.customer_features, snap),
+                             snap.user_col, snap.fingerprint)
+            churn = job.result() if job is not None else None
+
+            # Safety check (no job yet: the first fit is still running)
+            if job is not None and churn is None:
+                st.warning("⚠️ Not enough churn variation in the dataset to train a meaningful model.")
+            elif churn is not None:
+                st.write(f"Accuracy: {churn.accuracy:.3f} | Precision: {churn.precision:.3f} | Recall: {churn.recall:.3f}")
+
+                st.markdown("### 🔥 Highest-Risk Users (Hybrid RFM + Behavior)")
+                top_display = churn.top_risk.copy()
+                top_display["churn_probability"] = top_display["churn_probability"].round(2)
+                st.dataframe(top_display)
             st.markdown('</div>', unsafe_allow_html=True)
-        else:
-            import numpy as _np
-            from sklearn.ensemble import IsolationForest as _IF
-            from prophet import Prophet as _Prophet
-
-            # ---------------- Z-SCORE detector (per metric)
-            def zscore_flag(series, thresh=3.0):
-                mu = series.mean()
-                sigma = series.std(ddof=0)
-                if sigma == 0 or _np.isnan(sigma):
-                    return _np.zeros(len(series), dtype=bool)
-                z = (series - mu) / sigma
-                return _np.abs(z) > thresh
-
-            # ---------------- MAD (robust) detector
-            def mad_flag(series, thresh=3.5):
-                med = series.median()
-                dev = _np.abs(series - med)
-                mad = _np.median(dev)
-                if mad == 0 or _np.isnan(mad):
-                    return _np.zeros(len(series), dtype=bool)
-                mod_z = 0.6745 * (series - med) / mad
-                return _np.abs(mod_z) > thresh
-
-            # ---------------- Isolation Forest
-            iso = _IF(contamination=0.06, random_state=42)
-            iso_input = daily_ops[["revenue", "profit", "cac"]].fillna(0)
-            try:
-                iso_pred = iso.fit_predict(iso_input)
-                daily_ops["flagIso"] = iso_pred == -1
-            except Exception:
-                daily_ops["flagIso"] = False
-
-            # ---------------- Z-score & MAD flags
-            daily_ops["flagZRevenue"] = zscore_flag(daily_ops["revenue"], thresh=3.0)
-            daily_ops["flagZProfit"] = zscore_flag(daily_ops["profit"], thresh=3.0)
-            daily_ops["flagZCac"] = zscore_flag(daily_ops["cac"], thresh=3.0)
-
-            daily_ops["flagMadRevenue"] = mad_flag(daily_ops["revenue"], thresh=3.5)
-            daily_ops["flagMadProfit"] = mad_flag(daily_ops["profit"], thresh=3.5)
-            daily_ops["flagMadCac"] = mad_flag(daily_ops["cac"], thresh=3.5)
-
-            # ---------------- Prophet-based interval breach (revenue only)
-            try:
-                prophet_df = daily_ops[["date_dt", "revenue"]].rename(columns={"date_dt":"ds","revenue":"y"})
-                prophet_df["ds"] = pd.to_datetime(prophet_df["ds"])  # ensure datetime
-                m = _Prophet(yearly_seasonality=False, weekly_seasonality=True, daily_seasonality=False)
-                m.fit(prophet_df)
-                future = m.make_future_dataframe(periods=0)
-                fc = m.predict(future)
-                fc = fc.set_index("ds")[ ["yhat","yhat_lower","yhat_upper"] ].rename_axis("date_dt").reset_index()
-                # merge on date
-                merged = daily_ops.merge(fc, on="date_dt", how="left")
-                merged["flagProphet"] = (merged["revenue"] < merged["yhat_lower"]) | (merged["revenue"] > merged["yhat_upper"])
-                daily_ops = merged
-            except Exception:
-                # if prophet fails, mark no prophet flags but continue
-                daily_ops["flagProphet"] = False
-
-            # ---------------- Combined alert
-            flag_cols = [c for c in daily_ops.columns if str(c).startswith("flag")]
-
-            daily_ops["any_flag"] = daily_ops[flag_cols].any(axis=1)
-
-            flagged = daily_ops[daily_ops["any_flag"]].copy()
-
-            st.write(f"Anomalies: {len(flagged)}")
-            if len(flagged) > 0:
-                # show the most important columns + which detectors fired
-                display_cols = ["date_dt","revenue","profit","cac"] + flag_cols
-                st.dataframe(flagged[display_cols].sort_values("date_dt", ascending=False).reset_index(drop=True))
-
-            # Visuals: scaled charts and flagged overlay
-            # plot revenue separately (dominant scale) and profit/cac on separate small chart
-            st.markdown("**Revenue (with Prophet yhat if available)**")
-            try:
-                plot_df = daily_ops.set_index("date_dt")[ ["revenue"] ].join(daily_ops.set_index("date_dt")[ ["yhat"] ], how="left")
-                st.line_chart(plot_df)
-            except Exception:
-                st.line_chart(daily_ops.set_index("date_dt")[ ["revenue"] ])
-
-            st.markdown("**Profit & CAC (separate scale)**")
-            st.line_chart(daily_ops.set_index("date_dt")[ ["profit","cac"] ])
 
-            st.markdown("**Detector summary**")
-            summary = {col: int(daily_ops[col].sum()) for col in flag_cols}
-            st.table(pd.DataFrame(list(summary.items()), columns=["Detector","Count"]))
+    # --------------------------------------------------------
+    # 2️⃣ LTV MODEL — PREMIUM CLEAN VERSION
+    # --------------------------------------------------------
+    if is_open(ml_ltv_tab):
+        with ml_ltv_tab, profile.section("ML: LTV", rows=n_rows):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">LTV Prediction</div>', unsafe_allow_html=True)
+
+            job = background("ltv", snap, ml.train_ltv, memoized(metrics.customer_features, snap),
+                             snap.user_col, snap.fingerprint)
+            ltv = job.result() if job is not None else None
+
+            if ltv is not None:
+                st.write(f"MAE: {ltv.mae:.2f} | RMSE: {ltv.rmse:.2f}")
+                st.write("Top Predicted LTV (5)")
+                st.dataframe(ltv.top_ltv)
+            elif job is not None:
+                st.info("Not enough customers for LTV modelling.")
+            st.markdown('</div>', unsafe_allow_html=True)
 
-            # provide suggested next steps
-            st.markdown("**Suggested next steps (automated)**")
-            st.write("• Investigate days where `flagProphet` is true — likely structural change or campaign.")
-            st.write("• Investigate `flagIso` days — multivariate oddity (ops/marketing combined).")
-            st.write("• Use `flagMad*` for robust outlier filtering when data is heavy-tailed.")
+    # --------------------------------------------------------
+    # 3️⃣ REVENUE FORECAST — HOLT-WINTERS (FAST MODE) OR PROPHET
+    # --------------------------------------------------------
+    if is_open(ml_forecast_tab):
+        with ml_forecast_tab, profile.section("ML: Revenue Forecast", rows=len(snap.cube)):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Revenue Forecast</div>', unsafe_allow_html=True)
+            engine_label = "Holt-Winters (NumPy)" if forecast_engine() == "holt_winters" else "Prophet"
+            st.markdown(f'<div class="section-caption">{engine_label} forecasting with trend + weekly seasonality.</div>', unsafe_allow_html=True)
+
+            # Fragment: changing the series or horizon reruns only this chart
+            @st.fragment
+            @profiled("ML: Revenue Forecast", rows=len(snap.cube))
+            def revenue_forecast_chart(fitted, segments):
+                labels = [multiseries.TOTAL_LABEL]
+                if segments is not None:
+                    labels += [l for l in segments.series["label"] if l != multiseries.TOTAL_LABEL]
+                series = st.selectbox("Series", labels, help="City, marketing source or city × source")
+                # Forecast horizon
+                forecastHorizon = st.slider("Forecast Days", 7, 60, 21)
+
+                # Any horizon is served from one fit per series (bizecon.forecasting / multiseries)
+                if series == multiseries.TOTAL_LABEL:
+                    st.line_chart(fitted.table(forecastHorizon))
+                else:
+                    st.line_chart(segments.get(series, forecastHorizon)[["y", "yhat"]])
+
+            fitted, _ = revenue_fit(snap)
+            segments = segment_fit(snap)
+            if fitted is not None:
+                revenue_forecast_chart(fitted, segments)
+            if segments is not None:
+                st.caption(f"{len(segments.series)} series forecast in {segments.seconds:.2f}s "
+                           f"· {segments.series_per_second:,.0f} series/s ({segments.engine})")
 
             st.markdown('</div>', unsafe_allow_html=True)
 
-        # --------------------------------------------------------
-        # 5️⃣ EXECUTIVE SUMMARY — PREMIUM CLEAN VERSION
-        # --------------------------------------------------------
-        st.markdown('<div class="section-panel">', unsafe_allow_html=True)
-        st.markdown('<div class="section-title">Executive Summary</div>', unsafe_allow_html=True)
-
-        st.markdown("""
-        - Churn model highlights the highest-risk users.
-        - LTV model identifies top revenue drivers.
-        - Revenue forecast shows stable short-term outlook.
-        - Anomaly detection flags operational / marketing spikes.
-        """)
-        st.markdown('</div>', unsafe_allow_html=True)
+    # --------------------------------------------------------
+    # 4️⃣ ANOMALY DETECTION — CORPORATE-GRADE ENGINE
+    # --------------------------------------------------------
+    if is_open(ml_anomaly_tab):
+        with ml_anomaly_tab, profile.section("ML: Anomaly Detection", rows=n_rows):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Anomaly Detection</div>', unsafe_allow_html=True)
+            st.markdown('<div class="section-caption">Multiple detectors (IsolationForest, rolling / EWMA Z-score, rolling MAD and forecast interval). Flags are combined for robust alerts.</div>', unsafe_allow_html=True)
+
+            # Flags need the in-sample bands of the revenue forecast's fit
+            daily_ops = memoized(ml.daily_operations, snap)
+            job = None
+            if len(daily_ops) >= 10:
+                name = f"anomalies-{forecast_engine()}"
+                try:
+                    fitted, pending = revenue_fit(snap)
+                except Exception:
+                    # Failed fit (e.g. Prophet not installed): no interval flags
+                    fitted, pending = None, False
+                if pending:
+                    job = jobs.latest(name, job_scope())
+                else:
+                    bands = fitted.in_sample() if fitted is not None else None
+                    job = background(name, snap, ml.flag_anomalies, daily_ops, bands)
+            anomalies = job.result() if job is not None else None
+
+            # Defensive: require at least 10 days for meaningful stats
+            if len(daily_ops) < 10:
+                st.info("Not enough daily history for corporate-grade anomaly detection (need >= 10 days).")
+                st.markdown('</div>', unsafe_allow_html=True)
+            elif anomalies is None:
+                st.markdown('</div>', unsafe_allow_html=True)
+            else:
+                daily_ops, flag_cols, flagged = anomalies.daily_ops, anomalies.flag_cols, anomalies.flagged
+
+                st.write(f"Anomalies: {len(flagged)}")
+                if len(flagged) > 0:
+                    # show the most important columns + which detectors fired
+                    display_cols = ["date_dt","revenue","profit","cac"] + flag_cols
+                    st.dataframe(flagged[display_cols].sort_values("date_dt", ascending=False).reset_index(drop=True))
+
+                # Visuals: scaled charts and flagged overlay
+                # plot revenue separately (dominant scale) and profit/cac on separate small chart
+                st.markdown("**Revenue (with forecast yhat if available)**")
+                try:
+                    plot_df = daily_ops.set_index("date_dt")[ ["revenue"] ].join(daily_ops.set_index("date_dt")[ ["yhat"] ], how="left")
+                    st.line_chart(plot_df)
+                except Exception:
+                    st.line_chart(daily_ops.set_index("date_dt")[ ["revenue"] ])
+
+                st.markdown("**Profit & CAC (separate scale)**")
+                st.line_chart(daily_ops.set_index("date_dt")[ ["profit","cac"] ])
+
+                st.markdown("**Detector summary**")
+                st.table(anomalies.summary)
+
+                # Same rolling detectors over every city / source / city × source series
+                st.markdown("**Segment anomalies (city × marketing source)**")
+                robust = st.checkbox("Add rolling MAD (robust to heavy tails, about 3x slower)", value=False)
+                detectors = DETECTORS if robust else DEFAULT_DETECTORS
+                segment_flags = memoized(ml.segment_anomalies, snap, None, detectors)
+                if segment_flags.empty:
+                    st.write("No segment anomalies.")
+                else:
+                    st.write(f"{len(segment_flags)} flags across {segment_flags['series'].nunique()} series")
+                    st.dataframe(segment_flags.sort_values("ds", ascending=False).reset_index(drop=True))
+
+                # Per-order IsolationForest (bizecon.outliers): opt-in, it reads every
+                # order, so it is a background job that opens the orders itself
+                st.markdown("**Order-level anomalies (IsolationForest)**")
+                if st.toggle("Score every order (scans every order)", value=False):
+                    job = background("order-outliers", snap, ml.scan_transaction_anomalies, CSV_PATH,
+                                     base.fingerprint, filters if filters.active else None,
+                                     snap.cube, snap.fingerprint)
+                    order_scores = job.result() if job is not None else None
+                    if job is not None and order_scores is None:
+                        st.write("No orders to score.")
+                    elif order_scores is not None:
+                        st.caption(f"{order_scores.orders:,} orders scored in {order_scores.seconds:.1f}s "
+                                   f"· forest fitted on a {order_scores.sample_rows:,}-order stratified sample "
+                                   f"· score column saved to {order_scores.path}")
+                        st.dataframe(order_scores.top)
+
+                # provide suggested next steps
+                st.markdown("**Suggested next steps (automated)**")
+                st.write("• Investigate days where `flagForecast` is true — likely structural change or campaign.")
+                st.write("• Investigate `flagIso` days — multivariate oddity (ops/marketing combined).")
+                st.write("• Use `flagMad*` for robust outlier filtering when data is heavy-tailed.")
+
+                st.markdown('</div>', unsafe_allow_html=True)
+
+    # --------------------------------------------------------
+    # 5️⃣ EXECUTIVE SUMMARY — PREMIUM CLEAN VERSION
+    # --------------------------------------------------------
+    if is_open(ml_summary_tab):
+        with ml_summary_tab, profile.section("ML: Executive Summary", rows=0):
+            st.markdown('<div class="section-panel">', unsafe_allow_html=True)
+            st.markdown('<div class="section-title">Executive Summary</div>', unsafe_allow_html=True)
+
+            st.markdown("""
+            - Churn model highlights the highest-risk users.
+            - LTV model identifies top revenue drivers.
+            - Revenue forecast shows stable short-term outlook.
+            - Anomaly detection flags operational / marketing spikes.
+            """)
+            st.markdown('</div>', unsafe_allow_html=True)
 
-st.markdown("<br><br><center><span style='font-size:12px;color:#777;'>Built by <b>Mitaksh</b> · Business Economics Dashboard</span></center>", unsafe_allow_html=True)
\ No newline at end of file
+# ----------------------------
+# Render profile (waterfall of this rerun's sections)
+# ----------------------------
+if profile.enabled:
+    total_ms = max(profile.total_ms(), 1e-6)
+    rows_html = "".join(
+        f'<div class="prof-row">{sec["section"]} · {sec["wall_ms"]:.0f} ms · '
+        f'{sec["rows"] if sec["rows"] is not None else "–"} rows · {sec["cache"]} · '
+        f'{sec["peak_alloc_kb"] / 1024:.1f} MB'
+        f'<div class="prof-track"><div class="prof-bar {sec["cache"]}" '
+        f'style="left:{sec["start_ms"] / total_ms * 100:.1f}%;width:{sec["wall_ms"] / total_ms * 100:.1f}%"></div></div></div>'
+        for sec in profile.sections
+    )
+    with st.sidebar:
+        st.markdown("---")
+        st.markdown("### ⏱️ Render Profile")
+        st.caption(f"Rerun {profile.rerun_id} · {total_ms:.0f} ms after sidebar")
+        st.markdown(rows_html, unsafe_allow_html=True)
+    profile.finish()
+
+st.markdown("<br><br><center><span style='font-size:12px;color:#777;'>Built by <b>Mitaksh</b> · Business Economics Dashboard</span></center>", unsafe_allow_html=True)
@@ -0,0 +1,317 @@
+"""Benchmark every dashboard stage at fixed-seed dataset scales.
+
+    python benchmarks/run.py --scales 1m,10m,100m
+    python benchmarks/run.py --scales 1m --save-baseline
+    python benchmarks/run.py --scales 1m --baseline benchmarks/baseline.json --threshold 0.2
+
+Datasets are produced by scripts/generate_data.py (vectorized mode, fixed
+seed and start date) under benchmarks/data/<scale>/ and reused if present.
+Each scale runs in its own process so peak RSS is not polluted by the
+previous one. Results are written as JSON to benchmarks/results/; with
+--baseline, any stage whose wall time grew by more than --threshold (and
+by more than --min-seconds) is reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+GENERATOR = os.path.join(ROOT, "scripts", "generate_data.py")
+
+SCALES = {
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+    "100m": 100_000_000,
+}
+DAYS = 180
+SEED = 42
+START_DATE = "2025-01-01"
+
+
+# ----------------------------
+# Dataset generation
+# ----------------------------
+def dataset_path(scale):
+    return os.path.join(BENCH_DIR, "data", scale, "transactions.csv")
+
+
+def ensure_dataset(scale):
+    path = dataset_path(scale)
+    if os.path.exists(path):
+        return path
+
+    rows = SCALES[scale]
+    per_day = rows // DAYS
+    # ~10 orders per customer, like the default generator settings
+    subprocess.run([
+        sys.executable, GENERATOR, "--mode", "vectorized",
+        "--customers", str(max(1000, rows // 10)),
+        "--days", str(DAYS),
+        "--tx-min", str(int(per_day * 0.75)),
+        "--tx-max", str(int(per_day * 1.25)),
+        "--seed", str(SEED),
+        "--start-date", START_DATE,
+        "--out", path,
+    ], check=True)
+    return path
+
+
+# ----------------------------
+# Stage timing
+# ----------------------------
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class StageTimer:
+    """Wall time and peak RSS (sampled every few ms) of each named stage."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stages = {}
+
+    def run(self, name, fn, *args):
+        peak = [_rss_bytes()]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.interval):
+                peak[0] = max(peak[0], _rss_bytes())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+            status = "ok"
+        except ImportError as exc:
+            result, status = None, f"skipped: {exc}"
+        finally:
+            wall = time.perf_counter() - start
+            done.set()
+            sampler.join()
+            peak[0] = max(peak[0], _rss_bytes())
+
+        self.stages[name] = {
+            "wall_s": round(wall, 4),
+            "peak_rss_mb": round(peak[0] / 2**20, 1),
+            "status": status,
+        }
+        print(f"  {name:<24} {wall:9.3f}s  {peak[0] / 2**20:9.1f} MB  {status}", file=sys.stderr)
+        return result
+
+
+def run_scale(csv_path):
+    """Time every stage on one dataset; returns {stage: stats}."""
+    sys.path.insert(0, ROOT)
+    # Fresh model registry next to the dataset, like the cache below
+    model_dir = os.path.join(os.path.dirname(csv_path), ".models")
+    shutil.rmtree(model_dir, ignore_errors=True)
+    os.environ["BIZECON_MODEL_DIR"] = model_dir
+    import numpy as np
+    import pandas as pd
+
+    from bizecon import anomalies, metrics, ml, scenarios
+    from bizecon.cube import build_cube
+    from bizecon.dataset import Snapshot, default_user_col, prepare_frame
+    from bizecon.derived import DerivedColumns
+    from bizecon.features import build_customers
+    from bizecon.filters import Filters
+    from bizecon.quantiles import build_profit_sketch
+    from bizecon.sketches import build_sketches
+    from bizecon.store import build_cache, dataset_fingerprint, read_segment, scores_path, segment_paths
+
+    # Keep one-off import cost out of the ML stage timings
+    for mod in ("sklearn.ensemble", "sklearn.linear_model", "prophet"):
+        try:
+            __import__(mod)
+        except ImportError:
+            pass
+
+    cache_dir = os.path.join(os.path.dirname(csv_path), ".cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    timer = StageTimer()
+
+    meta = timer.run("csv_load", build_cache, csv_path, cache_dir)
+    frame = timer.run("cache_load", read_segment, segment_paths(meta, csv_path, cache_dir)[0])
+    frame = timer.run("preprocess", prepare_frame, frame)
+
+    cols = DerivedColumns(frame, dataset_fingerprint(csv_path), default_user_col(frame))
+    timer.run("derived_columns", lambda: [cols[c] for c in ("date_dt", "day", "year_week", "profit_per_order")])
+    cube = timer.run("rollup_cube", build_cube, frame, cols)
+    sketches = timer.run("user_sketches", build_sketches, frame, cols)
+    profit_sketch = timer.run("profit_sketch", build_profit_sketch, frame, cols)
+    customers = timer.run("customer_store", build_customers, frame, cols)
+    snap = Snapshot(frame, cols, cube, cols.fingerprint, sketches, profit_sketch, customers=customers)
+
+    timer.run("kpi_block", metrics.kpis, snap)
+    # One month of one city: cube sections plus locating the rows
+    mid = snap.cube["day"].min() + (snap.cube["day"].max() - snap.cube["day"].min()) / 2
+    month_city = Filters(start=mid.normalize(), end=mid.normalize() + pd.Timedelta(days=29),
+                         cities=(snap.cube["city"].iloc[0],))
+
+    def global_filters():
+        view = snap.filtered(month_city)
+        return metrics.kpis(view), view.backend.row_count()
+
+    timer.run("global_filters", global_filters)
+    timer.run("pro_kpis", metrics.pro_kpis, snap)
+    timer.run("profit_distribution", lambda: (metrics.profit_distribution(snap), metrics.profit_stats(snap)))
+    sample, _ = timer.run("scenario_inputs", metrics.scenario_inputs, snap, (50, 1000), (0, 500), (0, 200))
+    timer.run("scenario_simulate_100k", scenarios.simulate, sample, 250, 100, 30)
+    timer.run("city_marketing", lambda: (metrics.city_revenue(snap), metrics.marketing_performance(snap)))
+    timer.run("cohort_pivot", metrics.cohort_matrix, snap)
+    cust = timer.run("customer_features", metrics.customer_features, snap)
+    timer.run("churn_ltv_training", lambda: (ml.train_churn(cust, cols.user_col),
+                                             ml.train_ltv(cust, cols.user_col)))
+    # First call fits and saves, the second loads the saved models
+    for stage in ("model_registry_save", "model_registry_load"):
+        timer.run(stage, lambda: (ml.train_churn(cust, cols.user_col, snap.fingerprint),
+                                  ml.train_ltv(cust, cols.user_col, snap.fingerprint)))
+    timer.run("holt_winters_fit", ml.revenue_forecast, snap, 21, "holt_winters")
+    timer.run("prophet_fit", ml.revenue_forecast, snap, 21, "prophet")
+    segments = timer.run("segment_forecasts", ml.segment_forecasts, snap, "holt_winters")
+    if segments is not None:
+        timer.stages["segment_forecasts"]["series_per_s"] = round(segments.series_per_second, 1)
+    timer.run("anomaly_detectors", ml.detect_anomalies, snap)
+    timer.run("segment_anomalies", ml.segment_anomalies, snap)
+    orders = timer.run("order_outliers", ml.transaction_anomalies, snap,
+                       scores_path(csv_path, snap.fingerprint, cache_dir, snap.backend.name))
+    if orders is not None:
+        timer.stages["order_outliers"]["rows_per_s"] = round(orders.orders / orders.seconds, 1)
+
+    # Rolling detectors at a fixed 10k series x 2 years, whatever the scale
+    rng = np.random.default_rng(SEED)
+    synthetic = anomalies.SeriesMatrix(
+        pd.DataFrame({"label": np.arange(10_000).astype(str), "level": "city_source"}), ("revenue",),
+        pd.date_range(START_DATE, periods=730, freq="D"), rng.gamma(4.0, 250.0, (1, 10_000, 730)))
+    for stage, detectors in (("anomaly_scoring_10k", anomalies.DEFAULT_DETECTORS),
+                             ("anomaly_scoring_10k_mad", anomalies.DETECTORS)):
+        timer.run(stage, anomalies.detect, synthetic, None, detectors)
+        timer.stages[stage]["series_per_s"] = round(10_000 / timer.stages[stage]["wall_s"], 1)
+
+    return {"rows": len(frame), "stages": timer.stages}
+
+
+# ----------------------------
+# Baseline comparison
+# ----------------------------
+def compare(results, baseline, threshold, min_seconds):
+    """List of (scale, stage, baseline_s, current_s) regressions."""
+    regressions = []
+    for scale, res in results["scales"].items():
+        base = baseline.get("scales", {}).get(scale)
+        if base is None:
+            continue
+        for stage, stats in res["stages"].items():
+            old = base["stages"].get(stage)
+            if old is None or stats["status"] != "ok" or old["status"] != "ok":
+                continue
+            new_s, old_s = stats["wall_s"], old["wall_s"]
+            if new_s > old_s * (1 + threshold) and new_s - old_s > min_seconds:
+                regressions.append((scale, stage, old_s, new_s))
+    return regressions
+
+
+def _environment():
+    env = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    try:
+        env["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    for mod in ("numpy", "pandas", "pyarrow", "sklearn", "prophet"):
+        try:
+            env[mod] = __import__(mod).__version__
+        except ImportError:
+            pass
+    return env
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark dashboard stages.")
+    parser.add_argument("--scales", default="1m,10m,100m",
+                        help=f"comma-separated subset of {','.join(SCALES)}")
+    parser.add_argument("--output", default=None,
+                        help="results JSON (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", default=None, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative slowdown per stage (0.2 = 20%%)")
+    parser.add_argument("--min-seconds", type=float, default=0.05,
+                        help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="also write the results to benchmarks/baseline.json")
+    parser.add_argument("--run-one", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # Child process: one dataset, JSON on stdout
+    if args.run_one:
+        print(json.dumps(run_scale(args.run_one)))
+        return 0
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    unknown = [s for s in scales if s not in SCALES]
+    if unknown:
+        raise SystemExit(f"unknown scale(s): {', '.join(unknown)}")
+
+    results = {"environment": _environment(), "scales": {}}
+    for scale in scales:
+        csv_path = ensure_dataset(scale)
+        print(f"[{scale}] {csv_path}", file=sys.stderr)
+        out = subprocess.run([sys.executable, __file__, "--run-one", csv_path],
+                             stdout=subprocess.PIPE, text=True, check=True)
+        results["scales"][scale] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    output = args.output or os.path.join(
+        BENCH_DIR, "results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results: {output}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(os.path.join(BENCH_DIR, "baseline.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for scale, stage, old_s, new_s in regressions:
+            print(f"REGRESSION [{scale}] {stage}: {old_s:.3f}s -> {new_s:.3f}s "
+                  f"(+{(new_s / old_s - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            return 1
+        print("no regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+"""Data and computation layer for the Business Economics dashboard."""
@@ -0,0 +1,511 @@
+"""Query backends: where the row-level scans behind the metrics run.
+
+Most dashboard numbers come from small pre-aggregates (the rollup cube and
+the profit histogram). The remaining queries need the individual orders:
+exact distinct users, cohort cells, per-customer aggregates, orders per
+user and daily operations. A backend answers exactly those, plus the two
+pre-aggregates themselves, and always returns small pandas objects (or,
+for order_batches, bounded-size batches of the orders themselves).
+
+- "pandas" (default): the in-memory frame and derived columns of a
+  bizecon.dataset.Dataset.
+- "duckdb": embedded DuckDB over the month-partitioned Parquet copy of the
+  CSV (bizecon.store.export_parquet). Queries read only the columns they
+  use, skip months and row groups outside a date filter, run on every core
+  and spill to disk, so the dataset never has to fit in memory.
+
+The backend is chosen with BIZECON_BACKEND (see bizecon.dataset.open_dataset).
+"""
+import copy
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from bizecon import cohorts, quantiles
+from bizecon.cube import DIMENSIONS, MEASURES, build_cube
+from bizecon.derived import DerivedColumns
+from bizecon.filters import Filters, RowIndex
+from bizecon.store import concat_frames
+
+QUERY_BACKEND = os.environ.get("BIZECON_BACKEND", "pandas")
+BACKENDS = ("pandas", "duckdb")
+# order_batches column holding each order's position in the unfiltered data
+# version: a join key that does not depend on the order a scan returns rows in
+ROW_KEY = "order_row"
+
+
+def filter_mask(rows, start=None, end=None, cities=None, sources=None):
+    """Rows (cube cells or orders with day / city / marketing_source) in a filter."""
+    mask = np.ones(len(rows), dtype=bool)
+    if start is not None:
+        mask &= (rows["day"] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (rows["day"] <= pd.Timestamp(end)).to_numpy()
+    if cities:
+        mask &= rows["city"].isin(cities).to_numpy()
+    if sources:
+        mask &= rows["marketing_source"].isin(sources).to_numpy()
+    return mask
+
+
+class PandasBackend:
+    """Queries over an in-memory frame and its DerivedColumns.
+
+    filtered() returns a backend over a subset of the rows; the subset is
+    located (bizecon.filters.RowIndex) and taken on its first query.
+
+    appended() returns a backend over these rows followed by a new piece
+    (an appended cache segment). The pieces stay as they are, the first one
+    typically memory-mapped, until a query needs every row in one frame:
+    they are joined then, once. Row counts, head() and order_batches() read
+    the pieces directly.
+    """
+
+    name = "pandas"
+
+    def __init__(self, frame, cols, parent=None, filters=None, pieces=None, fingerprint=None):
+        self._frame = frame
+        self._cols = cols
+        self._parent = parent
+        self._filters = filters
+        self._pieces = pieces  # [(frame, cols)], joined on first use
+        self._fingerprint = fingerprint
+        self._rows = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _selected_rows(self):
+        if self._rows is None:
+            with self._lock:
+                if self._rows is None:
+                    self._rows = self._parent.row_index().select(self._filters)
+        return self._rows
+
+    def _materialize(self):
+        if self._frame is None and self._pieces is not None:
+            with self._lock:
+                if self._frame is None:
+                    frame = concat_frames([f for f, _ in self._pieces])
+                    self._cols = DerivedColumns.joined(frame, [c for _, c in self._pieces], self._fingerprint)
+                    self._frame = frame
+        if self._frame is None:
+            rows = self._selected_rows()
+            with self._lock:
+                if self._frame is None:
+                    parent = self._parent
+                    frame = parent.frame.iloc[rows].reset_index(drop=True)
+                    self._cols = parent.cols.subset(frame, rows, f"{parent.cols.fingerprint}|{self._filters.key()}")
+                    self._frame = frame
+
+    @property
+    def frame(self):
+        self._materialize()
+        return self._frame
+
+    @property
+    def cols(self):
+        self._materialize()
+        return self._cols
+
+    @property
+    def user_col(self):
+        if self._parent is not None:
+            return self._parent.user_col
+        return self._pieces[0][1].user_col if self._pieces is not None else self._cols.user_col
+
+    def _parts(self):
+        """The rows as [(frame, cols)] pieces, without joining them."""
+        if self._frame is None and self._pieces is not None:
+            return self._pieces
+        return [(self.frame, self.cols)]
+
+    def row_index(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = RowIndex(self.frame, self.cols)
+        return self._index
+
+    def _order_rows(self):
+        """ROW_KEY of each row of frame: its position in the unfiltered frame."""
+        if self._parent is None:
+            return np.arange(self.row_count(), dtype="int64")
+        return self._parent._order_rows()[self._selected_rows()]
+
+    def filtered(self, filters):
+        return PandasBackend(None, None, parent=self, filters=filters)
+
+    def appended(self, frame, cols, fingerprint):
+        """Backend over these rows followed by frame's (see the class docstring)."""
+        return PandasBackend(None, None, pieces=self._parts() + [(frame, cols)], fingerprint=fingerprint)
+
+    def key_count(self):
+        """Orders in the unfiltered data: ROW_KEY runs from 0 to this."""
+        return self._parent.key_count() if self._parent is not None else self.row_count()
+
+    def row_count(self):
+        if self._frame is None and self._pieces is not None:
+            return sum(len(f) for f, _ in self._pieces)
+        if self._frame is None:
+            rows = self._selected_rows()
+            return len(range(len(self._parent.frame))[rows]) if isinstance(rows, slice) else len(rows)
+        return len(self._frame)
+
+    def head(self, n=50):
+        if self._frame is None and self._pieces is not None:
+            heads = [f.head(n) for f, _ in self._pieces]
+            return heads[0] if len(heads[0]) >= n else concat_frames(heads).head(n)
+        if self._frame is None:
+            # First rows of the selection, without taking all of it
+            rows = self._selected_rows()
+            first = rows[:n] if isinstance(rows, np.ndarray) else slice(rows.start, min(rows.stop, rows.start + n))
+            return self._parent.frame.iloc[first].reset_index(drop=True)
+        return self.frame.head(n)
+
+    def cube(self):
+        return build_cube(self.frame, self.cols)
+
+    def profit_sketch(self):
+        return quantiles.build_profit_sketch(self.frame, self.cols)
+
+    def last_order_time(self):
+        return self.cols["date_dt"].max()
+
+    def active_users(self, start, end, cities, sources, window_start):
+        """(distinct users in range, daily actives in window, distinct users in window)."""
+        frame, cols = self.frame, self.cols
+        day = cols["day"]
+        mask = filter_mask(pd.DataFrame({"day": day, "city": frame["city"],
+                                         "marketing_source": frame["marketing_source"]}),
+                           start, end, cities, sources)
+        if cols.user_col is not None:
+            users = cols["user_code"].to_numpy()
+        else:
+            users = np.arange(len(frame), dtype="int32")
+        mask &= users >= 0
+        n_users = int(users.max()) + 1 if len(users) else 0
+
+        seen = np.zeros(n_users, dtype=bool)
+        seen[users[mask]] = True
+
+        in_window = mask & (day >= window_start).to_numpy()
+        days = day.to_numpy()[in_window].astype("datetime64[D]").astype("int64")
+        if len(days) == 0:
+            return int(seen.sum()), pd.Series(dtype="float64"), 0
+        d0 = int(days.min())
+        pairs = cohorts.distinct_pairs(days - d0, users[in_window], int(days.max()) - d0 + 1, n_users)
+        daily = pd.Series(np.bincount(pairs // n_users)).astype("float64")
+        window_seen = np.zeros(n_users, dtype=bool)
+        window_seen[users[in_window]] = True
+        return int(seen.sum()), daily, int(window_seen.sum())
+
+    def cohort_cells(self, grain, value):
+        return cohorts.cohort_cells(self.frame, self.cols, grain, value)
+
+    def orders_per_user(self):
+        return self.frame.groupby(self.cols.user_col, observed=True).size()
+
+    def customer_orders(self):
+        """Per-customer order count, revenue, basket, first / last order, promo rate."""
+        frame, cols = self.frame, self.cols
+        return frame.assign(date_dt=cols["date_dt"]).groupby(cols.user_col, observed=True).agg(
+            total_orders=("revenue","count"),
+            total_revenue=("revenue","sum"),
+            avg_basket=("revenue","mean"),
+            first_order=("date_dt","min"),
+            last_order=("date_dt","max"),
+            promo_rate=("promo_used","mean")
+        ).reset_index()
+
+    def order_batches(self, columns, rows):
+        """Orders' `columns` (ROW_KEY among them if asked), at most `rows` orders per
+        frame, piece by piece (categories may differ between pieces)."""
+        keys = self._order_rows() if ROW_KEY in columns else None
+        read = [c for c in columns if c != ROW_KEY]
+        offset = 0
+        for frame, _ in self._parts():
+            for start in range(0, len(frame), rows):
+                batch = frame.iloc[start:start + rows][read]
+                if keys is not None:
+                    batch = batch.assign(**{ROW_KEY: keys[offset + start:offset + start + len(batch)]})[columns]
+                yield batch
+            offset += len(frame)
+
+    def daily_operations(self):
+        """Daily revenue, mean profit per order and mean CAC."""
+        frame, cols = self.frame, self.cols
+        return frame.assign(profit_per_order=cols["profit_per_order"]).groupby(cols["day"]).agg(
+            revenue=("revenue", "sum"),
+            profit=("profit_per_order", "mean"),
+            cac=("marketing_cost", "mean")
+        ).rename_axis("date_dt").reset_index()
+
+
+# ----------------------------
+# DuckDB over Parquet
+# ----------------------------
+_PROFIT = "(gross_margin - marketing_cost - opex_allocated)"
+_DAY = "date_trunc('day', date)"
+_PERIODS = {
+    # Same numbering as the epoch_week / epoch_month derived columns
+    "week": "CAST(floor((CAST(date AS DATE) - DATE '1970-01-01' + 3) / 7) AS BIGINT)",
+    "month": "CAST((year(date) - 1970) * 12 + month(date) - 1 AS BIGINT)",
+}
+
+
+def _sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _bucket_sql(x):
+    """quantiles.bucket_index as a SQL expression."""
+    ln_gamma = float(np.log(quantiles.GAMMA))
+
+    def magnitude(v):
+        k = f"least(greatest(ceil(ln({v}) / {ln_gamma!r}), {quantiles.K_MIN}), {quantiles.K_MAX})"
+        return f"(CAST({k} AS BIGINT) - {quantiles.K_MIN})"
+
+    zero = quantiles.ZERO_BUCKET
+    return (f"CASE WHEN {x} > 0 THEN {zero + 1} + {magnitude(x)} "
+            f"WHEN {x} < 0 THEN {zero - 1} - {magnitude(f'-{x}')} ELSE {zero} END")
+
+
+def _filters_sql(filters):
+    """bizecon.filters.Filters as a SQL condition ("" for no filter)."""
+    clauses = []
+    lo, hi = filters.day_bounds()
+    if lo is not None:
+        clauses += [f"month >= {_sql_string(lo.strftime('%Y-%m'))}", f"date >= TIMESTAMP {_sql_string(lo)}"]
+    if hi is not None:
+        last = hi - pd.Timedelta(days=1)
+        clauses += [f"month <= {_sql_string(last.strftime('%Y-%m'))}", f"date < TIMESTAMP {_sql_string(hi)}"]
+    if filters.cities:
+        clauses.append(f"city IN ({', '.join(map(_sql_string, filters.cities))})")
+    if filters.sources:
+        clauses.append(f"marketing_source IN ({', '.join(map(_sql_string, filters.sources))})")
+    if filters.promo is not None:
+        clauses.append(f"promo_used = {'true' if filters.promo else 'false'}")
+    return " AND ".join(clauses)
+
+
+class DuckDBBackend:
+    """Queries pushed down to DuckDB over a hive-partitioned Parquet dataset.
+
+    threads / memory_limit go to DuckDB as-is (None keeps its defaults: all
+    cores and 80% of RAM, spilling to a temp directory beyond that).
+    """
+
+    name = "duckdb"
+
+    def __init__(self, parquet_dir, user_col=None, threads=None, memory_limit=None):
+        import duckdb
+
+        self.parquet_dir = parquet_dir
+        config = {}
+        if threads:
+            config["threads"] = int(threads)
+        if memory_limit:
+            config["memory_limit"] = str(memory_limit)
+        self._con = duckdb.connect(config=config)
+        self._lock = threading.Lock()
+        self._head = None
+
+        files = _sql_string(os.path.join(parquet_dir, "**", "*.parquet"))
+        args = [files, "hive_partitioning = true", "hive_types = {'month': VARCHAR}",
+                "filename = true", "file_row_number = true"]
+        source = f"read_parquet({', '.join(args)})"
+        # ROW_KEY: the order's position over the files in name order
+        self._con.execute(f"""
+            CREATE TABLE order_files AS
+            SELECT file_name AS filename, num_rows,
+                   CAST(sum(num_rows) OVER (ORDER BY file_name) - num_rows AS BIGINT) AS first_row
+            FROM parquet_file_metadata({files})
+        """)
+        columns = "t.* EXCLUDE (filename, file_row_number)"
+        if user_col is None:
+            # Like bizecon.dataset.prepare_frame: about one user per 5
+            # orders, stable for a given file layout
+            n_users = max(50, self._con.execute(f"SELECT count(*) FROM {source}").fetchone()[0] // 5)
+            columns += (f", CAST(hash(t.filename, t.file_row_number) % {n_users} + 1 AS BIGINT) "
+                        f"AS synthetic_user_id")
+            user_col = "synthetic_user_id"
+        self._con.execute(f"CREATE VIEW transactions AS SELECT {columns} FROM {source} AS t")
+        # Only order_batches joins the key in
+        self._con.execute(
+            f"CREATE VIEW keyed_transactions AS SELECT {columns}, f.first_row + t.file_row_number AS {ROW_KEY} "
+            f"FROM {source} AS t JOIN order_files AS f ON t.filename = f.filename")
+        self.user_col = user_col
+        self._user = '"' + user_col.replace('"', '""') + '"'
+        self._from = "transactions"
+        self._keyed = "keyed_transactions"
+
+    def _df(self, sql):
+        # One cursor per query: sessions call in from several threads
+        with self._lock:
+            cur = self._con.cursor()
+        return cur.execute(sql).df()
+
+    def _where(self, start=None, end=None, cities=None, sources=None):
+        """WHERE clause for orders with a user in a filter (month bounds prune partitions)."""
+        where = _filters_sql(Filters(start, end, tuple(cities or ()), tuple(sources or ())))
+        return f"WHERE {self._user} IS NOT NULL" + (f" AND {where}" if where else "")
+
+    def filtered(self, filters):
+        """Same connection, every query reading through the filter's WHERE clause."""
+        where = _filters_sql(filters)
+        backend = copy.copy(self)
+        backend._head = None
+        if where:
+            backend._from = f"(SELECT * FROM {self._from} WHERE {where}) AS transactions"
+            backend._keyed = f"(SELECT * FROM {self._keyed} WHERE {where}) AS transactions"
+        return backend
+
+    def key_count(self):
+        """Orders in the unfiltered data: ROW_KEY runs from 0 to this."""
+        return int(self._df("SELECT coalesce(sum(num_rows), 0) AS n FROM order_files")["n"].iloc[0])
+
+    def row_count(self):
+        return int(self._df(f"SELECT count(*) AS n FROM {self._from}")["n"].iloc[0])
+
+    def head(self, n=50):
+        if self._head is None or len(self._head) < n:
+            self._head = self._df(f"SELECT * EXCLUDE (month) FROM {self._from} LIMIT {int(n)}")
+        return self._head.head(n)
+
+    def cube(self):
+        measures = []
+        for m in MEASURES:
+            measures += [f"coalesce(sum(CAST({m} AS DOUBLE)), 0) AS {m}",
+                         f"coalesce(sum(CAST({m} AS DOUBLE) * CAST({m} AS DOUBLE)), 0) AS {m}_sq",
+                         f"count({m}) AS {m}_n"]
+        dims = ", ".join(DIMENSIONS)
+        cube = self._df(f"""
+            SELECT {_DAY} AS day, city, marketing_source, promo_used, count(*) AS orders,
+                   {', '.join(measures)}, count_if({_PROFIT} < 0) AS loss_orders
+            FROM {self._from}
+            WHERE date IS NOT NULL AND city IS NOT NULL
+              AND marketing_source IS NOT NULL AND promo_used IS NOT NULL
+            GROUP BY ALL ORDER BY {dims}
+        """)
+        cube["day"] = cube["day"].astype("datetime64[ns]")
+        return cube
+
+    def profit_sketch(self):
+        profit = f"CAST({_PROFIT} AS DOUBLE)"
+        valid = f"WHERE date IS NOT NULL AND NOT isnan({profit})"
+        by_day = self._df(f"""
+            SELECT {_DAY} AS day, min({profit}) AS lo, max({profit}) AS hi
+            FROM {self._from} {valid} GROUP BY ALL ORDER BY day
+        """)
+        cells = self._df(f"""
+            SELECT {_DAY} AS day, {_bucket_sql(profit)} AS bucket, count(*) AS n
+            FROM {self._from} {valid} GROUP BY ALL
+        """)
+        days = pd.DatetimeIndex(by_day["day"].astype("datetime64[ns]"))
+        counts = np.zeros((len(days), quantiles.N_BUCKETS), dtype="int64")
+        counts[days.get_indexer(cells["day"].astype("datetime64[ns]")), cells["bucket"].to_numpy()] = cells["n"].to_numpy()
+        return quantiles.ProfitSketch(days, counts, by_day["lo"].to_numpy(), by_day["hi"].to_numpy())
+
+    def last_order_time(self):
+        return pd.Timestamp(self._df(f"SELECT max(date) AS t FROM {self._from}")["t"].iloc[0])
+
+    def active_users(self, start, end, cities, sources, window_start):
+        """(distinct users in range, daily actives in window, distinct users in window)."""
+        where = self._where(start, end, cities, sources)
+        window_where = self._where(window_start, end, cities, sources)
+        users = self._df(f"SELECT count(DISTINCT {self._user}) AS n FROM {self._from} {where}")
+        daily = self._df(f"""
+            SELECT {_DAY} AS day, count(DISTINCT {self._user}) AS n
+            FROM {self._from} {window_where} GROUP BY ALL ORDER BY day
+        """)
+        window = self._df(f"SELECT count(DISTINCT {self._user}) AS n FROM {self._from} {window_where}")
+        return int(users["n"].iloc[0]), daily["n"].astype("float64"), int(window["n"].iloc[0])
+
+    def cohort_cells(self, grain, value):
+        period = _PERIODS[grain]
+        rows = f"{self._user} IS NOT NULL AND date IS NOT NULL"
+        if value == "revenue":
+            rows += " AND revenue IS NOT NULL AND NOT isnan(revenue)"
+            cell = "sum(CAST(revenue AS DOUBLE))"
+        else:
+            cell = "count(DISTINCT t.u)"
+        long = self._df(f"""
+            WITH t AS (SELECT {self._user} AS u, {period} AS p, revenue FROM {self._from} WHERE {rows}),
+                 f AS (SELECT u, min(p) AS c FROM t GROUP BY u)
+            SELECT f.c AS cohort, t.p - f.c AS lag, {cell} AS v, NULL AS users
+            FROM t JOIN f USING (u) GROUP BY ALL
+            UNION ALL
+            SELECT c, -1, NULL, count(*) FROM f GROUP BY c
+        """)
+        if long.empty:
+            return None
+
+        # Rows with lag -1 carry the cohort sizes
+        lag = long["lag"].to_numpy(dtype="int64")
+        is_size = lag == -1
+        cohort = long["cohort"].to_numpy(dtype="int64")
+        p0 = int(cohort.min())
+        n_periods = int((cohort + np.maximum(lag, 0)).max()) - p0 + 1
+
+        sizes = np.zeros(n_periods, dtype="int64")
+        sizes[cohort[is_size] - p0] = long["users"].to_numpy()[is_size].astype("int64")
+        cells = np.zeros((n_periods, n_periods), dtype="float64")
+        cell = ~is_size
+        cells[cohort[cell] - p0, lag[cell]] = long["v"].to_numpy(dtype="float64")[cell]
+        return cells, sizes, p0
+
+    def order_batches(self, columns, rows):
+        """Orders' `columns` (ROW_KEY among them if asked), about `rows` orders per
+        frame, streamed from the scan in no guaranteed order."""
+        with self._lock:
+            cur = self._con.cursor()
+        select = ", ".join('"' + c.replace('"', '""') + '"' for c in columns)
+        source = self._keyed if ROW_KEY in columns else self._from
+        for batch in cur.execute(f"SELECT {select} FROM {source}").to_arrow_reader(rows):
+            yield batch.to_pandas()
+
+    def orders_per_user(self):
+        counts = self._df(f"""
+            SELECT {self._user} AS u, count(*) AS n FROM {self._from}
+            WHERE {self._user} IS NOT NULL GROUP BY u ORDER BY u
+        """)
+        return pd.Series(counts["n"].to_numpy(), index=pd.Index(counts["u"], name=self.user_col))
+
+    def customer_orders(self):
+        """Per-customer order count, revenue, basket, first / last order, promo rate."""
+        cust = self._df(f"""
+            SELECT {self._user},
+                   count(revenue) AS total_orders,
+                   coalesce(sum(CAST(revenue AS DOUBLE)), 0) AS total_revenue,
+                   avg(CAST(revenue AS DOUBLE)) AS avg_basket,
+                   min(date) AS first_order,
+                   max(date) AS last_order,
+                   avg(CAST(promo_used AS DOUBLE)) AS promo_rate
+            FROM {self._from} WHERE {self._user} IS NOT NULL
+            GROUP BY ALL ORDER BY {self._user}
+        """)
+        for c in ("first_order", "last_order"):
+            cust[c] = cust[c].astype("datetime64[ns]")
+        return cust
+
+    def daily_operations(self):
+        """Daily revenue, mean profit per order and mean CAC."""
+        daily = self._df(f"""
+            SELECT {_DAY} AS date_dt,
+                   coalesce(sum(CAST(revenue AS DOUBLE)), 0) AS revenue,
+                   avg(CAST({_PROFIT} AS DOUBLE)) AS profit,
+                   avg(CAST(marketing_cost AS DOUBLE)) AS cac
+            FROM {self._from} WHERE date IS NOT NULL
+            GROUP BY ALL ORDER BY date_dt
+        """)
+        daily["date_dt"] = daily["date_dt"].astype("datetime64[ns]")
+        return daily
+
+
+def open_backend(name, parquet_dir, user_col=None, threads=None, memory_limit=None):
+    """An out-of-core backend by name (pandas backends come from a Dataset)."""
+    if name == "duckdb":
+        return DuckDBBackend(parquet_dir, user_col, threads=threads, memory_limit=memory_limit)
+    raise ValueError(f"unknown query backend {name!r}; expected one of {BACKENDS}")
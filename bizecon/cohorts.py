@@ -0,0 +1,141 @@
+"""Cohort retention matrices without pandas pivots.
+
+Users are dense int32 codes and periods are contiguous epoch weeks or
+months (derived columns user_code / epoch_week / epoch_month), so every
+(user, period) pair maps to one integer key. Distinct pairs come from a
+bitmap over users x periods when it fits in BITMAP_BUDGET bytes, and from
+a sort plus neighbour comparison otherwise; both yield the pairs ordered by user then
+period, so each user's first period is the first pair of its run. Cells of
+the cohort x period-offset matrix are then filled with np.bincount.
+Out-of-core backends compute the same cells in SQL (bizecon.backends).
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+GRAINS = {
+    "week": ("epoch_week", "cohort_week", "weeks_since_first"),
+    "month": ("epoch_month", "cohort_month", "months_since_first"),
+}
+VALUES = ("users", "revenue")
+
+# Largest users x periods bitmap (one byte per cell) before falling back to sorting
+BITMAP_BUDGET = 256 * 2**20
+
+
+@dataclass(frozen=True)
+class CohortRetention:
+    grain: str
+    value: str
+    matrix: pd.DataFrame      # cohort start x offset: active users or revenue
+    retention: pd.DataFrame   # matrix / offset-0 column
+    cohort_size: pd.Series    # users per cohort
+
+
+def _period_labels(periods, grain):
+    if grain == "week":
+        return pd.DatetimeIndex((periods.astype("int64") * 7 - 3).astype("datetime64[D]"))
+    return pd.DatetimeIndex(periods.astype("int64").astype("datetime64[M]"))
+
+
+def distinct_pairs(users, periods, n_users, n_periods):
+    """Sorted unique user * n_periods + period keys."""
+    keys = users.astype("int64") * n_periods + periods
+    if n_users * n_periods <= BITMAP_BUDGET:
+        seen = np.zeros(n_users * n_periods, dtype=bool)
+        seen[keys] = True
+        return np.flatnonzero(seen)
+    # Same result as np.unique, which is several times slower here
+    keys = np.sort(keys)
+    return keys[np.r_[True, keys[1:] != keys[:-1]]]
+
+
+def cohort_cells(frame, cols, grain="week", value="users"):
+    """(cohort x offset cells, users per cohort, first period) from the rows.
+
+    Both arrays are indexed by period - p0; None when no row qualifies.
+    """
+    period_col = GRAINS[grain][0]
+    if cols.user_col is not None:
+        users = cols["user_code"].to_numpy()
+    else:
+        # No user identity: every order is its own single-period user
+        users = np.arange(len(frame), dtype="int32")
+    periods = cols[period_col].to_numpy()
+
+    ok = (users >= 0) & cols["date_dt"].notna().to_numpy()
+    if value == "revenue":
+        revenue = frame["revenue"].to_numpy(dtype="float64", na_value=np.nan)
+        ok &= ~np.isnan(revenue)
+        revenue = revenue[ok]
+    users, periods = users[ok], periods[ok]
+    if len(users) == 0:
+        return None
+
+    p0 = int(periods.min())
+    periods = (periods - p0).astype("int64")
+    n_periods = int(periods.max()) + 1
+    n_users = int(users.max()) + 1
+
+    # Distinct (user, period) pairs, sorted by user then period
+    pairs = distinct_pairs(users, periods, n_users, n_periods)
+    pair_user, pair_period = np.divmod(pairs, n_periods)
+    run_start = np.r_[True, pair_user[1:] != pair_user[:-1]]
+    first = np.full(n_users, -1, dtype="int64")
+    first[pair_user[run_start]] = pair_period[run_start]
+
+    if value == "users":
+        cohort = first[pair_user]
+        offset = pair_period - cohort
+        weights = None
+    else:
+        cohort = first[users]
+        offset = periods - cohort
+        weights = revenue
+
+    cells = np.bincount(cohort * n_periods + offset, weights=weights,
+                        minlength=n_periods * n_periods).reshape(n_periods, n_periods)
+    sizes = np.bincount(first[first >= 0], minlength=n_periods)
+    return cells, sizes, p0
+
+
+def retention(snap, grain="week", value="users"):
+    """Cohort x periods-since-first-order matrix.
+
+    value="users" counts distinct active users per cell; value="revenue"
+    sums their revenue. Cohorts are the period of each user's first order.
+    The cells come from the snapshot's query backend (see cohort_cells).
+    """
+    if grain not in GRAINS:
+        raise ValueError(f"grain must be one of {sorted(GRAINS)}")
+    if value not in VALUES:
+        raise ValueError(f"value must be one of {VALUES}")
+    _, index_name, columns_name = GRAINS[grain]
+
+    found = snap.backend.cohort_cells(grain, value)
+    if found is None:
+        empty = pd.DataFrame(index=pd.DatetimeIndex([], name=index_name))
+        return CohortRetention(grain, value, empty, empty, pd.Series(dtype="int64"))
+    cells, sizes, p0 = found
+    n_periods = len(sizes)
+
+    # Keep cohorts that have users and offsets any cohort reaches
+    rows = np.flatnonzero(sizes)
+    n_offsets = n_periods - int(rows.min())
+    labels = _period_labels(rows + p0, grain).rename(index_name)
+    matrix = pd.DataFrame(cells[rows, :n_offsets], index=labels,
+                          columns=pd.RangeIndex(n_offsets, name=columns_name))
+    if value == "users":
+        matrix = matrix.astype("int64")
+
+    # Offsets a cohort has not lived long enough to reach are unknown, not 0%
+    reachable = (n_periods - rows)[:, None] > np.arange(n_offsets)[None, :]
+    base = matrix[0].replace(0, np.nan)
+    return CohortRetention(
+        grain=grain,
+        value=value,
+        matrix=matrix,
+        retention=matrix.div(base, axis=0).where(reachable),
+        cohort_size=pd.Series(sizes[rows], index=labels, name="users"),
+    )
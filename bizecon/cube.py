@@ -0,0 +1,72 @@
+"""Pre-aggregated rollup cube at day x city x marketing_source x promo_used.
+
+Holds, per cell, the row count plus sum, sum of squares and non-null count
+of every measure (and the number of loss-making orders). Any coarser view
+(totals, by city, by day, ...) is a re-aggregation of a few thousand cube
+rows, so KPI cards and summary tabs no longer scan the transactions.
+"""
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ["day", "city", "marketing_source", "promo_used"]
+MEASURES = ["revenue", "cogs", "gross_margin", "marketing_cost", "opex_allocated", "items_count"]
+
+
+def build_cube(frame, cols):
+    """One pass over the transactions: factorize the cell key, then bincount.
+
+    Sums accumulate in float64 even though the money columns are float32.
+    """
+    keys = pd.DataFrame({
+        "day": cols["day"],
+        "city": frame["city"],
+        "marketing_source": frame["marketing_source"],
+        "promo_used": frame["promo_used"],
+    })
+    grouped = keys.groupby(DIMENSIONS, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    cube = grouped.size().rename("orders").reset_index()
+    n_cells = len(cube)
+
+    # Rows with a missing dimension value belong to no cell (ngroup gives
+    # them NaN, which makes the codes float)
+    in_cell = codes >= 0
+    codes = codes[in_cell].astype(np.intp)
+
+    for m in MEASURES:
+        values = frame[m].to_numpy(dtype="float64", na_value=np.nan)[in_cell]
+        ok = ~np.isnan(values)
+        cube[m] = np.bincount(codes[ok], weights=values[ok], minlength=n_cells)
+        cube[f"{m}_sq"] = np.bincount(codes[ok], weights=values[ok] ** 2, minlength=n_cells)
+        cube[f"{m}_n"] = np.bincount(codes[ok], minlength=n_cells)
+
+    loss = (cols["profit_per_order"] < 0).to_numpy()[in_cell]
+    cube["loss_orders"] = np.bincount(codes[loss], minlength=n_cells)
+    return cube
+
+
+def merge_cubes(cubes):
+    """Combine cubes built over disjoint row sets (e.g. a cache and its tail)."""
+    merged = pd.concat(cubes, ignore_index=True)
+    return merged.groupby(DIMENSIONS, observed=True, sort=True).sum().reset_index()
+
+
+def measure_columns(cube):
+    return [c for c in cube.columns if c not in DIMENSIONS]
+
+
+def rollup(cube, by=None):
+    """Re-aggregate the cube to a coarser grain; by=None gives grand totals."""
+    if not by:
+        return cube[measure_columns(cube)].sum()
+    return cube.groupby(by, observed=True)[measure_columns(cube)].sum()
+
+
+def measure_mean(agg, m):
+    return agg[m] / agg[f"{m}_n"]
+
+
+def measure_std(agg, m):
+    """Population standard deviation from the sum and sum of squares."""
+    mean = measure_mean(agg, m)
+    return np.sqrt(np.maximum(agg[f"{m}_sq"] / agg[f"{m}_n"] - mean ** 2, 0))
@@ -0,0 +1,284 @@
+"""Process-wide dataset handle with incremental refresh.
+
+A Dataset owns the transactions frame, its derived-column registry, the
+rollup cube, the active-user sketches, the profit histogram and the
+customer feature store. refresh() syncs the on-disk cache with the CSV;
+when rows were only appended, just the new segment is read: its cube,
+sketches and customer features are folded into the running ones, and the
+segment itself is kept as a piece of the query backend, which joins the
+pieces only when a query needs every row in one frame. A rewritten CSV triggers a full reload. Readers take a snapshot()
+so a refresh never swaps data out from under a half-finished rerun.
+
+A LazyDataset offers the same refresh() / snapshot() interface without an
+in-memory frame: its snapshot answers row-level queries through an
+out-of-core backend over a Parquet copy of the CSV (see bizecon.backends).
+open_dataset() picks one of the two from BIZECON_BACKEND.
+"""
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as pads
+
+from bizecon.backends import QUERY_BACKEND, PandasBackend, open_backend
+from bizecon.cube import build_cube, merge_cubes
+from bizecon.derived import DerivedColumns
+from bizecon.features import aligned, build_customers, load_customers, merge_customers, save_customers
+from bizecon.quantiles import build_profit_sketch, merge_profit_sketches, select_days
+from bizecon.sketches import build_sketches, cell_mask, merge_sketches, select_cells
+from bizecon.store import (
+    CACHE_DIR, CSV_PATH, PARQUET_DIR, cache_span, cached_manifest, compact_cache,
+    csv_signature, customers_path, dataset_fingerprint, parquet_fingerprint, read_segment,
+    segment_paths, sync_cache, sync_parquet,
+)
+
+
+USER_COL_NAMES = ["user_id","userid","customer_id","customer","user"]
+
+
+def infer_user_col(frame):
+    """The user identifier column, or None if the data has none."""
+    for c in frame.columns:
+        if str(c).lower() in USER_COL_NAMES:
+            return c
+    return None
+
+
+def prepare_frame(frame):
+    """Default per-piece preparation (row-local, see Dataset)."""
+    frame = frame.copy(deep=False)
+
+    # Ensure Arrow-safe types for Streamlit performance
+    for col in frame.columns:
+        if frame[col].dtype == "object":
+            frame[col] = frame[col].astype(str)
+
+    # Synthetic user_id generation (non-destructive); seeded so the ids are
+    # stable across reruns and sessions
+    if infer_user_col(frame) is None:
+        num_users = max(50, len(frame) // 5)  # approx one user per 5 orders
+        frame["synthetic_user_id"] = np.random.default_rng(42).integers(1, num_users + 1, size=len(frame))
+    return frame
+
+
+def default_user_col(frame):
+    return infer_user_col(frame) or "synthetic_user_id"
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    frame: pd.DataFrame  # None for filtered, appended and out-of-core snapshots
+    cols: DerivedColumns  # None for filtered, appended and out-of-core snapshots
+    cube: pd.DataFrame
+    fingerprint: str
+    sketches: object = None  # bizecon.sketches.UserSketches, None without a user column
+    profit_sketch: object = None  # bizecon.quantiles.ProfitSketch
+    backend: object = None  # bizecon.backends backend; defaults to pandas over frame
+    customers: object = None  # bizecon.features.CustomerStore over every row
+
+    def __post_init__(self):
+        if self.backend is None:
+            object.__setattr__(self, "backend", PandasBackend(self.frame, self.cols))
+
+    @property
+    def user_col(self):
+        return self.backend.user_col
+
+    def filtered(self, filters):
+        """Snapshot of the rows inside a bizecon.filters.Filters.
+
+        Cube cells, sketch cells and histogram days are selected right away;
+        the backend locates the rows themselves on its first query.
+        """
+        if not filters.active:
+            return self
+        cube = self.cube[filters.cube_mask(self.cube)].reset_index(drop=True)
+
+        user_sketches = None
+        if self.sketches is not None and filters.promo is None:
+            # Sketch cells are day x city x source: no promo split
+            mask = cell_mask(self.sketches, filters.start, filters.end, filters.cities, filters.sources)
+            user_sketches = select_cells(self.sketches, mask)
+
+        profit_sketch = None
+        if self.profit_sketch is not None and filters.dates_only:
+            profit_sketch = select_days(self.profit_sketch, *filters.day_bounds())
+
+        return Snapshot(None, None, cube, f"{self.fingerprint}|{filters.key()}",
+                        user_sketches, profit_sketch, self.backend.filtered(filters))
+
+
+class Dataset:
+    """Transactions + derived columns + cube for one CSV, kept in sync.
+
+    prepare(frame) is applied to every piece read from the cache (the full
+    frame or an appended tail) and must therefore be row-local. user_col is
+    a callable picking the user id column from the prepared frame.
+    """
+
+    def __init__(self, csv_path=CSV_PATH, cache_dir=CACHE_DIR, prepare=prepare_frame,
+                 user_col=default_user_col):
+        self.csv_path = csv_path
+        self.cache_dir = cache_dir
+        self.prepare = prepare
+        self.user_col = user_col
+        self._lock = threading.Lock()
+        self._meta = None
+        self._snapshot = None
+        self.refresh()
+
+    def _read(self, path):
+        return self.prepare(read_segment(path))
+
+    def _full_load(self):
+        _, meta = sync_cache(self.csv_path, self.cache_dir)
+        meta = compact_cache(meta, self.csv_path, self.cache_dir)
+        frame = self._read(segment_paths(meta, self.csv_path, self.cache_dir)[0])
+        cols = DerivedColumns(frame, dataset_fingerprint(self.csv_path), self.user_col(frame))
+        self._meta = meta
+        self._snapshot = Snapshot(frame, cols, build_cube(frame, cols), cols.fingerprint,
+                                  build_sketches(frame, cols), build_profit_sketch(frame, cols),
+                                  customers=self._load_customers(frame, cols, meta))
+
+    def _customers_span(self, meta, frame, cols):
+        """Key of the customer store: the CSV bytes and user column it covers."""
+        span = dict(cache_span(meta), user_col=cols.user_col)
+        if infer_user_col(frame) is None:
+            # Synthetic ids are drawn per piece read, so they depend on the segments
+            span["pieces"] = [s["rows"] for s in meta["segments"]]
+        return span
+
+    def _load_customers(self, frame, cols, meta):
+        """The persisted customer store if it covers exactly this cache, else a rebuild."""
+        path = customers_path(self.csv_path, self.cache_dir)
+        span = self._customers_span(meta, frame, cols)
+        customers = load_customers(path, span)
+        if customers is not None:
+            users = frame[cols.user_col]
+            if isinstance(users.dtype, pd.CategoricalDtype):
+                customers = aligned(customers, pd.Index(users.cat.categories))
+        if customers is None:
+            customers = build_customers(frame, cols)
+            save_customers(customers, path, span)
+        return customers
+
+    def _fold(self, meta):
+        """Append the segments this process has not read yet.
+
+        Only the new segments are read and summarized; the backend keeps
+        them as pieces after the rows already held (see PandasBackend).
+        """
+        snap = self._snapshot
+        fingerprint = dataset_fingerprint(self.csv_path)
+        backend, cube, sketches, profit_sketch, customers = (
+            snap.backend, snap.cube, snap.sketches, snap.profit_sketch, snap.customers)
+        for path in segment_paths(meta, self.csv_path, self.cache_dir)[len(self._meta["segments"]):]:
+            tail = self._read(path)
+            tail_cols = DerivedColumns(tail, fingerprint, backend.user_col)
+            backend = backend.appended(tail, tail_cols, fingerprint)
+            cube = merge_cubes([cube, build_cube(tail, tail_cols)])
+            sketches = merge_sketches([sketches, build_sketches(tail, tail_cols)])
+            profit_sketch = merge_profit_sketches([profit_sketch, build_profit_sketch(tail, tail_cols)])
+            customers = merge_customers(customers, build_customers(tail, tail_cols))
+        save_customers(customers, customers_path(self.csv_path, self.cache_dir),
+                       self._customers_span(meta, tail, tail_cols))
+
+        self._meta = meta
+        self._snapshot = Snapshot(None, None, cube, fingerprint, sketches, profit_sketch, backend, customers)
+
+    def refresh(self):
+        """Sync with the CSV; returns "fresh", "appended" or "reloaded"."""
+        with self._lock:
+            if self._snapshot is None:
+                self._full_load()
+                return "reloaded"
+
+            _, meta = sync_cache(self.csv_path, self.cache_dir)
+            if meta["generation"] != self._meta["generation"]:
+                self._full_load()
+                return "reloaded"
+            if len(meta["segments"]) > len(self._meta["segments"]):
+                self._fold(meta)
+                return "appended"
+            self._meta = meta
+            return "fresh"
+
+    def snapshot(self):
+        return self._snapshot
+
+
+class LazyDataset:
+    """Transactions queried in place from Parquet by an out-of-core backend.
+
+    The Parquet copy is re-exported when the CSV changes (an append is a
+    full export too); without a CSV, parquet_dir is used as it is. Only the
+    cube and the profit histogram are held in memory.
+    """
+
+    def __init__(self, csv_path=CSV_PATH, parquet_dir=PARQUET_DIR, backend="duckdb",
+                 **backend_options):
+        self.csv_path = csv_path
+        self.parquet_dir = parquet_dir
+        self.backend = backend
+        self.backend_options = backend_options
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.refresh()
+
+    def refresh(self):
+        """Sync with the CSV; returns "fresh" or "reloaded"."""
+        with self._lock:
+            status, fingerprint = sync_parquet(self.csv_path, self.parquet_dir)
+            if self._snapshot is not None and status == "fresh" and fingerprint == self._snapshot.fingerprint:
+                return "fresh"
+
+            backend = open_backend(self.backend, self.parquet_dir, parquet_user_col(self.parquet_dir),
+                                   **self.backend_options)
+            self._snapshot = Snapshot(None, None, backend.cube(), fingerprint,
+                                      profit_sketch=backend.profit_sketch(), backend=backend)
+            return "reloaded"
+
+    def snapshot(self):
+        return self._snapshot
+
+
+def parquet_user_col(parquet_dir=PARQUET_DIR):
+    """The user column of a Parquet dataset (None: the backend synthesizes one)."""
+    schema = pads.dataset(parquet_dir, format="parquet", partitioning="hive").schema
+    return infer_user_col(pd.DataFrame(columns=schema.names))
+
+
+def order_backend(csv_path=CSV_PATH, fingerprint=None, filters=None, backend=QUERY_BACKEND,
+                  cache_dir=CACHE_DIR, parquet_dir=PARQUET_DIR):
+    """Query backend over the orders alone, opened from what is already cached.
+
+    For worker processes, e.g. a background job that scans every order: the
+    cache segments (or the Parquet copy) are read as they are, without
+    syncing them or building the cube, sketches and customer store. Raises
+    ValueError if they no longer hold data version `fingerprint`.
+    """
+    if backend == "pandas":
+        meta = cached_manifest(csv_path, cache_dir)
+        current = dataset_fingerprint(csv_path)
+        if meta is None or (meta["csv_size"], meta["csv_mtime_ns"]) != csv_signature(csv_path):
+            raise ValueError(f"the cache of {csv_path} is not up to date")
+        root = None
+        for path in segment_paths(meta, csv_path, cache_dir):
+            piece = prepare_frame(read_segment(path))
+            user_col = default_user_col(piece) if root is None else root.user_col
+            cols = DerivedColumns(piece, current, user_col)
+            root = PandasBackend(piece, cols) if root is None else root.appended(piece, cols, current)
+    else:
+        current = parquet_fingerprint(parquet_dir)
+        root = open_backend(backend, parquet_dir, parquet_user_col(parquet_dir))
+    if fingerprint is not None and current != fingerprint:
+        raise ValueError(f"data changed: version {current}, expected {fingerprint}")
+    return root.filtered(filters) if filters is not None else root
+
+
+def open_dataset(csv_path=CSV_PATH, backend=QUERY_BACKEND):
+    """Dataset for the configured query backend (BIZECON_BACKEND)."""
+    if backend == "pandas":
+        return Dataset(csv_path)
+    return LazyDataset(csv_path, backend=backend)
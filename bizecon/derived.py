@@ -0,0 +1,152 @@
+"""Registry of derived columns, computed lazily and once per dataset.
+
+Sections ask a DerivedColumns instance for a column by name instead of
+re-parsing dates or recomputing profit on their own. Each column is built on
+first access from the base frame (and any other derived columns it depends
+on), then memoized for as long as the instance lives; the app keeps one
+instance per dataset fingerprint, so every section and session shares it.
+"""
+import threading
+
+import pandas as pd
+
+DERIVED = {}
+ROW_LOCAL = set()
+
+
+def derived(name, row_local=True):
+    """Register fn(frame, cols) -> Series as the builder for column `name`.
+
+    row_local columns depend only on their own row, so appended rows can be
+    computed on their own and concatenated; the others (per-user minimums)
+    are recomputed over the whole frame on next access.
+    """
+    def register(fn):
+        DERIVED[name] = fn
+        if row_local:
+            ROW_LOCAL.add(name)
+        return fn
+    return register
+
+
+@derived("date_dt")
+def _date_dt(frame, cols):
+    return pd.to_datetime(frame["date"])
+
+
+@derived("day")
+def _day(frame, cols):
+    # Midnight timestamps rather than Python date objects: same grouping,
+    # but stays a datetime64 column
+    return cols["date_dt"].dt.normalize()
+
+
+@derived("year_week")
+def _year_week(frame, cols):
+    # ISO year * 100 + ISO week (e.g. 202452), so weeks never merge across years
+    iso = cols["date_dt"].dt.isocalendar()
+    return (iso["year"].astype("int32") * 100 + iso["week"].astype("int32")).rename("year_week")
+
+
+@derived("epoch_week")
+def _epoch_week(frame, cols):
+    # Monday-aligned week number (week 0 starts 1969-12-29); contiguous
+    # across year boundaries, unlike year_week
+    days = cols["date_dt"].to_numpy(dtype="datetime64[D]").astype("int64")
+    return pd.Series(((days + 3) // 7).astype("int32"), index=frame.index)
+
+
+@derived("epoch_month")
+def _epoch_month(frame, cols):
+    # Months since 1970-01
+    months = cols["date_dt"].to_numpy(dtype="datetime64[M]").astype("int64")
+    return pd.Series(months.astype("int32"), index=frame.index)
+
+
+@derived("hour")
+def _hour(frame, cols):
+    return cols["date_dt"].dt.hour.astype("int8")
+
+
+@derived("profit_per_order")
+def _profit_per_order(frame, cols):
+    return frame["gross_margin"] - frame["marketing_cost"] - frame["opex_allocated"]
+
+
+@derived("user_code", row_local=False)
+def _user_code(frame, cols):
+    # Dense int32 user ids (-1 = missing). Categorical codes are free; not
+    # row-local because an appended piece has its own category order.
+    users = frame[cols.user_col]
+    if isinstance(users.dtype, pd.CategoricalDtype):
+        codes = users.cat.codes.to_numpy()
+    else:
+        codes = pd.factorize(users)[0]
+    return pd.Series(codes.astype("int32"), index=frame.index)
+
+
+@derived("first_order_date", row_local=False)
+def _first_order_date(frame, cols):
+    return cols["date_dt"].groupby(frame[cols.user_col], observed=True).transform("min")
+
+
+@derived("first_order_year_week", row_local=False)
+def _first_order_year_week(frame, cols):
+    # year_week is monotonic in time, so its per-user minimum is the
+    # year-week of the first order
+    return cols["year_week"].groupby(frame[cols.user_col], observed=True).transform("min")
+
+
+class DerivedColumns:
+    """Lazily computed, memoized derived columns for one dataset."""
+
+    def __init__(self, frame, fingerprint, user_col=None):
+        self.frame = frame
+        self.fingerprint = fingerprint
+        self.user_col = user_col
+        self._memo = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        col = self._memo.get(name)
+        if col is None:
+            if name not in DERIVED:
+                raise KeyError(f"unknown derived column: {name}")
+            # Sessions run in threads: build each column exactly once
+            with self._lock:
+                col = self._memo.get(name)
+                if col is None:
+                    col = DERIVED[name](self.frame, self).rename(name)
+                    self._memo[name] = col
+        return col
+
+    def computed(self):
+        return list(self._memo)
+
+    @staticmethod
+    def joined(frame, parts, fingerprint):
+        """Registry for frame = the frames of the registries `parts`, in order.
+
+        Row-local columns already computed over the first (largest) part are
+        extended with the later parts' values instead of being rebuilt over
+        the whole frame.
+        """
+        first = parts[0]
+        cols = DerivedColumns(frame, fingerprint, first.user_col)
+        for name, col in list(first._memo.items()):
+            if name in ROW_LOCAL:
+                cols._memo[name] = pd.concat([col] + [p[name] for p in parts[1:]], ignore_index=True)
+        return cols
+
+    def subset(self, frame, rows, fingerprint):
+        """Registry for frame = this frame's `rows` (a slice or positions).
+
+        Row-local columns and the dense user codes (same categories) already
+        computed here are taken instead of rebuilt; per-user columns are
+        recomputed over the subset on access.
+        """
+        cols = DerivedColumns(frame, fingerprint, self.user_col)
+        for name, col in list(self._memo.items()):
+            if name in ROW_LOCAL or name == "user_code":
+                cols._memo[name] = col.iloc[rows].reset_index(drop=True)
+        return cols
@@ -0,0 +1,176 @@
+"""Per-customer feature store, persisted next to the columnar cache.
+
+One row per customer id holds mergeable order aggregates: row count,
+revenue count and sum, first and last order time, promo count. Customers
+are integer-encoded (dictionary codes of the user column), so building the
+store is a bincount / scatter-min/max over codes instead of a groupby, and
+folding in appended rows only touches the customers those rows mention.
+
+The store is written to `<cache>/<stem>-customers.arrow` with the span of
+CSV bytes it covers, so a restart loads it instead of scanning the orders.
+Derived features (averages, recency, RFM scores, churn labels) depend on
+every customer and are computed from the store on read
+(metrics.customer_features).
+"""
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+_NAT = np.iinfo("int64").min
+_NO_FIRST = np.iinfo("int64").max
+
+# Aggregate columns, in file order
+AGGREGATES = ["orders", "revenue_n", "revenue_sum", "first_order", "last_order", "promo_sum", "promo_n"]
+
+
+@dataclass(frozen=True)
+class CustomerStore:
+    user_col: str
+    ids: pd.Index             # customer ids: category order, or sorted for plain columns
+    aggregates: pd.DataFrame  # AGGREGATES, aligned with ids; times as int64 ns (NaT = min)
+    sorted_ids: bool          # plain (non-categorical) user column: keep ids sorted
+
+
+def _user_codes(users):
+    """(int codes, -1 for missing; ids) of the user column."""
+    if isinstance(users.dtype, pd.CategoricalDtype):
+        return users.cat.codes.to_numpy().astype("int64"), pd.Index(users.cat.categories)
+    codes, uniques = pd.factorize(users, sort=True)
+    return codes.astype("int64"), pd.Index(uniques)
+
+
+def build_customers(frame, cols):
+    """Aggregate every row of frame per customer (one vectorized pass)."""
+    users = frame[cols.user_col]
+    codes, ids = _user_codes(users)
+    ok = codes >= 0
+    codes, n = codes[ok], len(ids)
+
+    revenue = frame["revenue"].to_numpy(dtype="float64", na_value=np.nan)[ok]
+    has_revenue = ~np.isnan(revenue)
+    promo = pd.to_numeric(frame["promo_used"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[ok]
+    has_promo = ~np.isnan(promo)
+
+    times = cols["date_dt"].to_numpy(dtype="datetime64[ns]").view("int64")[ok]
+    has_time = times != _NAT
+    first = np.full(n, _NO_FIRST, dtype="int64")
+    last = np.full(n, _NAT, dtype="int64")
+    np.minimum.at(first, codes[has_time], times[has_time])
+    np.maximum.at(last, codes[has_time], times[has_time])
+
+    aggregates = pd.DataFrame({
+        "orders": np.bincount(codes, minlength=n),
+        "revenue_n": np.bincount(codes[has_revenue], minlength=n),
+        "revenue_sum": np.bincount(codes[has_revenue], weights=revenue[has_revenue], minlength=n),
+        "first_order": np.where(first == _NO_FIRST, _NAT, first),
+        "last_order": last,
+        "promo_sum": np.bincount(codes[has_promo], weights=promo[has_promo], minlength=n),
+        "promo_n": np.bincount(codes[has_promo], minlength=n),
+    })
+    return CustomerStore(cols.user_col, ids, aggregates,
+                         sorted_ids=not isinstance(users.dtype, pd.CategoricalDtype))
+
+
+def _combine(name, a, b):
+    """Merge of one aggregate for the same customers."""
+    if name == "first_order":
+        # NaT (int64 min) must not win the minimum
+        return np.where(a == _NAT, b, np.where(b == _NAT, a, np.minimum(a, b)))
+    if name == "last_order":
+        return np.maximum(a, b)
+    return a + b
+
+
+def merge_customers(store, tail):
+    """store plus a store of newer rows; only the tail's customers change.
+
+    Unseen ids are appended (the order _concat_categorical gives categories);
+    plain id columns are kept sorted.
+    """
+    if store is None:
+        return tail
+    pos = store.ids.get_indexer(tail.ids)
+    seen = pos >= 0
+    at = pos[seen]
+
+    aggregates = {}
+    for name in AGGREGATES:
+        old, new = store.aggregates[name].to_numpy(), tail.aggregates[name].to_numpy()
+        col = np.concatenate([old, new[~seen]])
+        col[at] = _combine(name, old[at], new[seen])
+        aggregates[name] = col
+    ids = store.ids.append(tail.ids[~seen])
+    aggregates = pd.DataFrame(aggregates)
+
+    if store.sorted_ids and not ids.is_monotonic_increasing:
+        order = np.argsort(ids, kind="stable")
+        ids, aggregates = ids[order], aggregates.iloc[order].reset_index(drop=True)
+    return CustomerStore(store.user_col, ids, aggregates, store.sorted_ids)
+
+
+def aligned(store, ids):
+    """The store reordered to `ids` (the current frame's), or None if any is missing."""
+    if store.ids.equals(ids):
+        return store
+    pos = store.ids.get_indexer(ids)
+    if (pos < 0).any():
+        return None
+    return CustomerStore(store.user_col, ids, store.aggregates.iloc[pos].reset_index(drop=True),
+                         store.sorted_ids)
+
+
+def customer_orders(store):
+    """Per-customer order count, revenue, basket, first / last order, promo rate."""
+    agg = store.aggregates
+    keep = (agg["orders"] > 0).to_numpy()
+    agg = agg[keep]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            store.user_col: store.ids[keep],
+            "total_orders": agg["revenue_n"].to_numpy(),
+            "total_revenue": agg["revenue_sum"].to_numpy(),
+            "avg_basket": (agg["revenue_sum"] / agg["revenue_n"]).to_numpy(),
+            "first_order": agg["first_order"].to_numpy().view("datetime64[ns]"),
+            "last_order": agg["last_order"].to_numpy().view("datetime64[ns]"),
+            "promo_rate": (agg["promo_sum"] / agg["promo_n"]).to_numpy(),
+        })
+
+
+def orders_per_user(store):
+    agg = store.aggregates
+    keep = (agg["orders"] > 0).to_numpy()
+    return pd.Series(agg["orders"].to_numpy()[keep], index=store.ids[keep].rename(store.user_col))
+
+
+# ----------------------------
+# Persistence
+# ----------------------------
+def save_customers(store, path, key):
+    """Write the store with the cache span `key` it covers (write-then-rename)."""
+    table = pa.Table.from_pandas(store.aggregates.assign(**{store.user_col: np.asarray(store.ids)}),
+                                 preserve_index=False)
+    meta = {"key": json.dumps(key), "user_col": store.user_col,
+            "sorted_ids": json.dumps(store.sorted_ids)}
+    table = table.replace_schema_metadata(meta)
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+
+def load_customers(path, key):
+    """The store saved for exactly this cache span, else None."""
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if meta.get("key") != json.dumps(key):
+        return None
+    frame = table.to_pandas()
+    user_col = meta["user_col"]
+    return CustomerStore(user_col, pd.Index(frame[user_col]), frame[AGGREGATES],
+                         json.loads(meta["sorted_ids"]))
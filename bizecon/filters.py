@@ -0,0 +1,139 @@
+"""Global dashboard filters: date range, cities, marketing sources, promo flag.
+
+A Filters value narrows a Snapshot (Snapshot.filtered). Sections answered
+from pre-aggregates just drop cube cells, sketch cells or histogram days,
+which costs milliseconds at any row count. Row-level queries only locate
+their rows when a section first needs them, through a RowIndex:
+
+- the cache stores rows sorted by date (bizecon.store), so a date range is
+  two binary searches over the timestamps and selects a contiguous slice;
+  if appended rows broke the order, a stable argsort is searched instead,
+- cities, sources and the promo flag are matched on dictionary codes: one
+  lookup table per filter, gathered over the rows inside the date range.
+"""
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Sorts after every real timestamp, so rows without a date end up last
+_NO_DATE = np.iinfo("int64").max
+
+
+@dataclass(frozen=True)
+class Filters:
+    start: object = None  # first day (inclusive)
+    end: object = None    # last day (inclusive)
+    cities: tuple = ()
+    sources: tuple = ()
+    promo: object = None  # True / False, None for both
+
+    @property
+    def active(self):
+        return (self.start is not None or self.end is not None or bool(self.cities)
+                or bool(self.sources) or self.promo is not None)
+
+    @property
+    def dates_only(self):
+        return not (self.cities or self.sources or self.promo is not None)
+
+    def day_bounds(self):
+        """[lo, hi) as timestamps; hi is midnight after the last day."""
+        lo = pd.Timestamp(self.start) if self.start is not None else None
+        hi = pd.Timestamp(self.end).normalize() + pd.Timedelta(days=1) if self.end is not None else None
+        return lo, hi
+
+    def key(self):
+        """Stable text form, used to fingerprint filtered snapshots."""
+        return repr((str(self.start), str(self.end), sorted(self.cities), sorted(self.sources), self.promo))
+
+    def cube_mask(self, cube):
+        """Cube cells (day x city x source x promo) inside the filter."""
+        mask = np.ones(len(cube), dtype=bool)
+        lo, hi = self.day_bounds()
+        if lo is not None:
+            mask &= (cube["day"] >= lo).to_numpy()
+        if hi is not None:
+            mask &= (cube["day"] < hi).to_numpy()
+        if self.cities:
+            mask &= cube["city"].isin(self.cities).to_numpy()
+        if self.sources:
+            mask &= cube["marketing_source"].isin(self.sources).to_numpy()
+        if self.promo is not None:
+            mask &= (cube["promo_used"] == self.promo).to_numpy()
+        return mask
+
+
+def _codes(column):
+    """(int codes, -1 for missing; categories) of a column."""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), column.cat.categories
+    codes, uniques = pd.factorize(column)
+    return codes, pd.Index(uniques)
+
+
+class RowIndex:
+    """Date-sorted positions and dictionary codes for locating filtered rows.
+
+    Built on first use and shared by every filter over the same frame.
+    """
+
+    def __init__(self, frame, cols):
+        self.frame = frame
+        self.cols = cols
+        self._lock = threading.Lock()
+        self._dates = None   # (sorted int64 timestamps, row order or None if already sorted)
+        self._codes = {}
+
+    def _sorted_dates(self):
+        if self._dates is None:
+            with self._lock:
+                if self._dates is None:
+                    date = self.cols["date_dt"]
+                    keys = date.to_numpy(dtype="datetime64[ns]").view("int64")
+                    keys = np.where(date.isna().to_numpy(), _NO_DATE, keys)
+                    if len(keys) < 2 or bool((keys[1:] >= keys[:-1]).all()):
+                        self._dates = keys, None
+                    else:
+                        order = np.argsort(keys, kind="stable")
+                        self._dates = keys[order], order
+        return self._dates
+
+    def _column_codes(self, name):
+        found = self._codes.get(name)
+        if found is None:
+            with self._lock:
+                found = self._codes.get(name)
+                if found is None:
+                    found = self._codes[name] = _codes(self.frame[name])
+        return found
+
+    def _match(self, name, rows, values):
+        """Which of `rows` have `name` in values (one gather over their codes)."""
+        codes, categories = self._column_codes(name)
+        # Trailing False catches code -1 (missing)
+        allowed = np.append(categories.isin(values), False)
+        return allowed[codes[rows]]
+
+    def select(self, filters):
+        """Rows inside the filter: a slice when possible, else sorted positions."""
+        keys, order = self._sorted_dates()
+        lo, hi = filters.day_bounds()
+        first = np.searchsorted(keys, lo.value, "left") if lo is not None else 0
+        last = np.searchsorted(keys, hi.value, "left") if hi is not None else len(keys)
+
+        rows = slice(first, last) if order is None else np.sort(order[first:last])
+        if filters.dates_only:
+            return rows
+
+        mask = np.ones(last - first, dtype=bool)
+        if filters.cities:
+            mask &= self._match("city", rows, filters.cities)
+        if filters.sources:
+            mask &= self._match("marketing_source", rows, filters.sources)
+        if filters.promo is not None:
+            mask &= self._match("promo_used", rows, [filters.promo])
+        if order is None:
+            return first + np.flatnonzero(mask)
+        return rows[mask]
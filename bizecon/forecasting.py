@@ -0,0 +1,140 @@
+"""Shared forecasting service.
+
+Two engines produce the same ds / yhat / yhat_lower / yhat_upper output:
+"holt_winters" (bizecon.holtwinters, NumPy, milliseconds per series; the
+default) and "prophet" (optional dependency, higher fidelity, seconds).
+
+A series is fitted once per (data fingerprint, series, engine) and the fit
+is shared by every consumer: the revenue forecast at any horizon and the in-sample
+intervals the anomaly detector flags breaches of. The first request also
+predicts FORECAST_HORIZON days ahead, so any horizon up to that is a slice
+of one stored prediction; longer horizons predict from the same fit.
+
+Fits live in memory (a small LRU of MAX_SERIES entries). Concurrent
+requests for the same series wait for one fit instead of each running it.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from bizecon.holtwinters import fit_holt_winters
+
+ENGINES = ("holt_winters", "prophet")
+DEFAULT_ENGINE = "holt_winters"
+PROPHET_PARAMS = {
+    "yearly_seasonality": False,
+    "weekly_seasonality": True,
+    "daily_seasonality": False,
+    "changepoint_prior_scale": 0.3,
+    "seasonality_prior_scale": 10,
+}
+# Days predicted up front (the ML Lab horizon slider tops out here)
+FORECAST_HORIZON = 60
+MAX_SERIES = 16
+
+BAND_COLUMNS = ["yhat", "yhat_lower", "yhat_upper"]
+
+
+@dataclass(frozen=True)
+class FittedSeries:
+    history: pd.DataFrame   # ds / y the model was fitted on
+    model: object           # fitted prophet.Prophet or holtwinters.HoltWinters
+    forecast: pd.DataFrame  # ds + BAND_COLUMNS over the history and `horizon` days after it
+    horizon: int
+    engine: str = "prophet"
+
+    def predict(self, horizon):
+        """ds + BAND_COLUMNS over the history and `horizon` days after it."""
+        if horizon <= self.horizon:
+            return self.forecast.iloc[:len(self.history) + horizon]
+        if self.engine == "holt_winters":
+            return _holt_winters_frame(self.history, self.model, horizon)
+        return self.model.predict(self.model.make_future_dataframe(periods=horizon))[["ds"] + BAND_COLUMNS]
+
+    def in_sample(self):
+        """ds + BAND_COLUMNS over the fitted history only."""
+        return self.forecast.iloc[:len(self.history)]
+
+    def table(self, horizon):
+        """History (y) joined with the forecast (yhat) `horizon` days out."""
+        forecast = self.predict(horizon)
+        return self.history.set_index("ds")[["y"]].join(forecast.set_index("ds")[["yhat"]], how="outer")
+
+
+def fit_series(history, horizon=FORECAST_HORIZON, engine=DEFAULT_ENGINE):
+    """Fit `engine` on a ds / y frame and predict history + horizon days."""
+    if engine == "holt_winters":
+        return _fit_holt_winters(history, horizon)
+    if engine != "prophet":
+        raise ValueError(f"unknown forecast engine: {engine!r} (expected one of {ENGINES})")
+    from prophet import Prophet
+
+    model = Prophet(**PROPHET_PARAMS)
+    model.fit(history)
+    forecast = model.predict(model.make_future_dataframe(periods=horizon))
+    return FittedSeries(history, model, forecast[["ds"] + BAND_COLUMNS], horizon, engine)
+
+
+def _fit_holt_winters(history, horizon):
+    # The recursion steps one day at a time: days without orders are zero revenue
+    history = history.set_index("ds").asfreq("D", fill_value=0).reset_index()
+    model = fit_holt_winters(history["y"].to_numpy())
+    return FittedSeries(history, model, _holt_winters_frame(history, model, horizon), horizon, "holt_winters")
+
+
+def _holt_winters_frame(history, model, horizon):
+    past = np.stack(model.in_sample())[:, 0, :]
+    ahead = np.stack(model.forecast(horizon))[:, 0, :]
+    days = pd.date_range(history["ds"].iloc[-1], periods=horizon + 1, freq="D")[1:]
+    frame = pd.DataFrame(np.concatenate([past, ahead], axis=1).T, columns=BAND_COLUMNS)
+    frame.insert(0, "ds", np.concatenate([history["ds"].to_numpy(), days.to_numpy()]))
+    return frame
+
+
+class _Slot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fitted = None
+
+
+class ForecastService:
+    """Fitted series by key, each fitted at most once while it stays cached."""
+
+    def __init__(self, max_series=MAX_SERIES, horizon=FORECAST_HORIZON):
+        self.max_series = max_series
+        self.horizon = horizon
+        self._slots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot()
+            self._slots.move_to_end(key)
+            while len(self._slots) > self.max_series:
+                self._slots.popitem(last=False)
+        return slot
+
+    def fitted(self, key, history, engine=DEFAULT_ENGINE):
+        """The fit for key; history() builds the ds / y frame, only on a miss."""
+        slot = self._slot((key, engine))
+        # Fit outside the service lock: other series are not held up
+        with slot.lock:
+            if slot.fitted is None:
+                slot.fitted = fit_series(history(), self.horizon, engine)
+        return slot.fitted
+
+    def put(self, key, fitted):
+        """Store a fit made elsewhere (e.g. by a background job, see bizecon.jobs)."""
+        slot = self._slot((key, fitted.engine))
+        with slot.lock:
+            if slot.fitted is None:
+                slot.fitted = fitted
+
+
+# One service per process, shared by every session
+SERVICE = ForecastService()
@@ -0,0 +1,148 @@
+"""Additive Holt-Winters (ETS(A,Ad,A)) forecaster in vectorized NumPy.
+
+A Prophet-free fast path for the revenue forecast and its anomaly bands.
+Each series y_t is a level, a damped trend and a weekly seasonal term,
+updated from the one-step-ahead error e_t in error-correction form:
+
+    yhat_t = l + phi * b + s[t mod m]
+    l <- l + phi * b + alpha * e_t
+    b <- phi * b + beta * e_t
+    s[t mod m] <- s[t mod m] + gamma * e_t
+
+Smoothing parameters are not optimized iteratively: every combination of
+the PARAMETER_GRID is run at once (one array lane per combination and
+series) and the one with the smallest in-sample squared error wins, so a
+fit is one pass over the days whatever the number of series. Prediction
+intervals use the closed-form h-step variance of the ETS model with the
+residual standard deviation, at INTERVAL_WIDTH coverage (Prophet's
+default, so both engines' bands mean the same thing).
+"""
+from dataclasses import dataclass
+from statistics import NormalDist
+
+import numpy as np
+
+PERIOD = 7
+INTERVAL_WIDTH = 0.8
+
+# Candidate (alpha, beta, gamma, phi) values; see _grid for the constraints
+PARAMETER_GRID = {
+    "alpha": (0.05, 0.1, 0.2, 0.3, 0.5, 0.8),
+    "beta": (0.0, 0.01, 0.05, 0.1),
+    "gamma": (0.0, 0.05, 0.1, 0.2, 0.4),
+    "phi": (0.9, 0.95, 0.98, 1.0),
+}
+
+
+@dataclass(frozen=True)
+class HoltWinters:
+    """Fitted state of one or more series (leading axis)."""
+    alpha: np.ndarray   # (series,) chosen smoothing parameters
+    beta: np.ndarray
+    gamma: np.ndarray
+    phi: np.ndarray
+    period: int
+    level: np.ndarray   # (series,) state after the last observation
+    trend: np.ndarray
+    season: np.ndarray  # (series, period); column i applies i + 1 steps ahead (mod period)
+    sigma: np.ndarray   # (series,) one-step residual standard deviation
+    fitted: np.ndarray  # (series, days) one-step-ahead in-sample predictions
+
+    def forecast(self, horizon, width=INTERVAL_WIDTH):
+        """(mean, lower, upper), each (series, horizon), for 1..horizon steps ahead."""
+        steps = np.arange(1, horizon + 1)
+        phi = self.phi[:, None]
+        # phi + phi^2 + ... + phi^h per step
+        damped = np.cumsum(phi ** steps[None, :], axis=1)
+        mean = (self.level[:, None] + damped * self.trend[:, None]
+                + self.season[:, (steps - 1) % self.period])
+
+        # Var(h) = sigma^2 (1 + sum_{j<h} c_j^2), c_j = alpha + beta phi_j + gamma [m | j]
+        c = (self.alpha[:, None] + self.beta[:, None] * damped
+             + self.gamma[:, None] * (steps % self.period == 0)[None, :])
+        spread = np.sqrt(1 + np.concatenate([np.zeros((len(c), 1)), np.cumsum(c * c, axis=1)[:, :-1]], axis=1))
+        half = _z(width) * self.sigma[:, None] * spread
+        return mean, mean - half, mean + half
+
+    def in_sample(self, width=INTERVAL_WIDTH):
+        """(fitted, lower, upper), each (series, days): one-step bands over the history."""
+        half = _z(width) * self.sigma[:, None]
+        return self.fitted, self.fitted - half, self.fitted + half
+
+
+def _z(width):
+    return NormalDist().inv_cdf((1 + width) / 2)
+
+
+def _grid(period):
+    """Flattened parameter combinations with beta <= alpha and gamma <= 1 - alpha."""
+    gammas = PARAMETER_GRID["gamma"] if period > 1 else (0.0,)
+    alpha, beta, gamma, phi = (a.ravel() for a in np.meshgrid(
+        PARAMETER_GRID["alpha"], PARAMETER_GRID["beta"], gammas, PARAMETER_GRID["phi"], indexing="ij"))
+    keep = (beta <= alpha) & (gamma <= 1 - alpha)
+    return alpha[keep], beta[keep], gamma[keep], phi[keep]
+
+
+def _initial_state(y, period):
+    """Level, trend and seasonal terms from the first two seasons."""
+    if period == 1:
+        return y[:, 0].copy(), np.zeros(len(y)), np.zeros((len(y), 1))
+    first, second = y[:, :period].mean(axis=1), y[:, period:2 * period].mean(axis=1)
+    return first, (second - first) / period, y[:, :period] - first[:, None]
+
+
+def _smooth(y, period, alpha, beta, gamma, phi, record=False):
+    """Run the recursion for params broadcast to (series, lanes).
+
+    Returns (sse, level, trend, season, fitted); season is (period, series,
+    lanes) and fitted is None unless record.
+    """
+    n_series, n_days = y.shape
+    lanes = np.broadcast_shapes(alpha.shape, (n_series, 1))[1]
+    l0, b0, s0 = _initial_state(y, period)
+    level = np.repeat(l0[:, None], lanes, axis=1)
+    trend = np.repeat(b0[:, None], lanes, axis=1)
+    # Phase-major, so each step updates one contiguous (series, lanes) block
+    season = np.repeat(s0.T[:, :, None], lanes, axis=2)
+    sse = np.zeros((n_series, lanes))
+    fitted = np.empty((n_days, n_series, lanes)) if record else None
+
+    for t in range(n_days):
+        s_t = season[t % period]
+        damped = phi * trend
+        pred = level + damped + s_t
+        err = y[:, t, None] - pred
+        if record:
+            fitted[t] = pred
+        sse += err * err
+        level += damped + alpha * err
+        trend = damped + beta * err
+        s_t += gamma * err
+    return sse, level, trend, season, fitted
+
+
+def fit_holt_winters(y, period=PERIOD):
+    """Fit every row of y (series x days, or one 1-D series) on a regular grid.
+
+    Series shorter than two periods are fitted without seasonality.
+    """
+    y = np.atleast_2d(np.asarray(y, dtype="float64"))
+    n_series, n_days = y.shape
+    if n_days < 2:
+        raise ValueError("Holt-Winters needs at least two observations")
+    if n_days < 2 * period:
+        period = 1
+
+    # Every parameter combination at once, then rerun each series' best one
+    grid = _grid(period)
+    sse = _smooth(y, period, *(p[None, :] for p in grid))[0]
+    best = np.argmin(sse, axis=1)
+    alpha, beta, gamma, phi = (p[best] for p in grid)
+    sse, level, trend, season, fitted = _smooth(y, period, *(p[:, None] for p in (alpha, beta, gamma, phi)),
+                                                record=True)
+
+    # Season column i applies i + 1 steps after the last day
+    season = np.roll(season[:, :, 0].T, -(n_days % period), axis=1)
+    return HoltWinters(alpha=alpha, beta=beta, gamma=gamma, phi=phi, period=period,
+                       level=level[:, 0], trend=trend[:, 0], season=season,
+                       sigma=np.sqrt(sse[:, 0] / n_days), fitted=fitted[:, :, 0].T)
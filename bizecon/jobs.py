@@ -0,0 +1,160 @@
+"""Background job runner for ML Lab training.
+
+Model fits run in a process pool instead of the Streamlit script thread, so
+a rerun renders immediately and polls for results. One JobRunner is shared
+by every session of a server process:
+
+- jobs are keyed by (name, version), version being the data fingerprint;
+  submitting a key that is queued, running or finished returns that job, so
+  concurrent sessions asking for the same fit share one run,
+- finished jobs stay in a bounded result store (MAX_RESULTS, oldest first
+  out); a failed job is resubmitted when asked to retry it, and once
+  without asking when its worker died (e.g. killed out of memory), so one
+  transient failure does not stick to its key,
+- latest(name, scope) is the newest successful result of a job name
+  whatever its version, which the app shows (marked stale) while the
+  current version is still being computed. The scope (e.g. the filters a
+  fit was computed under) keeps a stale result from coming from a
+  different slice of the data, or from another session's slice.
+
+Jobs must be module-level functions with picklable arguments and results.
+Workers are spawned rather than forked, since the server is multithreaded.
+A job does not start a process pool of its own (see in_worker()): the
+runner's pool is the parallelism, and nested pools would multiply it.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+JOB_WORKERS = int(os.environ.get("BIZECON_JOB_WORKERS", "0")) or os.cpu_count() or 1
+MAX_RESULTS = 64
+
+
+def in_worker():
+    """True inside a job worker: code that would start its own pool runs inline there."""
+    return multiprocessing.parent_process() is not None
+
+
+@dataclass
+class Job:
+    name: str
+    version: str
+    future: object
+    submitted: float = field(default_factory=time.monotonic)
+    finished: float = None
+    attempt: int = 1
+    scope: str = None
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    @property
+    def status(self):
+        """"queued", "running", "done" or "failed"."""
+        if self.future.done():
+            failed = self.future.cancelled() or self.future.exception() is not None
+            return "failed" if failed else "done"
+        return "running" if self.future.running() else "queued"
+
+    def elapsed(self):
+        """Seconds since submission (until completion once finished)."""
+        return (self.finished or time.monotonic()) - self.submitted
+
+    @property
+    def error(self):
+        """The exception a failed job raised (None unless failed)."""
+        if not self.future.done():
+            return None
+        if self.future.cancelled():
+            return BrokenProcessPool("job cancelled")
+        return self.future.exception()
+
+    def result(self):
+        """The job's return value; re-raises its exception if it failed."""
+        return self.future.result()
+
+
+class JobRunner:
+    """Deduplicating process-pool job queue with a bounded result store."""
+
+    def __init__(self, workers=JOB_WORKERS, max_results=MAX_RESULTS):
+        self.workers = workers
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        self._pool = None
+        self._jobs = OrderedDict()  # (name, version) -> Job, oldest first
+        self._latest = {}           # (name, scope) -> newest successful Job
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def submit(self, name, version, fn, *args, scope=None, retry=False):
+        """The job for (name, version), submitting fn(*args) if there is none yet.
+
+        A failed job is returned as is (so it can be shown) unless `retry`,
+        or unless it failed on its first attempt because its worker died;
+        either way it is replaced by a fresh submission.
+        """
+        key = (name, version)
+        attempt = 1
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status == "failed":
+                crashed = isinstance(job.error, BrokenProcessPool) and job.attempt == 1
+                if retry or crashed:
+                    del self._jobs[key]
+                    attempt, job = job.attempt + 1, None
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job
+            try:
+                future = self._executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. out of memory): start a fresh pool
+                self._pool = None
+                future = self._executor().submit(fn, *args)
+            job = self._jobs[key] = Job(name, version, future, attempt=attempt, scope=scope)
+            self._evict()
+        future.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    def _finished(self, job):
+        job.finished = time.monotonic()
+        if job.status == "done":
+            with self._lock:
+                latest = self._latest.get((job.name, job.scope))
+                if latest is None or latest.submitted <= job.submitted:
+                    self._latest[job.name, job.scope] = job
+
+    def _evict(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(self._jobs) - self.max_results)]:
+            del self._jobs[key]
+
+    def get(self, name, version):
+        with self._lock:
+            return self._jobs.get((name, version))
+
+    def latest(self, name, scope=None):
+        """Newest successful job named `name` in `scope` (any version), or None."""
+        with self._lock:
+            return self._latest.get((name, scope))
+
+    def pending(self):
+        """Jobs still queued or running."""
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done]
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,322 @@
+"""Business metrics over a dataset snapshot, with no Streamlit dependency.
+
+Every function takes a bizecon.dataset.Snapshot (rollup cube, sketches and a
+query backend for row-level scans) and returns plain numbers, DataFrames or
+small frozen result objects. The Streamlit app only renders these; batch
+jobs, services and benchmarks call them directly:
+
+    from bizecon.dataset import Dataset
+    from bizecon import metrics
+
+    snap = Dataset("data/transactions.csv").snapshot()
+    print(metrics.kpis(snap).net_profit)
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from bizecon import cohorts, features, quantiles, scenarios, sketches
+from bizecon.backends import filter_mask
+from bizecon.cube import measure_mean, rollup
+
+
+# ----------------------------
+# Result types
+# ----------------------------
+@dataclass(frozen=True)
+class KPIs:
+    total_revenue: float
+    total_cogs: float
+    total_gross_margin: float
+    total_opex: float
+    total_marketing_cost: float
+    net_profit: float
+    best_city: str
+    top_marketing_source: str
+    avg_basket_size: float
+    avg_cac: float
+    loss_order_pct: float
+    promo_margin: float
+    nonpromo_margin: float
+
+
+@dataclass(frozen=True)
+class ProKPIs:
+    cac: float
+    ltv: float
+    ltv_cac_ratio: float
+    repeat_rate: float
+    dau: float
+    mau: float
+    stickiness: float
+    arpu: float
+    users: float
+    distinct_error: float  # relative standard error of the user counts (0 = exact)
+
+
+@dataclass(frozen=True)
+class ProfitStats:
+    orders: int
+    loss_share: float
+    minimum: float
+    maximum: float
+    percentiles: pd.Series  # profit per order at each quantile, within 1%
+
+
+@dataclass(frozen=True)
+class WhatIf:
+    revenue: float
+    gross_margin: float
+
+
+@dataclass(frozen=True)
+class UserSegments:
+    one_time: int
+    repeat: int
+
+
+# Flat gross-margin rate assumed by the what-if projection
+SIMULATOR_GM_RATE = 0.25
+
+# MAU (and the DAU averaged against it) covers the last days of the range
+MAU_WINDOW_DAYS = 30
+
+
+# ----------------------------
+# Headline KPIs (answered from the rollup cube)
+# ----------------------------
+def kpis(snap):
+    totals = rollup(snap.cube)
+    city_margin = measure_mean(rollup(snap.cube, "city"), "gross_margin")
+    by_source = rollup(snap.cube, "marketing_source")
+    by_promo = measure_mean(rollup(snap.cube, "promo_used"), "gross_margin")
+
+    return KPIs(
+        total_revenue=totals["revenue"],
+        total_cogs=totals["cogs"],
+        total_gross_margin=totals["gross_margin"],
+        total_opex=totals["opex_allocated"],
+        total_marketing_cost=totals["marketing_cost"],
+        net_profit=totals["gross_margin"] - totals["opex_allocated"] - totals["marketing_cost"],
+        best_city=city_margin.idxmax(),
+        top_marketing_source=by_source["revenue"].idxmax(),
+        avg_basket_size=measure_mean(totals, "revenue"),
+        avg_cac=measure_mean(totals, "marketing_cost"),
+        loss_order_pct=totals["loss_orders"] / totals["orders"] * 100,
+        promo_margin=by_promo.get(True, np.nan),
+        nonpromo_margin=by_promo.get(False, np.nan),
+    )
+
+
+def daily_trend(snap):
+    """Daily revenue and gross margin, indexed by day."""
+    return rollup(snap.cube, "day")[["revenue", "gross_margin"]]
+
+
+def city_revenue(snap):
+    return rollup(snap.cube, "city")["revenue"].reset_index()
+
+
+def marketing_performance(snap):
+    """Spend, orders, revenue, margin, CAC and ROI per marketing source."""
+    by_source = rollup(snap.cube, "marketing_source")
+    stats = pd.DataFrame({
+        "total_spend": by_source["marketing_cost"],
+        "orders": by_source["marketing_cost_n"],
+        "revenue": by_source["revenue"],
+        "gross_margin": by_source["gross_margin"]
+    }).reset_index()
+
+    stats["CAC"] = stats["total_spend"] / stats["orders"]
+    stats["ROI"] = (stats["gross_margin"] - stats["total_spend"]) / stats["total_spend"]
+    return stats
+
+
+def auto_insights(k):
+    """Plain-language health checks from a KPIs result."""
+    insights = []
+
+    if k.avg_cac > 120:
+        insights.append(f"🔴 Average CAC is high at ₹{k.avg_cac:.2f}. Paid channels need tightening.")
+    else:
+        insights.append(f"🟢 CAC is healthy at ₹{k.avg_cac:.2f} for this mix.")
+
+    if k.loss_order_pct > 25:
+        insights.append(f"🔴 {k.loss_order_pct:.1f}% of orders are unprofitable. Either pricing, fees, or OPEX is off.")
+    else:
+        insights.append(f"🟢 Only {k.loss_order_pct:.1f}% of orders lose money. Unit economics are reasonably under control.")
+
+    insights.append(f"🏙️ {k.best_city} is your strongest margin city. Consider concentrating marketing there.")
+
+    if k.promo_margin < k.nonpromo_margin * 0.8:
+        insights.append("🔴 Promo-driven orders are dragging margins hard. Discounts are too aggressive.")
+    else:
+        insights.append("🟢 Promo impact on gross margin looks acceptable at current levels.")
+
+    return insights
+
+
+# ----------------------------
+# Profit + simulators
+# ----------------------------
+def _profit_sketch(snap):
+    if snap.profit_sketch is not None:
+        return snap.profit_sketch
+    return snap.backend.profit_sketch()
+
+
+def profit_distribution(snap, bins=30, start=None, end=None):
+    """Bucketed profit-per-order counts over every order in [start, end]."""
+    counts, lo, hi = quantiles.select(_profit_sketch(snap), start, end)
+    if counts.sum() == 0:
+        return pd.Series(dtype="int64")
+
+    hist, bin_edges = quantiles.histogram(counts, lo, hi, bins)
+    return pd.Series(hist, index=[f"{int(bin_edges[i])} to {int(bin_edges[i+1])}" for i in range(len(hist))])
+
+
+def profit_stats(snap, qs=(0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99), start=None, end=None):
+    """Percentiles, range and loss-making share of profit per order."""
+    counts, lo, hi = quantiles.select(_profit_sketch(snap), start, end)
+    orders = int(counts.sum())
+    return ProfitStats(
+        orders=orders,
+        loss_share=counts[:quantiles.ZERO_BUCKET].sum() / orders if orders else np.nan,
+        minimum=lo,
+        maximum=hi,
+        percentiles=pd.Series(quantiles.quantiles(counts, lo, hi, qs), index=list(qs), name="profit_per_order"),
+    )
+
+
+def scenario_inputs(snap, aov_range, cac_range, opex_range):
+    """(OrderSample, SensitivityGrid) for the Monte-Carlo simulator (bizecon.scenarios).
+
+    Both are computed once per dataset; simulate() then runs per slider move.
+    """
+    sample = scenarios.order_sample(snap.backend)
+    return sample, scenarios.sensitivity_grid(sample, aov_range, cac_range, opex_range)
+
+
+def what_if(snap, conv_rate_increase):
+    """Projected revenue and margin if conversion rises by conv_rate_increase %."""
+    totals = rollup(snap.cube)
+    new_orders = totals["orders"] * (1 + conv_rate_increase / 100)
+    new_revenue = measure_mean(totals, "revenue") * new_orders
+    return WhatIf(revenue=new_revenue, gross_margin=new_revenue * SIMULATOR_GM_RATE)
+
+
+# ----------------------------
+# User-level metrics
+# ----------------------------
+def pro_kpis(snap, start=None, end=None, cities=None, sources=None, exact=False):
+    """Unit economics and engagement for a day range and city / source filter.
+
+    DAU is the mean daily active users and MAU the distinct users over the
+    last MAU_WINDOW_DAYS of the range (stickiness = DAU / MAU); ARPU and
+    the repeat rate are per distinct user over the whole range. Distinct
+    users come from the HyperLogLog sketches unless exact=True (or the
+    dataset has no sketches), in which case the backend scans the orders.
+    """
+    cube = snap.cube[filter_mask(snap.cube, start, end, cities, sources)]
+    totals = rollup(cube)
+    with np.errstate(invalid="ignore"):
+        # NaN for a filter that matches no orders
+        cac = measure_mean(totals, "marketing_cost")
+        aov = measure_mean(totals, "revenue")
+
+    if len(cube) == 0:
+        last_day = window_start = pd.Timestamp(start or 0)
+    else:
+        last_day = cube["day"].max()
+        window_start = last_day - pd.Timedelta(days=MAU_WINDOW_DAYS - 1)
+        if start is not None:
+            window_start = max(window_start, pd.Timestamp(start))
+    window_days = max((last_day - window_start).days + 1, 1)
+
+    if exact or snap.sketches is None:
+        users, daily, mau = snap.backend.active_users(start, end, cities, sources, window_start)
+        error = 0.0
+    else:
+        sk = snap.sketches
+        users = sketches.distinct_users(sk, sketches.cell_mask(sk, start, end, cities, sources))
+        window = sketches.cell_mask(sk, window_start, end, cities, sources)
+        daily = sketches.daily_users(sk, window)
+        mau = sketches.distinct_users(sk, window)
+        error = sk.relative_error
+
+    dau = daily.sum() / window_days
+    repeat_rate = totals["orders"] / users if users > 0 else 0
+    ltv = aov * repeat_rate
+    return ProKPIs(
+        cac=cac,
+        ltv=ltv,
+        ltv_cac_ratio=ltv / cac if cac > 0 else 0,
+        repeat_rate=repeat_rate,
+        dau=dau,
+        mau=mau,
+        stickiness=dau / mau if mau > 0 else 0,
+        arpu=totals["revenue"] / users if users > 0 else 0,
+        users=users,
+        distinct_error=error,
+    )
+
+
+def cohort_matrix(snap, grain="week", value="users"):
+    """Cohort x periods-since-first-order retention (see bizecon.cohorts)."""
+    return cohorts.retention(snap, grain, value)
+
+
+def user_segments(snap):
+    if snap.customers is not None:
+        user_freq = features.orders_per_user(snap.customers)
+    else:
+        user_freq = snap.backend.orders_per_user()
+    return UserSegments(one_time=int((user_freq == 1).sum()), repeat=int((user_freq >= 2).sum()))
+
+
+def customer_features(snap):
+    """Per-customer order stats, RFM scores and hybrid churn labels."""
+    # The persisted customer store covers every row; filtered views aggregate
+    if snap.customers is not None:
+        cust = features.customer_orders(snap.customers)
+    else:
+        cust = snap.backend.customer_orders()
+
+    cust["days_since_first"] = (cust["last_order"] - cust["first_order"]).dt.days
+    cust["days_since_last"] = (snap.backend.last_order_time() - cust["last_order"]).dt.days
+
+    # -------- RFM SCORING --------
+    # Recency: days since last order
+    cust["R_score"] = pd.qcut(cust["days_since_last"], 4, labels=[4,3,2,1]).astype(int)
+
+    # Frequency: total orders
+    cust["F_score"] = pd.qcut(cust["total_orders"].rank(method="first"), 4, labels=[1,2,3,4]).astype(int)
+
+    # Monetary: total revenue
+    cust["M_score"] = pd.qcut(cust["total_revenue"].rank(method="first"), 4, labels=[1,2,3,4]).astype(int)
+
+    # Weighted RFM composite
+    cust["RFM"] = (cust["R_score"]*0.5) + (cust["F_score"]*0.25) + (cust["M_score"]*0.25)
+
+    # RFM-based churn label before adaptive logic
+    cust["rfm_churn"] = (cust["RFM"] <= cust["RFM"].median()).astype(int)
+
+    # -------- HYBRID CHURN MODEL (RFM + Behavioral) --------
+    churn_days = max(7, int(cust["days_since_last"].quantile(0.70)))
+
+    cust["behavior_churn"] = (
+        (cust["days_since_last"] >= churn_days) &
+        (cust["total_orders"] <= cust["total_orders"].median())
+    ).astype(int)
+
+    # Combine RFM churn + behavioral churn
+    cust["churned"] = (
+        (cust["rfm_churn"] + cust["behavior_churn"]) >= 1
+    ).astype(int)
+
+    # Safety fallback
+    if cust["churned"].nunique() < 2:
+        cust["churned"] = cust["behavior_churn"]
+
+    return cust
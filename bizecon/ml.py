@@ -0,0 +1,257 @@
+"""ML Lab computations: churn and LTV models, revenue forecast, anomaly flags.
+
+Like bizecon.metrics these are pure functions with no Streamlit dependency.
+scikit-learn and Prophet are imported inside the functions that need them,
+so importing this module stays cheap. Forecasts come from bizecon.forecasting
+(NumPy Holt-Winters by default, Prophet optionally), rolling anomaly
+scores from bizecon.anomalies and per-order scores from bizecon.outliers.
+Fitted churn, LTV and order-outlier models are kept in the on-disk model
+registry (bizecon.registry) when the caller passes the data fingerprint.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from bizecon import anomalies, forecasting, multiseries, outliers, registry
+from bizecon.store import CSV_PATH, scores_path
+
+CHURN_FEATURES = ["total_orders","total_revenue","avg_basket","promo_rate","days_since_first","days_since_last"]
+LTV_FEATURES = ["total_orders","avg_basket","promo_rate","days_since_first"]
+
+
+@dataclass(frozen=True)
+class ChurnResult:
+    accuracy: float
+    precision: float
+    recall: float
+    churn_probability: pd.Series
+    top_risk: pd.DataFrame
+
+
+@dataclass(frozen=True)
+class LTVResult:
+    mae: float
+    rmse: float
+    ltv_pred: pd.Series
+    top_ltv: pd.DataFrame
+
+
+@dataclass(frozen=True)
+class AnomalyResult:
+    daily_ops: pd.DataFrame
+    flag_cols: list
+    flagged: pd.DataFrame
+    summary: pd.DataFrame
+
+
+# ----------------------------
+# Churn & LTV
+# ----------------------------
+# Hyperparameters are part of the model registry key (bizecon.registry)
+CHURN_PARAMS = {"max_iter": 400}
+LTV_PARAMS = {"n_estimators": 80, "random_state": 42}
+
+
+def _fit_churn(X, y):
+    from sklearn.model_selection import train_test_split
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import accuracy_score, precision_score, recall_score
+
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=42)
+    churn_model = LogisticRegression(**CHURN_PARAMS)
+    churn_model.fit(Xtr, ytr)
+    pred = churn_model.predict(Xte)
+    scores = {"accuracy": accuracy_score(yte,pred),
+              "precision": precision_score(yte,pred),
+              "recall": recall_score(yte,pred)}
+    return churn_model, scores
+
+
+def train_churn(cust, user_col, fingerprint=None):
+    """Logistic churn model on customer_features(); None if labels don't vary.
+
+    With the fingerprint of the data cust was built from, the fitted model
+    is kept in (and served from) the model registry.
+    """
+    if cust["churned"].nunique() < 2:
+        return None
+
+    X = cust[CHURN_FEATURES].fillna(0)
+    y = cust["churned"]
+    churn_model, scores = registry.fitted("churn", fingerprint, CHURN_FEATURES, CHURN_PARAMS,
+                                          _fit_churn, X, y)
+
+    proba = pd.Series(churn_model.predict_proba(X)[:,1], index=cust.index, name="churn_probability")
+    top = cust.assign(churn_probability=proba).sort_values("churn_probability", ascending=False)
+    top = top.head(5)[[user_col,"churn_probability","total_orders","total_revenue"]]
+
+    return ChurnResult(churn_probability=proba, top_risk=top, **scores)
+
+
+def _fit_ltv(X, y):
+    from sklearn.model_selection import train_test_split
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error, mean_squared_error
+
+    Xtr, Xte, ytr, yte = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = RandomForestRegressor(**LTV_PARAMS)
+    model.fit(Xtr, ytr)
+    pred = model.predict(Xte)
+    scores = {"mae": mean_absolute_error(yte,pred),
+              "rmse": mean_squared_error(yte,pred)**0.5}
+    return model, scores
+
+
+def train_ltv(cust, user_col, fingerprint=None):
+    """RandomForest LTV model on customer_features(); None if too few customers.
+
+    fingerprint: as for train_churn.
+    """
+    if len(cust) <= 5:
+        return None
+
+    Xl = cust[LTV_FEATURES].fillna(0)
+    yl = cust["total_revenue"]
+    model, scores = registry.fitted("ltv", fingerprint, LTV_FEATURES, LTV_PARAMS, _fit_ltv, Xl, yl)
+
+    ltv_pred = pd.Series(model.predict(Xl), index=cust.index, name="ltv_pred")
+    top = cust.assign(ltv_actual=cust["total_revenue"], ltv_pred=ltv_pred)
+    top = top.sort_values("ltv_pred", ascending=False).head(5)[[user_col,"ltv_actual","ltv_pred"]]
+
+    return LTVResult(ltv_pred=ltv_pred, top_ltv=top, **scores)
+
+
+# ----------------------------
+# Revenue forecast
+# ----------------------------
+def daily_revenue(snap):
+    """Daily revenue as a Prophet-style ds / y frame."""
+    daily = snap.cube.groupby("day")["revenue"].sum().reset_index()
+    daily.columns = ["ds", "y"]
+    return daily
+
+
+def revenue_forecast(snap, horizon, engine=forecasting.DEFAULT_ENGINE):
+    """History (y) joined with a forecast (yhat) `horizon` days out."""
+    return revenue_model(snap, engine).table(horizon)
+
+
+def revenue_bands(snap, engine=forecasting.DEFAULT_ENGINE):
+    """In-sample yhat / yhat_lower / yhat_upper per day of revenue history."""
+    return revenue_model(snap, engine).in_sample()
+
+
+def revenue_model(snap, engine=forecasting.DEFAULT_ENGINE):
+    """The shared fit of daily revenue (bizecon.forecasting)."""
+    return forecasting.SERVICE.fitted((snap.fingerprint, "revenue"), lambda: daily_revenue(snap), engine)
+
+
+def segment_forecasts(snap, engine=forecasting.DEFAULT_ENGINE):
+    """Revenue forecasts per city, source and city x source (bizecon.multiseries)."""
+    return multiseries.forecast_cube(snap.cube, engine=engine)
+
+
+# ----------------------------
+# Anomaly detection
+# ----------------------------
+def daily_operations(snap):
+    """Daily revenue, mean profit per order and mean CAC."""
+    return snap.backend.daily_operations()
+
+
+def detect_anomalies(snap, min_days=10, engine=forecasting.DEFAULT_ENGINE):
+    """IsolationForest, rolling / EWMA z-score, rolling MAD and forecast-interval flags per day.
+
+    Returns None when there are fewer than min_days days of history. engine
+    picks the forecaster whose in-sample bands flagForecast checks.
+    """
+    daily_ops = daily_operations(snap)
+    if len(daily_ops) < min_days:
+        return None
+    # Same fit as the revenue forecast (bizecon.forecasting)
+    try:
+        bands = revenue_bands(snap, engine)
+    except Exception:
+        bands = None
+    return flag_anomalies(daily_ops, bands)
+
+
+def segment_anomalies(snap, segment_thresholds=None, detectors=anomalies.DEFAULT_DETECTORS):
+    """Sparse rolling-detector flags for every city, source and city x source series."""
+    return anomalies.detect(anomalies.segment_matrix(snap.cube), segment_thresholds, detectors)
+
+
+def transaction_anomalies(snap, path=None, top_n=outliers.TOP_N, workers=None):
+    """IsolationForest score of every order and the top_n outliers (bizecon.outliers).
+
+    Scores go to `path`, by default the data version's file next to the cache.
+    """
+    path = path or scores_path(CSV_PATH, snap.fingerprint, backend=snap.backend.name)
+    return outliers.score_orders(snap.backend, snap.cube, path, snap.fingerprint, top_n, workers)
+
+
+def scan_transaction_anomalies(csv_path, version, filters, cube, fingerprint, top_n=outliers.TOP_N):
+    """transaction_anomalies() as a background job (bizecon.jobs).
+
+    The worker opens the cached orders of data version `version` itself
+    (bizecon.dataset.order_backend) instead of receiving them, narrowed by
+    filters (None: all orders); cube and fingerprint are the filtered
+    snapshot's.
+    """
+    from bizecon.dataset import order_backend
+
+    backend = order_backend(csv_path, version, filters)
+    path = scores_path(csv_path, fingerprint, backend=backend.name)
+    return outliers.score_orders(backend, cube, path, fingerprint, top_n)
+
+
+def flag_anomalies(daily_ops, bands=None):
+    """detect_anomalies() over daily_operations() and in-sample revenue bands.
+
+    bands (ds + yhat / yhat_lower / yhat_upper, see revenue_bands) may be
+    None (e.g. the fit failed); flagForecast is then all False.
+    """
+    from sklearn.ensemble import IsolationForest
+
+    daily_ops = daily_ops.copy()
+
+    # ---------------- Isolation Forest
+    iso = IsolationForest(contamination=0.06, random_state=42)
+    iso_input = daily_ops[["revenue", "profit", "cac"]].fillna(0)
+    try:
+        daily_ops["flagIso"] = iso.fit_predict(iso_input) == -1
+    except Exception:
+        daily_ops["flagIso"] = False
+
+    # ---------------- Rolling z-score, EWMA z-score & rolling MAD flags
+    # Trailing baselines (bizecon.anomalies), so a trend is not an anomaly
+    values = daily_ops[["revenue", "profit", "cac"]].to_numpy(dtype="float64").T
+    for detector, prefix in (("rolling_z", "flagZ"), ("ewma_z", "flagEwma"), ("rolling_mad", "flagMad")):
+        scores = anomalies.SCORERS[detector](values)
+        for row, metric in enumerate(["Revenue", "Profit", "Cac"]):
+            daily_ops[prefix + metric] = np.abs(scores[row]) > anomalies.THRESHOLDS[detector]
+
+    # ---------------- Forecast interval breach (revenue only)
+    if bands is not None:
+        fc = bands.rename(columns={"ds":"date_dt"})
+        merged = daily_ops.merge(fc, on="date_dt", how="left")
+        merged["flagForecast"] = (merged["revenue"] < merged["yhat_lower"]) | (merged["revenue"] > merged["yhat_upper"])
+        daily_ops = merged
+    else:
+        # if the forecast fails, mark no interval flags but continue
+        daily_ops["flagForecast"] = False
+
+    # ---------------- Combined alert
+    flag_cols = [c for c in daily_ops.columns if str(c).startswith("flag")]
+    daily_ops["any_flag"] = daily_ops[flag_cols].any(axis=1)
+
+    summary = pd.DataFrame(
+        [(col, int(daily_ops[col].sum())) for col in flag_cols], columns=["Detector","Count"]
+    )
+    return AnomalyResult(
+        daily_ops=daily_ops,
+        flag_cols=flag_cols,
+        flagged=daily_ops[daily_ops["any_flag"]].copy(),
+        summary=summary,
+    )
@@ -0,0 +1,133 @@
+"""Batch revenue forecasts for every city, marketing source and city x source.
+
+All daily series come from one groupby over the rollup cube (never the
+transactions): the city x source series form a dense series x days matrix
+(days without orders are zero), and the per-city, per-source and total
+series are sums of its rows. The fast engine fits the whole matrix as one
+vectorized Holt-Winters batch (in BATCH_SIZE-series chunks to bound
+memory); Prophet fits one series per task across a process pool, or one
+after another inside a background job's worker, whose pool already runs
+one job per core (bizecon.jobs.in_worker).
+
+Forecasts land in one long, columnar table (series, ds, y, yhat,
+yhat_lower, yhat_upper) that the dashboard slices per series.
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from bizecon.forecasting import BAND_COLUMNS, DEFAULT_ENGINE, FORECAST_HORIZON, fit_series
+from bizecon.holtwinters import fit_holt_winters
+from bizecon.jobs import JOB_WORKERS, in_worker
+
+LEVELS = ("total", "city", "marketing_source", "city_source")
+BATCH_SIZE = 256
+TOTAL_LABEL = "All revenue"
+
+
+@dataclass(frozen=True)
+class DailySeries:
+    series: pd.DataFrame     # one row per series: label, level, city, marketing_source
+    days: pd.DatetimeIndex   # regular daily grid
+    values: np.ndarray       # (series, days) float64
+
+
+@dataclass(frozen=True)
+class BatchForecast:
+    series: pd.DataFrame     # as DailySeries.series
+    table: pd.DataFrame      # long: series, ds, y (NaN ahead), yhat, yhat_lower, yhat_upper
+    engine: str
+    horizon: int
+    seconds: float           # fitting and predicting, excluding building the series
+
+    @property
+    def series_per_second(self):
+        return len(self.series) / self.seconds if self.seconds > 0 else float("inf")
+
+    def get(self, label, horizon=None):
+        """One series' history and forecast, indexed by ds."""
+        rows = self.table[self.table["series"] == label].set_index("ds")
+        if horizon is not None:
+            rows = rows.iloc[:len(rows) - self.horizon + horizon]
+        return rows.drop(columns="series")
+
+
+def daily_series(cube, measure="revenue"):
+    """Every LEVELS series of `measure` from one groupby over the cube."""
+    cells = cube.groupby(["city", "marketing_source", "day"], observed=True)[measure].sum()
+    days = pd.date_range(cube["day"].min(), cube["day"].max(), freq="D")
+    pairs = cells.unstack("day", fill_value=0.0).reindex(columns=days, fill_value=0.0)
+
+    cities = pairs.groupby(level="city", observed=True).sum()
+    sources = pairs.groupby(level="marketing_source", observed=True).sum()
+    city_names = pairs.index.get_level_values("city").astype(str)
+    source_names = pairs.index.get_level_values("marketing_source").astype(str)
+
+    series = pd.concat([
+        pd.DataFrame({"label": [TOTAL_LABEL], "level": "total", "city": None, "marketing_source": None}),
+        pd.DataFrame({"label": cities.index.astype(str), "level": "city",
+                      "city": cities.index.astype(str), "marketing_source": None}),
+        pd.DataFrame({"label": sources.index.astype(str), "level": "marketing_source",
+                      "city": None, "marketing_source": sources.index.astype(str)}),
+        pd.DataFrame({"label": city_names + " × " + source_names, "level": "city_source",
+                      "city": city_names, "marketing_source": source_names}),
+    ], ignore_index=True)
+    values = np.vstack([pairs.to_numpy().sum(axis=0, keepdims=True), cities.to_numpy(),
+                        sources.to_numpy(), pairs.to_numpy()]).astype("float64")
+    return DailySeries(series, days, values)
+
+
+def _holt_winters_bands(values, horizon):
+    """(series, days + horizon) arrays of yhat / lower / upper, fitted in chunks."""
+    chunks = []
+    for start in range(0, len(values), BATCH_SIZE):
+        model = fit_holt_winters(values[start:start + BATCH_SIZE])
+        past, ahead = model.in_sample(), model.forecast(horizon)
+        chunks.append(np.stack([np.concatenate([p, a], axis=1) for p, a in zip(past, ahead)]))
+    return np.concatenate(chunks, axis=1)
+
+
+def _prophet_bands(history, horizon):
+    # One pool task: a module-level function so it pickles
+    forecast = fit_series(history, horizon, "prophet").forecast
+    return forecast[BAND_COLUMNS].to_numpy().T
+
+
+def _prophet_batch(data, horizon, workers):
+    histories = [pd.DataFrame({"ds": data.days, "y": row}) for row in data.values]
+    if workers == 1:
+        return np.stack([_prophet_bands(history, horizon) for history in histories], axis=1)
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    with pool:
+        bands = list(pool.map(_prophet_bands, histories, [horizon] * len(histories)))
+    return np.stack(bands, axis=1)
+
+
+def forecast_cube(cube, horizon=FORECAST_HORIZON, engine=DEFAULT_ENGINE, workers=None, measure="revenue"):
+    """BatchForecast of every LEVELS series of `measure` in the cube."""
+    data = daily_series(cube, measure)
+    n_series, n_days = data.values.shape
+
+    start = time.perf_counter()
+    if engine == "holt_winters":
+        bands = _holt_winters_bands(data.values, horizon)
+    elif engine == "prophet":
+        bands = _prophet_batch(data, horizon, workers or (1 if in_worker() else JOB_WORKERS))
+    else:
+        raise ValueError(f"unknown forecast engine: {engine!r}")
+    seconds = time.perf_counter() - start
+
+    ds = data.days.append(pd.date_range(data.days[-1], periods=horizon + 1, freq="D")[1:])
+    y = np.concatenate([data.values, np.full((n_series, horizon), np.nan)], axis=1)
+    table = pd.DataFrame({
+        "series": pd.Categorical(np.repeat(data.series["label"].to_numpy(), len(ds)),
+                                 categories=data.series["label"]),
+        "ds": np.tile(ds.to_numpy(), n_series),
+        "y": y.ravel(),
+        **{name: bands[i].ravel() for i, name in enumerate(BAND_COLUMNS)},
+    })
+    return BatchForecast(data.series, table, engine, horizon, seconds)
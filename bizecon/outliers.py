@@ -0,0 +1,234 @@
+"""Transaction-level anomaly scores from an IsolationForest.
+
+The daily anomaly detectors see about one row per day; this scores every
+order, so a single mispriced or fraudulent order stands out. Features per
+order are revenue, the cogs / revenue ratio, marketing cost, allocated
+opex, item count and the city and marketing source (as category codes
+that are the same in every batch).
+
+The whole dataset is never held at once: orders stream from the query
+backend in CHUNK_ROWS batches (so the DuckDB backend scores Parquet out of
+core) in two passes:
+
+1. a stratified sample: each order is kept with its city x source rate,
+   SAMPLE_ROWS overall but at least MIN_STRATUM_ROWS per stratum (or all
+   of it), so small cities and channels are part of what "normal" means,
+2. scoring: the forest fitted on the sample (kept in the model registry,
+   bizecon.registry) scores every batch in worker processes, at most two
+   batches per worker in flight.
+
+Scores are the IsolationForest anomaly score (about 0.5 for ordinary
+orders, towards 1 for isolated ones), one float32 per order of the data
+version, at the order's ROW_KEY (bizecon.backends): a parallel DuckDB scan
+returns rows in no fixed order, so batches carry their keys and scores are
+placed by key, not by scan position. Orders outside a filter stay NaN.
+They are written straight to a .npy file next to the cache (see
+bizecon.store.scores_path), which callers memory-map, so the column never
+has to be held in memory; only the TOP_N highest-scoring orders with their
+columns are returned. The SCORE_FILES newest score files are kept.
+"""
+import glob
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from bizecon import registry
+from bizecon.backends import ROW_KEY
+from bizecon.jobs import JOB_WORKERS, in_worker
+
+FEATURES = ["revenue", "cogs_ratio", "marketing_cost", "opex_allocated", "items_count",
+            "city", "marketing_source"]
+# Columns read per order: the features' inputs plus what identifies an order
+INPUT_COLUMNS = ["revenue", "cogs", "marketing_cost", "opex_allocated", "items_count",
+                 "city", "marketing_source"]
+DETAIL_COLUMNS = ["transaction_id", "date"]
+OUTLIER_PARAMS = {"n_estimators": 100, "max_samples": 256, "random_state": 42}
+SAMPLE_ROWS = 200_000
+MIN_STRATUM_ROWS = 1_000
+CHUNK_ROWS = 1_000_000
+TOP_N = 50
+SEED = 42
+SCORE_FILES = 8
+
+
+@dataclass(frozen=True)
+class OrderScores:
+    path: str               # .npy of float32 scores indexed by ROW_KEY, NaN outside the filter
+    orders: int             # orders scored
+    top: pd.DataFrame       # TOP_N highest-scoring orders with their columns and outlier_score
+    sample_rows: int
+    seconds: float          # sampling, fitting and scoring
+
+    def scores(self):
+        """The score column, memory-mapped read-only from path."""
+        return np.load(self.path, mmap_mode="r")
+
+
+def order_features(batch, categories):
+    """(rows, FEATURES) float32 matrix; missing values count as 0.
+
+    categories maps city / marketing_source to the labels whose positions
+    are the codes, so codes agree across batches.
+    """
+    revenue = batch["revenue"].to_numpy(dtype="float32", na_value=np.nan)
+    cogs = batch["cogs"].to_numpy(dtype="float32", na_value=np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.where(revenue != 0, cogs / revenue, np.nan)
+    X = np.empty((len(batch), len(FEATURES)), dtype="float32")
+    X[:, 0] = revenue
+    X[:, 1] = ratio
+    for i, col in enumerate(["marketing_cost", "opex_allocated", "items_count"], start=2):
+        X[:, i] = batch[col].to_numpy(dtype="float32", na_value=np.nan)
+    for i, col in enumerate(["city", "marketing_source"], start=5):
+        X[:, i] = pd.Categorical(batch[col].astype(str), categories=categories[col]).codes
+    return np.nan_to_num(X, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def sample_rates(cube):
+    """Keep-probability per (city, marketing_source) stratum."""
+    counts = cube.groupby(["city", "marketing_source"], observed=True)["orders"].sum()
+    counts = counts[counts > 0]
+    base = SAMPLE_ROWS / max(int(counts.sum()), 1)
+    rates = np.minimum(1.0, np.maximum(base, MIN_STRATUM_ROWS / counts.to_numpy()))
+    return pd.Series(rates, index=counts.index.set_levels(
+        [level.astype(str) for level in counts.index.levels]))
+
+
+def _strata(X, rates, categories):
+    """Each row's stratum keep-probability (0 for strata not in the cube)."""
+    n_sources = len(categories["marketing_source"])
+    table = np.zeros(len(categories["city"]) * n_sources + 1)
+    cities = categories["city"].get_indexer(rates.index.get_level_values(0))
+    sources = categories["marketing_source"].get_indexer(rates.index.get_level_values(1))
+    table[cities * n_sources + sources] = rates.to_numpy()
+    codes = X[:, 5].astype("int64") * n_sources + X[:, 6].astype("int64")
+    # Code -1 (unknown city or source) lands on the trailing zero
+    return table[np.where((X[:, 5] >= 0) & (X[:, 6] >= 0), codes, -1)]
+
+
+def stratified_sample(batches, rates, categories, seed=SEED):
+    """Feature rows of a Bernoulli sample with per-stratum rates, in one pass."""
+    rng = np.random.default_rng(seed)
+    kept = []
+    for batch in batches:
+        X = order_features(batch, categories)
+        kept.append(X[rng.random(len(X)) < _strata(X, rates, categories)])
+    return np.concatenate(kept) if kept else np.empty((0, len(FEATURES)), dtype="float32")
+
+
+def _fit_forest(X):
+    from sklearn.ensemble import IsolationForest
+
+    forest = IsolationForest(**OUTLIER_PARAMS).fit(X)
+    return forest, {"sample_rows": len(X)}
+
+
+# Worker state: the forest is sent once per worker, not once per batch
+_forest = None
+
+
+def _init_worker(forest):
+    global _forest
+    _forest = forest
+
+
+def _score(X):
+    return (-_forest.score_samples(X)).astype("float32")
+
+
+def _top(batch, scores, top_n):
+    """The batch's top_n orders by score."""
+    if len(scores) > top_n:
+        picks = np.argpartition(scores, -top_n)[-top_n:]
+    else:
+        picks = np.arange(len(scores))
+    return batch.iloc[picks].reset_index(drop=True).assign(outlier_score=scores[picks])
+
+
+def score_batches(batches, categories, scores, forest, top_n=TOP_N, workers=None):
+    """Fills scores at each batch's ROW_KEY values, scored across `workers`
+    processes (one, in-process, inside a job worker); returns (orders scored,
+    the top_n orders)."""
+    workers = workers or (1 if in_worker() else JOB_WORKERS)
+    scored = 0
+    top = None
+
+    def collect(batch, result):
+        nonlocal scored, top
+        scores[batch[ROW_KEY].to_numpy(dtype="int64")] = result
+        scored += len(result)
+        best = _top(batch, result, top_n)
+        top = best if top is None else pd.concat([top, best], ignore_index=True).nlargest(top_n, "outlier_score")
+
+    batches = ((batch, order_features(batch, categories)) for batch in batches)
+    if workers == 1:
+        _init_worker(forest)
+        for batch, X in batches:
+            collect(batch, _score(X))
+    else:
+        pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(forest,))
+        with pool:
+            # Bounded read-ahead: at most two batches per worker in memory
+            pending = deque()
+            for batch, X in batches:
+                pending.append((batch, pool.submit(_score, X)))
+                if len(pending) >= 2 * workers:
+                    collect(*_done(pending.popleft()))
+            while pending:
+                collect(*_done(pending.popleft()))
+    top = top if top is not None else pd.DataFrame(columns=[ROW_KEY, "outlier_score"])
+    return scored, top.sort_values("outlier_score", ascending=False, ignore_index=True)
+
+
+def _done(item):
+    batch, future = item
+    return batch, future.result()
+
+
+def _prune(path):
+    """Delete all but the SCORE_FILES newest score files next to path."""
+    files = sorted(glob.glob(os.path.join(os.path.dirname(path), "*-scores-*.npy")), key=os.path.getmtime)
+    for old in files[:-SCORE_FILES]:
+        # Processes that still map an old file keep their pages
+        os.remove(old)
+
+
+def score_orders(backend, cube, path, fingerprint=None, top_n=TOP_N, workers=None):
+    """OrderScores of every order the backend holds (see the module docstring).
+
+    cube gives the city x source strata; scores are written to the .npy
+    file `path`. With the data fingerprint the fitted forest is kept in the
+    model registry.
+    """
+    start = time.perf_counter()
+    categories = {col: pd.Index(sorted(cube[col].astype(str).unique())) for col in ("city", "marketing_source")}
+    present = set(backend.head(1).columns)
+    columns = INPUT_COLUMNS + [c for c in DETAIL_COLUMNS if c in present] + [ROW_KEY]
+
+    sample = stratified_sample(backend.order_batches(INPUT_COLUMNS, CHUNK_ROWS), sample_rates(cube), categories)
+    if len(sample) == 0:
+        return None
+    forest, _ = registry.fitted("outliers", fingerprint, FEATURES, OUTLIER_PARAMS, _fit_forest, sample)
+
+    n_rows = backend.row_count()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    scores = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype="float32", shape=(backend.key_count(),))
+    scores[:] = np.nan
+    scored, top = score_batches(backend.order_batches(columns, CHUNK_ROWS), categories, scores, forest,
+                                top_n, workers)
+    scores.flush()
+    del scores
+    if scored != n_rows:
+        os.remove(path + ".tmp")
+        raise ValueError(f"scored {scored} orders, expected {n_rows}")
+    # Renamed into place once complete, so no reader maps a partial file
+    os.replace(path + ".tmp", path)
+    _prune(path)
+    return OrderScores(path, n_rows, top, len(sample), time.perf_counter() - start)
@@ -0,0 +1,137 @@
+"""Opt-in per-section timing for dashboard reruns.
+
+Each rerun gets a RenderProfile; the app wraps every section in
+`profile.section(name, rows=...)`. A section records:
+
+- wall time and its start offset within the rerun (for a waterfall),
+- rows scanned (supplied by the caller: frame rows, or cube cells when the
+  section is answered from the rollup cube),
+- cache "hit" if nothing had to be built, otherwise "miss" with the names
+  of the derived columns and memoized results (see note_build) it built,
+- peak memory allocated during the section, from tracemalloc (NumPy and
+  pandas buffers are traced; Arrow's own pool is not).
+
+tracemalloc is process-wide, so peaks are approximate while several
+sessions rerun at once. It only runs while a profiled section is in
+progress, so an aborted rerun cannot leave it switched on.
+
+Finished reruns are appended as JSON lines (one per section) to a rotating
+log, so timings can be aggregated under real traffic:
+
+    jq -s 'group_by(.section) | map({section: .[0].section,
+           p50: (map(.wall_ms) | sort | .[length/2|floor])})' data/logs/render_profile.jsonl
+"""
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PROFILE_LOG = os.environ.get("BIZECON_PROFILE_LOG", "./data/logs/render_profile.jsonl")
+LOG_MAX_BYTES = 5 * 2**20
+LOG_BACKUPS = 3
+
+_lock = threading.Lock()
+_tracing_sections = 0
+_loggers = {}
+
+
+def _start_tracing():
+    global _tracing_sections
+    with _lock:
+        if _tracing_sections == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _tracing_sections += 1
+
+
+def _stop_tracing():
+    global _tracing_sections
+    with _lock:
+        _tracing_sections -= 1
+        if _tracing_sections == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def _log(path):
+    """One rotating JSONL logger per path, shared by every session."""
+    with _lock:
+        logger = _loggers.get(path)
+        if logger is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"bizecon.profiler.{path}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _loggers[path] = logger
+        return logger
+
+
+class RenderProfile:
+    """Section timings of one rerun; a no-op unless enabled."""
+
+    def __init__(self, enabled=False, cols=None, log_path=PROFILE_LOG):
+        self.enabled = enabled
+        self.cols = cols
+        self.log_path = log_path
+        self.rerun_id = uuid.uuid4().hex[:12]
+        self.sections = []
+        self._notes = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def section(self, name, rows=None):
+        if not self.enabled:
+            yield
+            return
+
+        built_before = set(self.cols.computed()) if self.cols is not None else set()
+        notes_before = len(self._notes)
+        _start_tracing()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            _stop_tracing()
+            built = sorted(set(self.cols.computed()) - built_before) if self.cols is not None else []
+            built += self._notes[notes_before:]
+            self.sections.append({
+                "section": name,
+                "start_ms": round((start - self._t0) * 1000, 2),
+                "wall_ms": round(wall * 1000, 2),
+                "rows": rows,
+                "cache": "miss" if built else "hit",
+                "built": built,
+                "peak_alloc_kb": round(max(peak - base, 0) / 1024, 1),
+            })
+
+    def note_build(self, name):
+        """Record that the open section computed `name` instead of reusing it."""
+        if self.enabled:
+            self._notes.append(name)
+
+    def total_ms(self):
+        return round((time.perf_counter() - self._t0) * 1000, 2)
+
+    def finish(self):
+        """Append this rerun's sections to the log (once)."""
+        if not self.enabled:
+            return
+        self.enabled = False
+
+        logger = _log(self.log_path)
+        ts = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        fingerprint = getattr(self.cols, "fingerprint", None)
+        for rec in self.sections:
+            logger.info(json.dumps(dict(rec, ts=ts, rerun=self.rerun_id, fingerprint=fingerprint)))
@@ -0,0 +1,140 @@
+"""Mergeable per-day histogram of profit per order over every row.
+
+Values fall into logarithmic buckets (as in DDSketch): bucket k on each
+side of zero covers (gamma^(k-1), gamma^k] with gamma = (1 + a) / (1 - a),
+so reporting a bucket's midpoint is off by at most a relative `a` (1%).
+Each day keeps its own row of bucket counts plus its exact minimum and
+maximum; counts of different row sets or days just add, so a refresh only
+sketches the appended rows.
+
+Zero has its own bucket and magnitudes below MIN_VALUE share the innermost
+bucket of their sign, so the share of loss-making orders is exact.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 0.01
+MAX_VALUE = 1e9
+
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+K_MIN = int(np.ceil(np.log(MIN_VALUE) / np.log(GAMMA)))
+K_MAX = int(np.ceil(np.log(MAX_VALUE) / np.log(GAMMA)))
+_SIDE = K_MAX - K_MIN + 1
+# Bucket layout: [negative, largest magnitude first] [zero] [positive]
+N_BUCKETS = 2 * _SIDE + 1
+ZERO_BUCKET = _SIDE
+
+
+@dataclass(frozen=True)
+class ProfitSketch:
+    days: pd.DatetimeIndex
+    counts: np.ndarray     # (days, N_BUCKETS) int64
+    minimum: np.ndarray    # exact per-day minimum
+    maximum: np.ndarray    # exact per-day maximum
+
+
+def _magnitude_bucket(x):
+    k = np.ceil(np.log(x) / np.log(GAMMA))
+    return np.clip(k, K_MIN, K_MAX).astype("int64") - K_MIN
+
+
+def bucket_index(values):
+    """Bucket of each (non-NaN) value."""
+    out = np.full(len(values), ZERO_BUCKET, dtype="int64")
+    pos, neg = values > 0, values < 0
+    out[pos] = ZERO_BUCKET + 1 + _magnitude_bucket(values[pos])
+    out[neg] = ZERO_BUCKET - 1 - _magnitude_bucket(-values[neg])
+    return out
+
+
+def bucket_values():
+    """Representative value of every bucket (within RELATIVE_ACCURACY)."""
+    k = np.arange(K_MIN, K_MAX + 1)
+    mid = 2 * GAMMA ** k / (GAMMA + 1)
+    return np.concatenate([-mid[::-1], [0.0], mid])
+
+
+def build_profit_sketch(frame, cols):
+    """One vectorized pass: bucket per row, then a bincount per (day, bucket)."""
+    profit = cols["profit_per_order"].to_numpy(dtype="float64", na_value=np.nan)
+    day = cols["day"]
+    ok = ~np.isnan(profit) & day.notna().to_numpy()
+    profit = profit[ok]
+
+    day_codes, days = pd.factorize(day[ok], sort=True)
+    counts = np.bincount(day_codes * N_BUCKETS + bucket_index(profit),
+                         minlength=len(days) * N_BUCKETS).reshape(len(days), N_BUCKETS)
+
+    minimum = np.full(len(days), np.inf)
+    maximum = np.full(len(days), -np.inf)
+    np.minimum.at(minimum, day_codes, profit)
+    np.maximum.at(maximum, day_codes, profit)
+    return ProfitSketch(pd.DatetimeIndex(days), counts, minimum, maximum)
+
+
+def merge_profit_sketches(sketches):
+    """Combine sketches over disjoint row sets (e.g. a cache and its tail)."""
+    sketches = [s for s in sketches if s is not None]
+    if not sketches:
+        return None
+    days = sketches[0].days
+    for s in sketches[1:]:
+        days = days.union(s.days)
+
+    counts = np.zeros((len(days), N_BUCKETS), dtype="int64")
+    minimum = np.full(len(days), np.inf)
+    maximum = np.full(len(days), -np.inf)
+    for s in sketches:
+        at = days.get_indexer(s.days)
+        counts[at] += s.counts
+        minimum[at] = np.minimum(minimum[at], s.minimum)
+        maximum[at] = np.maximum(maximum[at], s.maximum)
+    return ProfitSketch(days, counts, minimum, maximum)
+
+
+def select_days(sketch, start=None, end=None):
+    """Sketch restricted to days in [start, end)."""
+    mask = np.ones(len(sketch.days), dtype=bool)
+    if start is not None:
+        mask &= sketch.days >= pd.Timestamp(start)
+    if end is not None:
+        mask &= sketch.days < pd.Timestamp(end)
+    return ProfitSketch(sketch.days[mask], sketch.counts[mask], sketch.minimum[mask], sketch.maximum[mask])
+
+
+def select(sketch, start=None, end=None):
+    """(bucket counts, min, max) summed over days in [start, end]."""
+    mask = np.ones(len(sketch.days), dtype=bool)
+    if start is not None:
+        mask &= sketch.days >= pd.Timestamp(start)
+    if end is not None:
+        mask &= sketch.days <= pd.Timestamp(end)
+    if not mask.any():
+        return np.zeros(N_BUCKETS, dtype="int64"), np.nan, np.nan
+    return sketch.counts[mask].sum(axis=0), sketch.minimum[mask].min(), sketch.maximum[mask].max()
+
+
+def quantiles(counts, lo, hi, qs):
+    """Values at quantiles qs, within RELATIVE_ACCURACY (clamped to [lo, hi])."""
+    total = counts.sum()
+    if total == 0:
+        return np.full(len(qs), np.nan)
+    # Rank of each quantile (lower-median convention), then its bucket
+    ranks = np.floor(np.asarray(qs, dtype="float64") * (total - 1))
+    buckets = np.searchsorted(np.cumsum(counts), ranks, side="right")
+    return np.clip(bucket_values()[buckets], lo, hi)
+
+
+def histogram(counts, lo, hi, bins):
+    """Counts in `bins` equal-width bins over [lo, hi].
+
+    Each bucket lands in the bin holding its representative value, so a
+    bin edge is blurred by at most RELATIVE_ACCURACY of its value.
+    """
+    edges = np.linspace(lo, hi, bins + 1)
+    nonzero = np.flatnonzero(counts)
+    where = np.clip(np.searchsorted(edges, bucket_values()[nonzero], side="right") - 1, 0, bins - 1)
+    return np.bincount(where, weights=counts[nonzero], minlength=bins).astype("int64"), edges
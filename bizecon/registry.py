@@ -0,0 +1,100 @@
+"""On-disk registry of fitted ML Lab models.
+
+Each entry is a fitted model plus its hold-out scores, saved with joblib
+under a key derived from the dataset fingerprint, the model name, its
+feature list and hyperparameters (and the scikit-learn version, since
+pickled estimators are not portable across releases). A restarted server
+or a new filter combination seen before loads the model instead of
+refitting it; anything else that changes the key trains a new one.
+
+Entries are evicted least-recently-used first once the directory grows
+past MODEL_BUDGET_MB; a load refreshes an entry's modification time.
+"""
+import glob
+import hashlib
+import json
+import os
+import threading
+
+MODEL_DIR = os.environ.get("BIZECON_MODEL_DIR", "./data/models")
+MODEL_BUDGET_MB = float(os.environ.get("BIZECON_MODEL_BUDGET_MB", "256"))
+
+_lock = threading.Lock()
+
+
+def model_key(name, fingerprint, features, params):
+    """Stable file key of one fitted configuration."""
+    import sklearn
+
+    spec = json.dumps([name, fingerprint, list(features), params, sklearn.__version__],
+                      sort_keys=True, default=str)
+    return f"{name}-{hashlib.sha256(spec.encode()).hexdigest()[:24]}"
+
+
+def _path(key, model_dir):
+    return os.path.join(model_dir, f"{key}.joblib")
+
+
+def load_model(key, model_dir=MODEL_DIR):
+    """(model, scores) saved under key, or None."""
+    import joblib
+
+    path = _path(key, model_dir)
+    try:
+        entry = joblib.load(path)
+        os.utime(path)
+    except (OSError, EOFError, ValueError, KeyError, AttributeError, ImportError):
+        # Missing, half-written or from an incompatible release: refit
+        return None
+    return entry["model"], entry["scores"]
+
+
+def save_model(key, model, scores, model_dir=MODEL_DIR, budget_mb=MODEL_BUDGET_MB):
+    """Store (model, scores) under key (write-then-rename), then enforce the budget."""
+    import joblib
+
+    os.makedirs(model_dir, exist_ok=True)
+    path = _path(key, model_dir)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    joblib.dump({"model": model, "scores": scores}, tmp)
+    os.replace(tmp, path)
+    evict(model_dir, budget_mb, keep=path)
+
+
+def evict(model_dir=MODEL_DIR, budget_mb=MODEL_BUDGET_MB, keep=None):
+    """Delete least recently used entries until the directory fits the budget."""
+    with _lock:
+        entries = []
+        for path in glob.glob(os.path.join(model_dir, "*.joblib")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total, budget = sum(e[1] for e in entries), budget_mb * 2**20
+        for _, size, path in sorted(entries):
+            if total <= budget:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+def fitted(name, fingerprint, features, params, fit, *args):
+    """fit(*args) -> (model, scores), served from the registry when possible.
+
+    Without a fingerprint (ad-hoc frames) the model is fitted and not stored.
+    """
+    if fingerprint is None:
+        return fit(*args)
+    key = model_key(name, fingerprint, features, params)
+    entry = load_model(key)
+    if entry is None:
+        entry = fit(*args)
+        save_model(key, *entry)
+    return entry
@@ -0,0 +1,173 @@
+"""Monte-Carlo scenario simulator over the real order distribution.
+
+A scenario draw is one order bootstrapped from a uniform sample of the
+actual orders (RESERVOIR_ROWS at most, streamed from the query backend so
+it costs one bounded pass). Each draw keeps its own revenue, cogs ratio,
+marketing cost and allocated opex together, so e.g. a paid order's
+acquisition cost stays with its basket:
+
+    profit = revenue * (1 - cogs / revenue) - marketing_cost - opex_allocated
+
+Slider shifts are multiplicative: AOV, CAC and OPEX scale revenue,
+marketing cost and opex so their means land on the slider values, while
+the shape of each distribution (and the cogs ratio) stays the data's. A
+cost whose sample mean is 0 (e.g. the orders of an unpaid channel) cannot
+be scaled, so its slider value is added to every order instead; revenue
+has no such fallback, since orders without revenue have no cogs ratio.
+
+simulate() draws SCENARIOS orders at once and summarizes them: expected
+profit, P(loss), the P5-P95 band of profit per order, and the P5-P95 band
+of the mean profit over a BASKET_ORDERS-order run. sensitivity_grid()
+evaluates expected profit and P(loss) over an AOV x CAC x OPEX grid on one
+shared set of draws (common random numbers, so neighbouring cells differ
+only by the shift), once per dataset.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+RESERVOIR_ROWS = 100_000
+SCENARIOS = 100_000
+BASKET_ORDERS = 1_000
+BAND = (0.05, 0.95)
+GRID_STEPS = 15
+GRID_DRAWS = 2_000
+SEED = 42
+
+COLUMNS = ["revenue", "cogs", "marketing_cost", "opex_allocated"]
+
+
+@dataclass(frozen=True)
+class OrderSample:
+    revenue: np.ndarray         # (orders,) float32
+    margin_rate: np.ndarray     # 1 - cogs / revenue (0 without revenue)
+    marketing_cost: np.ndarray
+    opex: np.ndarray
+
+    @property
+    def aov(self):
+        return float(self.revenue.mean())
+
+    @property
+    def cac(self):
+        return float(self.marketing_cost.mean())
+
+    @property
+    def mean_opex(self):
+        return float(self.opex.mean())
+
+    def shifts(self, aov, cac, opex):
+        """(scale, offset) pairs taking the sample means to aov / cac / opex.
+
+        A zero mean is shifted by adding the target (see the module docstring).
+        """
+        out = []
+        for target, base in ((aov, self.aov), (cac, self.cac), (opex, self.mean_opex)):
+            target = np.asarray(target, dtype="float64")
+            out.append((target / base, np.zeros_like(target)) if base else (np.ones_like(target), target))
+        return tuple(out)
+
+
+@dataclass(frozen=True)
+class Simulation:
+    profit: np.ndarray          # (scenarios,) profit per order of each draw
+    gross_margin: float         # expected revenue - cogs per order
+    expected_profit: float
+    loss_probability: float
+    band: tuple                 # BAND quantiles of profit per order
+    basket_band: tuple          # BAND quantiles of mean profit per order over BASKET_ORDERS orders
+
+    def histogram(self, bins=40):
+        """Draw counts per profit bucket, labelled like metrics.profit_distribution."""
+        counts, edges = np.histogram(self.profit, bins=bins)
+        return pd.Series(counts, index=[f"{int(edges[i])} to {int(edges[i + 1])}" for i in range(bins)])
+
+
+@dataclass(frozen=True)
+class SensitivityGrid:
+    aov: np.ndarray             # grid axes
+    cac: np.ndarray
+    opex: np.ndarray
+    expected_profit: np.ndarray  # (aov, cac, opex)
+    loss_probability: np.ndarray
+
+    def at_opex(self, opex):
+        """Long aov / cac / expected_profit / loss_probability frame at the nearest OPEX step."""
+        k = int(np.abs(self.opex - opex).argmin())
+        aov, cac = np.meshgrid(self.aov, self.cac, indexing="ij")
+        return pd.DataFrame({
+            "aov": aov.ravel(),
+            "cac": cac.ravel(),
+            "expected_profit": self.expected_profit[:, :, k].ravel(),
+            "loss_probability": self.loss_probability[:, :, k].ravel(),
+        })
+
+
+def _columns(frame):
+    revenue = frame["revenue"].to_numpy(dtype="float32", na_value=np.nan)
+    cogs = frame["cogs"].to_numpy(dtype="float32", na_value=np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        margin = np.where(revenue != 0, 1 - cogs / revenue, 0)
+    values = [revenue, margin] + [frame[c].to_numpy(dtype="float32", na_value=np.nan)
+                                  for c in ("marketing_cost", "opex_allocated")]
+    return [np.nan_to_num(v, nan=0.0).astype("float32") for v in values]
+
+
+def order_sample(backend, rows=RESERVOIR_ROWS, seed=SEED):
+    """Uniform sample of about `rows` orders (all of them if fewer), one streamed pass."""
+    rng = np.random.default_rng(seed)
+    rate = min(1.0, 1.1 * rows / max(backend.row_count(), 1))
+    parts = []
+    for batch in backend.order_batches(COLUMNS, 1_000_000):
+        parts.append(batch[rng.random(len(batch)) < rate] if rate < 1 else batch)
+    frame = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS)
+    # The 10% oversampling makes `rows` all but certain; trim back to it
+    if len(frame) > rows:
+        frame = frame.iloc[rng.choice(len(frame), rows, replace=False)]
+    return OrderSample(*_columns(frame))
+
+
+def simulate(sample, aov, cac, opex, scenarios=SCENARIOS, seed=SEED):
+    """Simulation of `scenarios` bootstrapped orders under the AOV / CAC / OPEX shifts."""
+    if len(sample.revenue) == 0:
+        return None
+    (s_aov, o_aov), (s_cac, o_cac), (s_opex, o_opex) = (
+        (float(scale), float(offset)) for scale, offset in sample.shifts(aov, cac, opex))
+    picks = np.random.default_rng(seed).integers(0, len(sample.revenue), scenarios)
+    margin = (sample.revenue[picks] * s_aov + o_aov) * sample.margin_rate[picks]
+    profit = margin - (sample.marketing_cost[picks] * s_cac + o_cac) - (sample.opex[picks] * s_opex + o_opex)
+
+    baskets = profit[:scenarios - scenarios % BASKET_ORDERS].reshape(-1, BASKET_ORDERS).mean(axis=1)
+    return Simulation(
+        profit=profit,
+        gross_margin=float(margin.mean()),
+        expected_profit=float(profit.mean()),
+        loss_probability=float((profit < 0).mean()),
+        band=tuple(np.quantile(profit, BAND)),
+        basket_band=tuple(np.quantile(baskets, BAND)) if len(baskets) else (np.nan, np.nan),
+    )
+
+
+def sensitivity_grid(sample, aov_range, cac_range, opex_range, steps=GRID_STEPS, draws=GRID_DRAWS, seed=SEED):
+    """SensitivityGrid over `steps` values of each (lo, hi) range, on one set of draws."""
+    if len(sample.revenue) == 0:
+        return None
+    aov, cac, opex = (np.linspace(lo, hi, steps) for lo, hi in (aov_range, cac_range, opex_range))
+    (s_aov, o_aov), (s_cac, o_cac), (s_opex, o_opex) = sample.shifts(aov, cac, opex)
+    picks = np.random.default_rng(seed).integers(0, len(sample.revenue), draws)
+    rate = sample.margin_rate[picks].astype("float64")
+    margin = sample.revenue[picks] * rate
+    cost = sample.marketing_cost[picks].astype("float64")
+    overhead = sample.opex[picks].astype("float64")
+
+    # (cac, opex, draws) costs once; one AOV step at a time bounds memory
+    costs = ((s_cac[:, None, None] * cost + o_cac[:, None, None])
+             + (s_opex[None, :, None] * overhead + o_opex[None, :, None]))
+    expected = np.empty((steps, steps, steps))
+    loss = np.empty((steps, steps, steps))
+    for i, (shift, offset) in enumerate(zip(s_aov, o_aov)):
+        profit = shift * margin + offset * rate - costs
+        expected[i] = profit.mean(axis=2)
+        loss[i] = (profit < 0).mean(axis=2)
+    return SensitivityGrid(aov, cac, opex, expected, loss)
@@ -0,0 +1,219 @@
+"""Mergeable HyperLogLog sketches of active users per day x city x source.
+
+Every cell holds 2**precision one-byte registers. A user id is hashed to 64
+bits (pandas' stable hash, so sketches built by different processes or
+over appended rows agree); the top `precision` bits pick a register and
+the register keeps the longest run of leading zeros seen in the rest.
+The union of any set of cells is the element-wise maximum of their
+registers, so distinct users for a date range, city or source filter cost
+one reduction over a few thousand cells instead of a scan of the orders.
+
+The relative standard error is 1.04 / sqrt(2**precision), 1.6% at the
+default precision of 12.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+SKETCH_DIMENSIONS = ["day", "city", "marketing_source"]
+PRECISION = 12
+
+
+@dataclass(frozen=True)
+class UserSketches:
+    keys: pd.DataFrame       # one row per cell, sorted by SKETCH_DIMENSIONS
+    registers: np.ndarray    # (cells, 2**precision) uint8
+    precision: int
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(2 ** self.precision)
+
+
+def user_hashes(frame, user_col):
+    """(uint64 hash per row, row has a user) for the user id column."""
+    users = frame[user_col]
+    if isinstance(users.dtype, pd.CategoricalDtype):
+        # Hash each distinct id once, then gather by code
+        codes = users.cat.codes.to_numpy()
+        hashed = pd.util.hash_array(np.asarray(users.cat.categories, dtype=object))
+        return hashed[codes], codes >= 0
+    return pd.util.hash_array(users.to_numpy(dtype=object)), users.notna().to_numpy()
+
+
+def _registers(hashes, precision):
+    """(register index, rank) per hash."""
+    width = 64 - precision
+    index = (hashes >> np.uint64(width)).astype("int64")
+    rest = hashes & np.uint64((1 << width) - 1)
+    # rest < 2**53, so the float conversion is exact and frexp's exponent
+    # is its bit length
+    _, bit_length = np.frexp(rest.astype("float64"))
+    return index, (width - bit_length + 1).astype("uint8")
+
+
+def _codes(values):
+    """(int64 codes with -1 for missing, categories) of a column."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype("int64"), values.cat.categories
+    codes, uniques = pd.factorize(values)
+    return codes.astype("int64"), uniques
+
+
+def _cell_codes(frame, cols):
+    """Dense cell code per row (-1 if a dimension is missing) and the cells.
+
+    Integer arithmetic on day numbers and dictionary codes instead of a
+    three-key groupby; cells come out sorted by day, then code.
+    """
+    day = cols["day"]
+    day_num = day.to_numpy(dtype="datetime64[D]").astype("int64")
+    has_day = day.notna().to_numpy()
+    d0 = int(day_num[has_day].min()) if has_day.any() else 0
+    city, cities = _codes(frame["city"])
+    source, sources = _codes(frame["marketing_source"])
+
+    n_city, n_source = max(len(cities), 1), max(len(sources), 1)
+    ok = has_day & (city >= 0) & (source >= 0)
+    key = np.where(ok, ((day_num - d0) * n_city + city) * n_source + source, 0)
+
+    counts = np.bincount(key[ok], minlength=1)
+    used = np.flatnonzero(counts)
+    dense = np.full(len(counts), -1, dtype="int64")
+    dense[used] = np.arange(len(used))
+    codes = np.where(ok, dense[key], -1)
+
+    rest, source_code = np.divmod(used, n_source)
+    day_code, city_code = np.divmod(rest, n_city)
+    cells = pd.DataFrame({
+        "day": pd.DatetimeIndex((day_code + d0).astype("datetime64[D]")).as_unit("ns"),
+        "city": np.asarray(cities)[city_code] if len(used) else [],
+        "marketing_source": np.asarray(sources)[source_code] if len(used) else [],
+    })
+    return codes, cells
+
+
+def build_sketches(frame, cols, precision=PRECISION):
+    """One pass: cell code per row, then a scatter-max into the registers."""
+    if cols.user_col is None:
+        return None
+    codes, cells = _cell_codes(frame, cols)
+
+    hashes, has_user = user_hashes(frame, cols.user_col)
+    ok = (codes >= 0) & has_user
+    index, rank = _registers(hashes[ok], precision)
+
+    m = 2 ** precision
+    registers = np.zeros(len(cells) * m, dtype="uint8")
+    np.maximum.at(registers, codes[ok] * m + index, rank)
+    return UserSketches(cells, registers.reshape(len(cells), m), precision)
+
+
+def merge_sketches(sketches):
+    """Union of sketches over disjoint row sets (e.g. a cache and its tail)."""
+    sketches = [s for s in sketches if s is not None]
+    if not sketches:
+        return None
+    keys = pd.concat([s.keys for s in sketches], ignore_index=True)
+    grouped = keys.groupby(SKETCH_DIMENSIONS, observed=True, sort=True)
+    codes = grouped.ngroup().to_numpy()
+    cells = grouped.size().reset_index()[SKETCH_DIMENSIONS]
+
+    registers = np.zeros((len(cells), sketches[0].registers.shape[1]), dtype="uint8")
+    start = 0
+    for s in sketches:
+        # A sketch's cells are distinct, so plain fancy indexing is safe (and
+        # far faster than np.maximum.at over the stacked registers)
+        rows = codes[start:start + len(s.keys)]
+        registers[rows] = np.maximum(registers[rows], s.registers)
+        start += len(s.keys)
+    return UserSketches(cells, registers, sketches[0].precision)
+
+
+def select_cells(sk, mask):
+    """Sketches restricted to the selected cells."""
+    return UserSketches(sk.keys[mask].reset_index(drop=True), sk.registers[mask], sk.precision)
+
+
+def _sigma(x):
+    # sigma(x) = x + sum_k x^(2^k) * 2^(k-1); infinite at x = 1 (all registers empty)
+    x = x.astype("float64")
+    z, y = x.copy(), 1.0
+    with np.errstate(over="ignore", invalid="ignore"):
+        for _ in range(64):
+            x = x * x
+            z_new = z + x * y
+            y += y
+            if np.array_equal(z_new, z, equal_nan=True):
+                break
+            z = z_new
+    return np.where(x >= 1, np.inf, z)
+
+
+def _tau(x):
+    # tau(x) = (1 - x - sum_k (1 - x^(2^-k))^2 * 2^-k) / 3; zero at x = 0 and 1
+    x = x.astype("float64")
+    z, y = 1 - x, 1.0
+    for _ in range(64):
+        x = np.sqrt(x)
+        y *= 0.5
+        z_new = z - (1 - x) ** 2 * y
+        if np.array_equal(z_new, z):
+            break
+        z = z_new
+    return z / 3
+
+
+def estimate(registers):
+    """Cardinality of each row of registers (or of one row).
+
+    Ertl's improved raw estimator ("New cardinality estimation algorithms
+    for HyperLogLog sketches", 2017): unbiased from a handful of users up
+    to billions without HLL++'s empirical bias tables.
+    """
+    registers = np.atleast_2d(registers)
+    rows, m = registers.shape
+    q = 64 - int(np.log2(m))
+    counts = np.bincount(
+        (np.arange(rows)[:, None] * (q + 2) + registers).ravel(), minlength=rows * (q + 2)
+    ).reshape(rows, q + 2).astype("float64")
+
+    z = m * _tau(1 - counts[:, q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + counts[:, k])
+    z = z + m * _sigma(counts[:, 0] / m)
+    return m * m / (2 * np.log(2)) / z
+
+
+def cell_mask(sk, start=None, end=None, cities=None, sources=None):
+    """Cells inside a day range [start, end] and city / source filters."""
+    keys = sk.keys
+    mask = np.ones(len(keys), dtype=bool)
+    if start is not None:
+        mask &= (keys["day"] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (keys["day"] <= pd.Timestamp(end)).to_numpy()
+    if cities:
+        mask &= keys["city"].isin(cities).to_numpy()
+    if sources:
+        mask &= keys["marketing_source"].isin(sources).to_numpy()
+    return mask
+
+
+def distinct_users(sk, mask):
+    """Estimated distinct users over the selected cells."""
+    if not mask.any():
+        return 0.0
+    return float(estimate(sk.registers[mask].max(axis=0))[0])
+
+
+def daily_users(sk, mask):
+    """Estimated distinct users per day over the selected cells."""
+    if not mask.any():
+        return pd.Series(dtype="float64")
+    # Cells are sorted by day first, so each day is one contiguous run
+    days = sk.keys["day"].to_numpy()[mask]
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    per_day = np.maximum.reduceat(sk.registers[mask], starts, axis=0)
+    return pd.Series(estimate(per_day), index=pd.DatetimeIndex(days[starts], name="day"))
@@ -0,0 +1,453 @@
+"""Columnar on-disk cache for data/transactions.csv.
+
+The CSV is parsed once into Arrow IPC (Feather v2) segments with a fixed
+schema; later loads read the columnar files instead of re-parsing text.
+Rows are stored sorted by date, so a date range is a contiguous slice
+found by binary search (see bizecon.filters).
+
+The cache remembers the byte offset of the CSV it has consumed. When the CSV
+only grew (same leading bytes, same bytes just before the old end), only the
+new tail is parsed and stored as an extra segment; any other change is
+treated as a rewrite and triggers a full rebuild. Cold loads compact the
+segments back into one file so it can be memory-mapped as a whole.
+
+Out-of-core query backends read a month-partitioned Parquet copy of the CSV
+instead (see export_parquet), which is streamed and never held in memory.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
+import pyarrow.feather as feather
+
+CSV_PATH = "./data/transactions.csv"
+CACHE_DIR = "./data/.cache"
+PARQUET_DIR = os.environ.get("BIZECON_PARQUET_DIR", "./data/parquet")
+PARQUET_MANIFEST = "_bizecon.json"
+
+# Rows per Parquet row group: small enough for date predicates to skip
+# most of a file via its min/max statistics
+PARQUET_ROW_GROUP = 1_000_000
+SCHEMA_VERSION = 3
+
+# Bytes hashed at the start of the file and just before the consumed offset
+# to tell an append from a rewrite
+CHECK_BYTES = 64 * 1024
+
+# Fixed column types; columns not listed keep the type Arrow infers
+CSV_TYPES = {
+    "transaction_id": pa.string(),
+    "customer_id": pa.string(),
+    "date": pa.timestamp("ns"),
+    "revenue": pa.float32(),
+    "cogs": pa.float32(),
+    "gross_margin": pa.float32(),
+    "marketing_source": pa.string(),
+    "marketing_cost": pa.float32(),
+    "opex_allocated": pa.float32(),
+    "items_count": pa.int8(),
+    "city": pa.string(),
+    "promo_used": pa.bool_(),
+    "customer_cohort": pa.int8(),
+}
+
+# Low-cardinality columns stored dictionary-encoded (pandas categoricals)
+CATEGORICAL_COLUMNS = ["customer_id", "city", "marketing_source"]
+
+
+def csv_signature(csv_path=CSV_PATH):
+    """(size, mtime_ns) of the CSV; any change triggers a cache sync."""
+    st = os.stat(csv_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def dataset_fingerprint(csv_path=CSV_PATH):
+    """Short string identifying the current contents of the CSV."""
+    size, mtime_ns = csv_signature(csv_path)
+    return f"{size:x}-{mtime_ns:x}"
+
+
+def cache_paths(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """(segment path prefix, manifest path) for a CSV."""
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return (
+        os.path.join(cache_dir, stem),
+        os.path.join(cache_dir, f"{stem}.meta.json"),
+    )
+
+
+def customers_path(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """File of the persisted customer feature store (bizecon.features)."""
+    prefix, _ = cache_paths(csv_path, cache_dir)
+    # Not "<stem>.*.arrow": that pattern is reserved for segments
+    return f"{prefix}-customers.arrow"
+
+
+def scores_path(csv_path=CSV_PATH, fingerprint="", cache_dir=CACHE_DIR, backend="pandas"):
+    """File of the per-order outlier scores of one data version (bizecon.outliers).
+
+    Scores sit at each order's row key, which is backend-specific, so each
+    backend gets its own file.
+    """
+    prefix, _ = cache_paths(csv_path, cache_dir)
+    # Filter keys are not file-name safe: name the file by a digest
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+    return f"{prefix}-scores-{backend}-{digest}.npy"
+
+
+def cached_manifest(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """The cache manifest as it is on disk (None if there is none), without syncing."""
+    return _read_meta(cache_paths(csv_path, cache_dir)[1])
+
+
+def cache_span(meta):
+    """The CSV bytes a manifest covers; unchanged by compaction."""
+    return {key: meta[key] for key in ("schema_version", "offset", "head_sha", "edge_sha")}
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+
+def _digest(f, start, end):
+    f.seek(start)
+    return hashlib.sha1(f.read(end - start)).hexdigest()
+
+
+def _edge_checks(f, offset):
+    """Hashes of the file head and of the bytes just before `offset`."""
+    return (
+        _digest(f, 0, min(offset, CHECK_BYTES)),
+        _digest(f, max(0, offset - CHECK_BYTES), offset),
+    )
+
+
+def _convert_options():
+    return pacsv.ConvertOptions(
+        column_types=CSV_TYPES,
+        timestamp_parsers=["%Y-%m-%d %H:%M", pacsv.ISO8601],
+    )
+
+
+def read_csv_typed(source):
+    """Parse CSV text (path or file object) with the fixed schema into Arrow."""
+    table = pacsv.read_csv(source, convert_options=_convert_options())
+
+    for name in CATEGORICAL_COLUMNS:
+        if name in table.column_names:
+            i = table.column_names.index(name)
+            table = table.set_column(i, name, _dictionary_encode(table.column(name)))
+    return table
+
+
+def _dictionary_encode(column):
+    # One dictionary shared by every chunk. ChunkedArray.dictionary_encode()
+    # gives each chunk its own, and the IPC writer then has to unify them.
+    dictionary = pc.unique(column)
+    indices = pc.index_in(column, value_set=dictionary)
+    return pa.chunked_array(
+        [pa.DictionaryArray.from_arrays(chunk, dictionary) for chunk in indices.chunks],
+        type=pa.dictionary(pa.int32(), column.type),
+    )
+
+
+def _sort_by_date(table):
+    """Rows ordered by date (stable, missing dates last); sorted input is kept as is."""
+    if "date" not in table.column_names or table.num_rows < 2:
+        return table
+    date = table.column("date").combine_chunks()
+    ordered = pc.all(pc.less_equal(date.slice(0, len(date) - 1), date.slice(1))).as_py()
+    if ordered and date.null_count == 0:
+        return table
+    # Nulls sort last by default
+    return table.take(pc.sort_indices(table, sort_keys=[("date", "ascending")]))
+
+
+def _write_segment(table, path):
+    # Uncompressed so the file can be memory-mapped; write-then-rename so a
+    # concurrent reader never sees a half-written segment
+    feather.write_feather(table, path + ".tmp", compression="uncompressed")
+    os.replace(path + ".tmp", path)
+
+
+def build_cache(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """Parse the whole CSV into a single fresh segment."""
+    prefix, meta_path = cache_paths(csv_path, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    size, mtime_ns = csv_signature(csv_path)
+    with open(csv_path, "rb") as f:
+        head_sha, edge_sha = _edge_checks(f, size)
+    # Parse exactly the bytes the checks cover, even if rows are being appended
+    with pa.memory_map(csv_path) as mm:
+        table = _sort_by_date(read_csv_typed(pa.BufferReader(mm.read_buffer(size))))
+
+    generation = (_read_meta(meta_path) or {}).get("generation", -1) + 1
+    segment = f"{prefix}.{generation}.0.arrow"
+    _write_segment(table, segment)
+
+    meta = {
+        "schema_version": SCHEMA_VERSION,
+        "generation": generation,
+        "csv_size": size,
+        "csv_mtime_ns": mtime_ns,
+        "offset": size,
+        "head_sha": head_sha,
+        "edge_sha": edge_sha,
+        "segments": [{"file": os.path.basename(segment), "rows": table.num_rows}],
+    }
+    _write_meta(meta_path, meta)
+    _remove_stale_segments(prefix, meta)
+    return meta
+
+
+def _append_tail(csv_path, cache_dir, meta, size, mtime_ns):
+    """Parse only the bytes past meta['offset'] into a new segment.
+
+    Returns the updated manifest, or None if the CSV was rewritten rather
+    than appended to.
+    """
+    prefix, meta_path = cache_paths(csv_path, cache_dir)
+    offset = meta["offset"]
+
+    with open(csv_path, "rb") as f:
+        if _edge_checks(f, offset) != (meta["head_sha"], meta["edge_sha"]):
+            return None
+
+        f.seek(offset)
+        tail = f.read(size - offset)
+        # Only complete lines; a row still being written is picked up next time
+        end = tail.rfind(b"\n") + 1
+        if end == 0:
+            meta = dict(meta, csv_size=size, csv_mtime_ns=mtime_ns)
+            _write_meta(meta_path, meta)
+            return meta
+        f.seek(0)
+        header = f.readline()
+
+    table = _sort_by_date(read_csv_typed(pa.BufferReader(header + tail[:end])))
+    new_offset = offset + end
+    with open(csv_path, "rb") as f:
+        head_sha, edge_sha = _edge_checks(f, new_offset)
+
+    segment = f"{prefix}.{meta['generation']}.{len(meta['segments'])}.arrow"
+    _write_segment(table, segment)
+
+    meta = dict(meta, csv_size=size, csv_mtime_ns=mtime_ns, offset=new_offset,
+                head_sha=head_sha, edge_sha=edge_sha,
+                segments=meta["segments"] + [{"file": os.path.basename(segment),
+                                              "rows": table.num_rows}])
+    _write_meta(meta_path, meta)
+    return meta
+
+
+def sync_cache(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """Bring the cache up to date with the CSV.
+
+    Returns (status, manifest) where status is "fresh" (nothing changed),
+    "appended" (the last manifest segment holds the new rows) or "rebuilt".
+    """
+    _, meta_path = cache_paths(csv_path, cache_dir)
+    meta = _read_meta(meta_path)
+    size, mtime_ns = csv_signature(csv_path)
+
+    if meta is None or meta.get("schema_version") != SCHEMA_VERSION:
+        return "rebuilt", build_cache(csv_path, cache_dir)
+    if meta["csv_size"] == size and meta["csv_mtime_ns"] == mtime_ns:
+        return "fresh", meta
+    if size < meta["offset"]:
+        return "rebuilt", build_cache(csv_path, cache_dir)
+
+    n_segments = len(meta["segments"])
+    updated = _append_tail(csv_path, cache_dir, meta, size, mtime_ns)
+    if updated is None:
+        return "rebuilt", build_cache(csv_path, cache_dir)
+    if len(updated["segments"]) == n_segments:
+        return "fresh", updated
+    return "appended", updated
+
+
+def segment_paths(meta, csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    return [os.path.join(cache_dir, s["file"]) for s in meta["segments"]]
+
+
+def _remove_stale_segments(prefix, meta):
+    live = {s["file"] for s in meta["segments"]}
+    for path in glob.glob(f"{prefix}.*.arrow"):
+        if os.path.basename(path) not in live:
+            # Processes that still map an old segment keep their pages
+            os.remove(path)
+
+
+def compact_cache(meta, csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """Merge all segments into one file (no CSV parsing); returns the manifest."""
+    if len(meta["segments"]) <= 1:
+        return meta
+    prefix, meta_path = cache_paths(csv_path, cache_dir)
+
+    tables = [feather.read_table(p, memory_map=True)
+              for p in segment_paths(meta, csv_path, cache_dir)]
+    table = _sort_by_date(pa.concat_tables(tables).unify_dictionaries().combine_chunks())
+
+    generation = meta["generation"] + 1
+    segment = f"{prefix}.{generation}.0.arrow"
+    _write_segment(table, segment)
+
+    meta = dict(meta, generation=generation,
+                segments=[{"file": os.path.basename(segment), "rows": table.num_rows}])
+    _write_meta(meta_path, meta)
+    _remove_stale_segments(prefix, meta)
+    return meta
+
+
+def ensure_cache(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """Path to a single up-to-date cache file, syncing and compacting as needed."""
+    _, meta = sync_cache(csv_path, cache_dir)
+    meta = compact_cache(meta, csv_path, cache_dir)
+    return segment_paths(meta, csv_path, cache_dir)[0]
+
+
+def _pandas_type(arrow_type):
+    # Keep strings in Arrow memory instead of one Python object per row
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+def read_segment(path):
+    """One cache file as a DataFrame.
+
+    The file is memory-mapped and converted one block per column, so
+    numeric and timestamp columns are read-only zero-copy views of the mapped
+    pages rather than private copies. Callers that share the frame between
+    sessions must treat it as immutable and add columns on a shallow copy.
+    """
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(types_mapper=_pandas_type, split_blocks=True)
+
+
+def _concat_categorical(parts):
+    """The first part's categories, plus each later part's unseen ones
+    appended in turn; every part is recoded onto them."""
+    cats = parts[0].cat.categories
+    codes = [parts[0].cat.codes.to_numpy()]
+    for b in parts[1:]:
+        tail_cats = b.cat.categories
+        # Arrow hash lookup; pandas' isin on Arrow-backed strings goes row by row
+        pos = pc.index_in(pa.array(tail_cats), value_set=pa.array(cats))
+        unseen = pos.is_null().to_numpy(zero_copy_only=False)
+        recode = np.where(
+            unseen,
+            len(cats) + np.cumsum(unseen) - 1,
+            pos.fill_null(0).to_numpy(zero_copy_only=False),
+        )
+        tail_codes = b.cat.codes.to_numpy()
+        codes.append(np.where(tail_codes >= 0, recode[tail_codes], -1))
+        cats = cats.append(tail_cats[unseen])
+    dtype = pd.CategoricalDtype(cats)
+    return pd.Series(pd.Categorical.from_codes(np.concatenate(codes), dtype=dtype), name=parts[0].name)
+
+
+def concat_frames(frames):
+    """Segments read one after another as one frame, categoricals kept categorical.
+
+    Plain pd.concat falls back to object dtype when the pieces have
+    different categories, which would turn customer ids into Python strings.
+    """
+    if len(frames) == 1:
+        return frames[0]
+    out = {}
+    for name in frames[0].columns:
+        parts = [f[name] for f in frames]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            out[name] = _concat_categorical(parts)
+        else:
+            out[name] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(out)
+
+
+def load_transactions(csv_path=CSV_PATH, cache_dir=CACHE_DIR):
+    """Transactions as a typed DataFrame, served from the columnar cache."""
+    return read_segment(ensure_cache(csv_path, cache_dir))
+
+
+# ----------------------------
+# Parquet export (out-of-core backends)
+# ----------------------------
+def parquet_fingerprint(parquet_dir=PARQUET_DIR):
+    """Fingerprint of a Parquet dataset: its source CSV's, or its files'."""
+    meta = _read_meta(os.path.join(parquet_dir, PARQUET_MANIFEST))
+    if meta is not None:
+        return meta["fingerprint"]
+    files = sorted(glob.glob(os.path.join(parquet_dir, "**", "*.parquet"), recursive=True))
+    if not files:
+        raise FileNotFoundError(f"no Parquet files under {parquet_dir}")
+    stats = [(os.path.relpath(p, parquet_dir), os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in files]
+    return hashlib.sha1(json.dumps(stats).encode()).hexdigest()[:16]
+
+
+def export_parquet(csv_path=CSV_PATH, parquet_dir=PARQUET_DIR):
+    """Stream the CSV into Parquet files partitioned by month (month=YYYY-MM).
+
+    The CSV is read block by block, so memory stays flat however large it
+    is. The new dataset is written next to the old one and swapped in.
+    """
+    fingerprint = dataset_fingerprint(csv_path)
+    reader = pacsv.open_csv(csv_path, read_options=pacsv.ReadOptions(block_size=64 * 2**20),
+                            convert_options=_convert_options())
+    schema = reader.schema.append(pa.field("month", pa.string()))
+
+    def batches():
+        for batch in reader:
+            month = pc.strftime(batch.column("date"), format="%Y-%m")
+            yield pa.RecordBatch.from_arrays(batch.columns + [month], schema=schema)
+
+    tmp = parquet_dir.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    pads.write_dataset(
+        batches(), tmp, schema=schema, format="parquet",
+        partitioning=pads.partitioning(pa.schema([("month", pa.string())]), flavor="hive"),
+        max_rows_per_group=PARQUET_ROW_GROUP, min_rows_per_group=PARQUET_ROW_GROUP // 4,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    _write_meta(os.path.join(tmp, PARQUET_MANIFEST), {"fingerprint": fingerprint})
+
+    old = parquet_dir.rstrip("/") + ".old"
+    if os.path.exists(parquet_dir):
+        os.replace(parquet_dir, old)
+    os.replace(tmp, parquet_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return fingerprint
+
+
+def sync_parquet(csv_path=CSV_PATH, parquet_dir=PARQUET_DIR):
+    """Bring the Parquet copy up to date with the CSV.
+
+    Returns (status, fingerprint) with status "fresh" or "rebuilt". Without
+    a CSV the Parquet dataset is used as it is, so data can also be
+    produced elsewhere and dropped in place.
+    """
+    if not os.path.exists(csv_path):
+        return "fresh", parquet_fingerprint(parquet_dir)
+    meta = _read_meta(os.path.join(parquet_dir, PARQUET_MANIFEST))
+    if meta is not None and meta["fingerprint"] == dataset_fingerprint(csv_path):
+        return "fresh", meta["fingerprint"]
+    return "rebuilt", export_parquet(csv_path, parquet_dir)
@@ -1,77 +1,375 @@
+import argparse
+import glob
+import os
+import shutil
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 import numpy as np
 import pandas as pd
 
-np.random.seed(42)
-
 NUM_CUSTOMERS = 10000
 DAYS = 180
+TX_PER_DAY = (400, 800)
+SEED = 42
+CHUNK_ROWS = 1_000_000
 
-customers = [str(uuid.uuid4()) for _ in range(NUM_CUSTOMERS)]
 cities = ["Mumbai", "Bangalore", "Delhi", "Pune", "Hyderabad"]
 marketing_sources = ["organic", "paid", "referral", "promo"]
 
-start_date = datetime.now() - timedelta(days=DAYS)
-tx_per_day = np.random.randint(400, 800, size=DAYS)
+# Per-source marketing cost range (low, high); organic traffic is free
+MARKETING_COST_RANGE = {
+    "organic": (0.0, 0.0),
+    "paid": (50.0, 200.0),
+    "referral": (20.0, 80.0),
+    "promo": (10.0, 60.0),
+}
+
+COLUMNS = [
+    "transaction_id", "customer_id", "date", "revenue", "cogs", "gross_margin",
+    "marketing_source", "marketing_cost", "opex_allocated", "items_count",
+    "city", "promo_used", "customer_cohort",
+]
+
+
+# ----------------------------
+# Row-by-row generator (original)
+# ----------------------------
+def generate_loop(num_customers, days, tx_range, out_path, seed=SEED):
+    np.random.seed(seed)
+
+    customers = [str(uuid.uuid4()) for _ in range(num_customers)]
+
+    start_date = datetime.now() - timedelta(days=days)
+    tx_per_day = np.random.randint(tx_range[0], tx_range[1], size=days)
+
+    rows = []
+    first_tx_date = {}
+
+    for d in range(days):
+        day = start_date + timedelta(days=d)
+        n_tx = tx_per_day[d]
+
+        for _ in range(n_tx):
+            customer_id = np.random.choice(customers)
+
+            if customer_id not in first_tx_date:
+                first_tx_date[customer_id] = day
+
+            date = day + timedelta(
+                hours=int(np.random.uniform(9, 22)),
+                minutes=int(np.random.uniform(0, 60))
+            )
+
+            revenue = float(np.clip(np.random.normal(250, 100), 50, 2000))
+            cogs = revenue * np.random.uniform(0.6, 0.8)
+            gross_margin = revenue - cogs
+
+            marketing_source = np.random.choice(marketing_sources)
+
+            if marketing_source == "organic":
+                marketing_cost = 0.0
+            elif marketing_source == "paid":
+                marketing_cost = float(np.random.uniform(50, 200))
+            elif marketing_source == "referral":
+                marketing_cost = float(np.random.uniform(20, 80))
+            else:
+                marketing_cost = float(np.random.uniform(10, 60))
+
+            opex_allocated = float(np.random.uniform(10, 40))
+            items_count = int(np.random.randint(1, 10))
+            city = np.random.choice(cities)
+            promo_used = bool(np.random.choice([0, 1], p=[0.7, 0.3]))
+
+            cohort_week = first_tx_date[customer_id].isocalendar().week
+
+            rows.append({
+                "transaction_id": str(uuid.uuid4()),
+                "customer_id": customer_id,
+                "date": date.strftime("%Y-%m-%d %H:%M"),
+                "revenue": round(revenue, 2),
+                "cogs": round(cogs, 2),
+                "gross_margin": round(gross_margin, 2),
+                "marketing_source": marketing_source,
+                "marketing_cost": round(marketing_cost, 2),
+                "opex_allocated": round(opex_allocated, 2),
+                "items_count": items_count,
+                "city": city,
+                "promo_used": promo_used,
+                "customer_cohort": cohort_week
+            })
+
+    df = pd.DataFrame(rows)
+    df.to_csv(out_path, index=False)
+    return len(df)
+
+
+# ----------------------------
+# Vectorized, chunked generator
+# ----------------------------
+# Same distributions as the loop above, but every column of a chunk is drawn
+# as one NumPy array and the chunk is appended to the CSV before the next one
+# is drawn, so memory stays flat regardless of the total row count.
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+_TWO_DIGITS = np.array([list(f"{i:02d}".encode()) for i in range(60)], dtype=np.uint8)
+
+
+def _uuid4_strings(rng, n):
+    """Random version-4 UUIDs as a fixed-width str array (no per-row uuid calls)."""
+    raw = rng.integers(0, 256, size=(n, 16), dtype=np.uint8)
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+
+    hexed = np.empty((n, 32), dtype=np.uint8)
+    hexed[:, 0::2] = _HEX[raw >> 4]
+    hexed[:, 1::2] = _HEX[raw & 0x0F]
+
+    out = np.full((n, 36), ord("-"), dtype=np.uint8)
+    out[:, 0:8] = hexed[:, 0:8]
+    out[:, 9:13] = hexed[:, 8:12]
+    out[:, 14:18] = hexed[:, 12:16]
+    out[:, 19:23] = hexed[:, 16:20]
+    out[:, 24:36] = hexed[:, 20:32]
+    return out.view("S36").ravel().astype(str)
+
+
+def _date_strings(day_prefix, day_idx, hours, minutes):
+    """'%Y-%m-%d %H:%M' strings assembled from byte lookup tables."""
+    out = np.empty((len(day_idx), 16), dtype=np.uint8)
+    out[:, 0:11] = day_prefix[day_idx]
+    out[:, 11:13] = _TWO_DIGITS[hours]
+    out[:, 13] = ord(":")
+    out[:, 14:16] = _TWO_DIGITS[minutes]
+    return out.view("S16").ravel().astype(str)
+
+
+def _day_calendar(start_date, days):
+    """Per-day 'YYYY-MM-DD ' byte prefixes and ISO week numbers."""
+    day_list = [start_date + timedelta(days=d) for d in range(days)]
+    day_prefix = np.array(
+        [list(d.strftime("%Y-%m-%d ").encode()) for d in day_list], dtype=np.uint8
+    )
+    iso_week = np.array([d.isocalendar().week for d in day_list], dtype=np.int16)
+    return day_prefix, iso_week
+
+
+def _draw_chunk(rng, n, customer_idx, day_idx, first_day, customers, day_prefix, iso_week):
+    """Draw every column for n transactions and return them as a DataFrame."""
+    hours = rng.integers(9, 22, size=n)
+    minutes = rng.integers(0, 60, size=n)
+
+    revenue = np.clip(rng.normal(250, 100, size=n), 50, 2000)
+    cogs = revenue * rng.uniform(0.6, 0.8, size=n)
+    gross_margin = revenue - cogs
+
+    source_idx = rng.integers(0, len(marketing_sources), size=n)
+    cost_lo = np.array([MARKETING_COST_RANGE[s][0] for s in marketing_sources])
+    cost_hi = np.array([MARKETING_COST_RANGE[s][1] for s in marketing_sources])
+    marketing_cost = cost_lo[source_idx] + (cost_hi - cost_lo)[source_idx] * rng.random(n)
+
+    opex_allocated = rng.uniform(10, 40, size=n)
+    items_count = rng.integers(1, 10, size=n)
+    city_idx = rng.integers(0, len(cities), size=n)
+    promo_used = rng.random(n) < 0.3
+
+    return pd.DataFrame({
+        "transaction_id": _uuid4_strings(rng, n),
+        "customer_id": customers[customer_idx],
+        "date": _date_strings(day_prefix, day_idx, hours, minutes),
+        "revenue": revenue.round(2),
+        "cogs": cogs.round(2),
+        "gross_margin": gross_margin.round(2),
+        "marketing_source": np.array(marketing_sources)[source_idx],
+        "marketing_cost": marketing_cost.round(2),
+        "opex_allocated": opex_allocated.round(2),
+        "items_count": items_count,
+        "city": np.array(cities)[city_idx],
+        "promo_used": promo_used,
+        "customer_cohort": iso_week[first_day[customer_idx]],
+    }, columns=COLUMNS)
+
+
+def generate_vectorized(num_customers, days, tx_range, out_path, seed=SEED,
+                        start_date=None, chunk_rows=CHUNK_ROWS):
+    rng = np.random.default_rng(seed)
+
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=days)
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    customers = _uuid4_strings(rng, num_customers)
+    tx_per_day = rng.integers(tx_range[0], tx_range[1], size=days)
+    day_prefix, iso_week = _day_calendar(start_date, days)
+
+    # Row offsets of each day; a chunk is any [lo, hi) slice of the row range
+    day_offsets = np.concatenate([[0], np.cumsum(tx_per_day, dtype=np.int64)])
+    total = int(day_offsets[-1])
+
+    # Day index of each customer's first order (-1 = not seen yet)
+    first_day = np.full(num_customers, -1, dtype=np.int64)
+
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+    for lo in range(0, total, chunk_rows):
+        hi = min(lo + chunk_rows, total)
+        n = hi - lo
+        day_idx = np.searchsorted(day_offsets, np.arange(lo, hi), side="right") - 1
+        customer_idx = rng.integers(0, num_customers, size=n)
+
+        # Rows are in date order, so the first occurrence in the chunk is the
+        # first order for any customer not seen in an earlier chunk
+        seen, first_pos = np.unique(customer_idx, return_index=True)
+        new = first_day[seen] < 0
+        first_day[seen[new]] = day_idx[first_pos[new]]
+
+        chunk = _draw_chunk(rng, n, customer_idx, day_idx, first_day,
+                            customers, day_prefix, iso_week)
+        chunk.to_csv(out_path, mode="a", header=(lo == 0), index=False)
+
+    return total
+
+
+# ----------------------------
+# Parallel, partitioned generator
+# ----------------------------
+# The day range is split into contiguous slices, one per worker. Every worker
+# gets two child streams spawned from the global seed: one for customer draws
+# and one for everything else. Cohort weeks need each customer's first order
+# across ALL days, so generation runs in two passes: pass 1 replays only the
+# customer stream to find per-worker first days, the parent takes the minimum,
+# and pass 2 replays the same customer stream plus the row stream and writes
+# data/transactions/date=YYYY-MM-DD/part-<worker>.csv. Output depends only on
+# seed, sizes, start date and worker count, never on scheduling.
+def _worker_chunks(day_offsets, day_lo, day_hi, chunk_rows):
+    """[lo, hi) row ranges covering days [day_lo, day_hi) in chunk_rows pieces."""
+    row_lo, row_hi = int(day_offsets[day_lo]), int(day_offsets[day_hi])
+    for lo in range(row_lo, row_hi, chunk_rows):
+        yield lo, min(lo + chunk_rows, row_hi)
+
+
+def _first_days_worker(task):
+    cust_seq, day_offsets, day_lo, day_hi, num_customers, chunk_rows = task
+    cust_rng = np.random.default_rng(cust_seq)
+    first_day = np.full(num_customers, np.iinfo(np.int64).max, dtype=np.int64)
+
+    for lo, hi in _worker_chunks(day_offsets, day_lo, day_hi, chunk_rows):
+        day_idx = np.searchsorted(day_offsets, np.arange(lo, hi), side="right") - 1
+        customer_idx = cust_rng.integers(0, num_customers, size=hi - lo)
+        np.minimum.at(first_day, customer_idx, day_idx)
+
+    return first_day
+
+
+def _partition_worker(task):
+    (worker, cust_seq, row_seq, day_offsets, day_lo, day_hi, first_day,
+     customers, start_date, out_dir, chunk_rows) = task
+    cust_rng = np.random.default_rng(cust_seq)
+    rng = np.random.default_rng(row_seq)
+    day_prefix, iso_week = _day_calendar(start_date, len(day_offsets) - 1)
+
+    for lo, hi in _worker_chunks(day_offsets, day_lo, day_hi, chunk_rows):
+        n = hi - lo
+        day_idx = np.searchsorted(day_offsets, np.arange(lo, hi), side="right") - 1
+        customer_idx = cust_rng.integers(0, len(customers), size=n)
+        chunk = _draw_chunk(rng, n, customer_idx, day_idx, first_day,
+                            customers, day_prefix, iso_week)
+
+        # Rows are sorted by day, so each day is one contiguous slice
+        chunk_days, starts = np.unique(day_idx, return_index=True)
+        ends = np.append(starts[1:], n)
+        for d, s, e in zip(chunk_days, starts, ends):
+            day = (start_date + timedelta(days=int(d))).strftime("%Y-%m-%d")
+            part_dir = os.path.join(out_dir, f"date={day}")
+            os.makedirs(part_dir, exist_ok=True)
+            part_path = os.path.join(part_dir, f"part-{worker}.csv")
+            chunk.iloc[s:e].to_csv(part_path, mode="a",
+                                   header=not os.path.exists(part_path), index=False)
+
+    return int(day_offsets[day_hi] - day_offsets[day_lo])
+
+
+def generate_parallel(num_customers, days, tx_range, out_dir, workers, seed=SEED,
+                      start_date=None, chunk_rows=CHUNK_ROWS):
+    plan_seq, *worker_seqs = np.random.SeedSequence(seed).spawn(workers + 1)
+    stream_seqs = [ws.spawn(2) for ws in worker_seqs]
+    plan_rng = np.random.default_rng(plan_seq)
+
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=days)
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    customers = _uuid4_strings(plan_rng, num_customers)
+    tx_per_day = plan_rng.integers(tx_range[0], tx_range[1], size=days)
+    day_offsets = np.concatenate([[0], np.cumsum(tx_per_day, dtype=np.int64)])
+    bounds = np.linspace(0, days, workers + 1).astype(int)
 
-rows = []
-first_tx_date = {}
+    # Partitions are appended to, so clear the previous run's output first
+    for old in glob.glob(os.path.join(out_dir, "date=*")):
+        shutil.rmtree(old)
+    os.makedirs(out_dir, exist_ok=True)
 
-for d in range(DAYS):
-    day = start_date + timedelta(days=d)
-    n_tx = tx_per_day[d]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        local_first = pool.map(_first_days_worker, [
+            (stream_seqs[w][0], day_offsets, bounds[w], bounds[w + 1], num_customers, chunk_rows)
+            for w in range(workers)
+        ])
+        first_day = np.minimum.reduce(list(local_first))
+        # Customers never drawn get day 0; they have no rows, so it is unused
+        first_day[first_day == np.iinfo(np.int64).max] = 0
 
-    for _ in range(n_tx):
-        customer_id = np.random.choice(customers)
+        written = pool.map(_partition_worker, [
+            (w, stream_seqs[w][0], stream_seqs[w][1], day_offsets, bounds[w], bounds[w + 1],
+             first_day, customers, start_date, out_dir, chunk_rows)
+            for w in range(workers)
+        ])
+        return sum(written)
 
-        if customer_id not in first_tx_date:
-            first_tx_date[customer_id] = day
 
-        date = day + timedelta(
-            hours=int(np.random.uniform(9, 22)),
-            minutes=int(np.random.uniform(0, 60))
-        )
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic transactions.")
+    parser.add_argument("--mode", choices=["loop", "vectorized", "parallel"], default="loop",
+                        help="loop = original row-by-row generator; "
+                             "vectorized = chunked NumPy generator for large datasets; "
+                             "parallel = vectorized across --workers processes, "
+                             "written as date partitions under --out-dir")
+    parser.add_argument("--customers", type=int, default=NUM_CUSTOMERS)
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--tx-min", type=int, default=TX_PER_DAY[0],
+                        help="minimum transactions per day (inclusive)")
+    parser.add_argument("--tx-max", type=int, default=TX_PER_DAY[1],
+                        help="maximum transactions per day (exclusive)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                        help="rows drawn and written per chunk (vectorized mode)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--start-date", type=lambda s: datetime.strptime(s, "%Y-%m-%d"),
+                        default=None, help="first day (YYYY-MM-DD); defaults to today minus --days")
+    parser.add_argument("--out", default="data/transactions.csv")
+    parser.add_argument("--out-dir", default="data/transactions",
+                        help="partition root for parallel mode")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes for parallel mode; output is "
+                             "byte-identical for the same seed, --start-date and worker count")
+    return parser.parse_args()
 
-        revenue = float(np.clip(np.random.normal(250, 100), 50, 2000))
-        cogs = revenue * np.random.uniform(0.6, 0.8)
-        gross_margin = revenue - cogs
 
-        marketing_source = np.random.choice(marketing_sources)
+if __name__ == "__main__":
+    args = parse_args()
+    tx_range = (args.tx_min, args.tx_max)
 
-        if marketing_source == "organic":
-            marketing_cost = 0.0
-        elif marketing_source == "paid":
-            marketing_cost = float(np.random.uniform(50, 200))
-        elif marketing_source == "referral":
-            marketing_cost = float(np.random.uniform(20, 80))
+    if args.mode == "parallel":
+        n_rows = generate_parallel(args.customers, args.days, tx_range, args.out_dir,
+                                   args.workers, seed=args.seed, start_date=args.start_date,
+                                   chunk_rows=args.chunk_rows)
+        target = args.out_dir
+    else:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        if args.mode == "vectorized":
+            n_rows = generate_vectorized(args.customers, args.days, tx_range, args.out,
+                                         seed=args.seed, start_date=args.start_date,
+                                         chunk_rows=args.chunk_rows)
         else:
-            marketing_cost = float(np.random.uniform(10, 60))
-
-        opex_allocated = float(np.random.uniform(10, 40))
-        items_count = int(np.random.randint(1, 10))
-        city = np.random.choice(cities)
-        promo_used = bool(np.random.choice([0, 1], p=[0.7, 0.3]))
-
-        cohort_week = first_tx_date[customer_id].isocalendar().week
-
-        rows.append({
-            "transaction_id": str(uuid.uuid4()),
-            "customer_id": customer_id,
-            "date": date.strftime("%Y-%m-%d %H:%M"),
-            "revenue": round(revenue, 2),
-            "cogs": round(cogs, 2),
-            "gross_margin": round(gross_margin, 2),
-            "marketing_source": marketing_source,
-            "marketing_cost": round(marketing_cost, 2),
-            "opex_allocated": round(opex_allocated, 2),
-            "items_count": items_count,
-            "city": city,
-            "promo_used": promo_used,
-            "customer_cohort": cohort_week
-        })
-
-df = pd.DataFrame(rows)
-df.to_csv("data/transactions.csv", index=False)
-print("Generated", len(df), "rows into data/transactions.csv")
+            n_rows = generate_loop(args.customers, args.days, tx_range, args.out, seed=args.seed)
+        target = args.out
 
+    print("Generated", n_rows, "rows into", target)
@@ -0,0 +1,42 @@
+"""Shared fixtures: one small fixed-seed dataset, opened by each backend."""
+import importlib.util
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# Make the bizecon package (repo root) importable without installing it
+sys.path.insert(0, str(ROOT))
+
+
+def _generator():
+    spec = importlib.util.spec_from_file_location("generate_data", ROOT / "scripts" / "generate_data.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def data_dir(tmp_path_factory):
+    """transactions.csv: 500 customers over 120 days, about 6k orders."""
+    path = tmp_path_factory.mktemp("data")
+    _generator().generate_vectorized(500, 120, (40, 60), str(path / "transactions.csv"), seed=42,
+                                     start_date=datetime(2025, 1, 1))
+    return path
+
+
+@pytest.fixture(scope="session")
+def pandas_snap(data_dir):
+    from bizecon.dataset import Dataset
+
+    return Dataset(str(data_dir / "transactions.csv"), str(data_dir / ".cache")).snapshot()
+
+
+@pytest.fixture(scope="session")
+def duckdb_snap(data_dir):
+    pytest.importorskip("duckdb")
+    from bizecon.dataset import LazyDataset
+
+    return LazyDataset(str(data_dir / "transactions.csv"), str(data_dir / "parquet")).snapshot()
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon import anomalies
+from bizecon.anomalies import EWMA_HALFLIFE, MIN_PERIODS, WINDOW
+
+
+@pytest.fixture
+def values():
+    """(6, 200) daily series, some days missing, a few spikes."""
+    rng = np.random.default_rng(42)
+    x = rng.gamma(4.0, 250.0, (6, 200))
+    x[:, 150] *= 4
+    x[rng.random(x.shape) < 0.1] = np.nan
+    x[5, :40] = np.nan
+    return x
+
+
+def trailing(x):
+    """Each series' previous-WINDOW-days rolling window, as pandas sees it."""
+    return pd.DataFrame(x.T).shift(1).rolling(WINDOW, min_periods=MIN_PERIODS)
+
+
+def assert_scores(actual, expected, rtol):
+    expected = expected.to_numpy().T
+    # Same days scored, same scores
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=rtol)
+
+
+def test_rolling_z_matches_pandas(values):
+    window = trailing(values)
+    std = window.std()
+    expected = ((pd.DataFrame(values.T) - window.mean()) / std).where(std > 0)
+    assert_scores(anomalies.rolling_z(values), expected, rtol=1e-9)
+
+
+def test_rolling_mad_matches_pandas(values):
+    window = trailing(values)
+    median = window.median()
+    mad = window.apply(lambda w: np.nanmedian(np.abs(w - np.nanmedian(w))), raw=True)
+    expected = (0.6745 * (pd.DataFrame(values.T) - median) / mad).where(mad > 0)
+    # The windows are sorted in float32
+    assert_scores(anomalies.rolling_mad(values), expected, rtol=1e-4)
+
+
+def test_ewma_z_matches_recursion(values):
+    alpha = 1 - 0.5 ** (1 / EWMA_HALFLIFE)
+    expected = np.full(values.shape, np.nan)
+    for i, series in enumerate(values):
+        mean = var = 0.0
+        seen = 0
+        for t, value in enumerate(series):
+            if np.isnan(value):
+                continue
+            if seen >= MIN_PERIODS and var > 0:
+                expected[i, t] = (value - mean) / np.sqrt(var)
+            if seen == 0:
+                mean = value
+            else:
+                diff = value - mean
+                mean += alpha * diff
+                var = (1 - alpha) * (var + alpha * diff * diff)
+            seen += 1
+    actual = anomalies.ewma_z(values)
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=1e-9)
+
+
+def test_spike_is_flagged_by_every_detector(values):
+    spiky = np.nan_to_num(values[:1], nan=1000.0)
+    for detector, score in anomalies.SCORERS.items():
+        assert abs(score(spiky)[0, 150]) > anomalies.THRESHOLDS[detector], detector
+
+
+def matrix(values):
+    labels = [f"s{i}" for i in range(len(values))]
+    series = pd.DataFrame({"label": labels, "level": ["city"] * 3 + ["marketing_source"] * 3})
+    return anomalies.SeriesMatrix(series, ("revenue",), pd.date_range("2025-01-01", periods=values.shape[1]),
+                                  values[None])
+
+
+def test_detect_is_sparse_table_of_threshold_crossings(values):
+    flags = anomalies.detect(matrix(values), detectors=anomalies.DETECTORS)
+    assert list(flags.columns) == ["series", "level", "metric", "ds", "value", "detector", "score"]
+    limits = flags["detector"].map(anomalies.THRESHOLDS).astype("float64")
+    assert (flags["score"].abs() > limits).all()
+    # Same count as thresholding the scorers directly
+    expected = sum(int(np.sum(np.abs(np.nan_to_num(anomalies.SCORERS[d](values))) > anomalies.THRESHOLDS[d]))
+                   for d in anomalies.DETECTORS)
+    assert len(flags) == expected
+    assert flags["ds"].is_monotonic_increasing
+
+
+def test_segment_thresholds_override_level_then_series(values):
+    m = matrix(values)
+    overrides = {"city": {"rolling_z": 100.0}, "s0": {"rolling_z": 0.5}}
+    flags = anomalies.detect(m, overrides, detectors=("rolling_z",))
+    per_series = flags.groupby("series", observed=False).size()
+    assert per_series[["s1", "s2"]].sum() == 0
+    assert per_series["s0"] > 0
+    assert per_series[["s3", "s4", "s5"]].sum() == len(anomalies.detect(
+        anomalies.SeriesMatrix(m.series.iloc[3:].reset_index(drop=True), m.metrics, m.days, m.values[:, 3:]),
+        detectors=("rolling_z",)))
+
+
+def test_default_scan_leaves_mad_out(values):
+    flags = anomalies.detect(matrix(values))
+    assert set(flags["detector"].cat.categories) == set(anomalies.DEFAULT_DETECTORS)
+    assert "rolling_mad" not in anomalies.DEFAULT_DETECTORS
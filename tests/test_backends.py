@@ -0,0 +1,113 @@
+"""The pandas and DuckDB backends answer every query the same way."""
+from dataclasses import asdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon import cohorts, metrics
+from bizecon.filters import Filters
+
+FILTERS = [
+    Filters(),
+    Filters(start=datetime(2025, 2, 1), end=datetime(2025, 3, 15)),
+    Filters(cities=("Delhi", "Mumbai"), sources=("organic",)),
+]
+
+
+@pytest.fixture(params=FILTERS, ids=["all", "dates", "segments"])
+def snaps(request, pandas_snap, duckdb_snap):
+    return pandas_snap.filtered(request.param), duckdb_snap.filtered(request.param)
+
+
+def assert_frames(a, b, keys=None):
+    if keys:
+        # Categories are coded in first-seen order, which differs between backends
+        a, b = (f.astype({k: str for k in keys if f[k].dtype == "category"}).sort_values(keys)
+                .reset_index(drop=True) for f in (a, b))
+    for col in a.columns:
+        x, y = a[col], b[col]
+        if x.dtype.kind in "fiub":
+            np.testing.assert_allclose(x.to_numpy(dtype="float64"), y.to_numpy(dtype="float64"),
+                                       rtol=1e-6, err_msg=col)
+        elif x.dtype.kind == "M":
+            np.testing.assert_array_equal(x.to_numpy("datetime64[ns]"), y.to_numpy("datetime64[ns]"), col)
+        else:
+            np.testing.assert_array_equal(x.astype(str).to_numpy(), y.astype(str).to_numpy(), col)
+
+
+def test_row_count(snaps):
+    pandas, duck = snaps
+    assert pandas.backend.row_count() == duck.backend.row_count() > 0
+
+
+def test_cube(snaps):
+    pandas, duck = snaps
+    assert list(pandas.cube.columns) == list(duck.cube.columns)
+    keys = [c for c in pandas.cube.columns if pandas.cube[c].dtype.kind not in "fiu"]
+    assert_frames(pandas.cube, duck.cube, keys)
+
+
+def test_kpis(snaps):
+    pandas, duck = snaps
+    expected = asdict(metrics.kpis(pandas))
+    for name, value in asdict(metrics.kpis(duck)).items():
+        assert value == (expected[name] if isinstance(value, str) else
+                         pytest.approx(expected[name], rel=1e-6, nan_ok=True)), name
+
+
+def test_daily_operations(snaps):
+    pandas, duck = snaps
+    assert_frames(pandas.backend.daily_operations(), duck.backend.daily_operations())
+
+
+def test_customers(snaps):
+    pandas, duck = snaps
+    a, b = pandas.backend.customer_orders(), duck.backend.customer_orders()
+    assert_frames(a, b, [a.columns[0]])
+    per_user, duck_per_user = (s.set_axis(s.index.astype(str)).sort_index()
+                               for s in (pandas.backend.orders_per_user(), duck.backend.orders_per_user()))
+    pd.testing.assert_series_equal(per_user, duck_per_user, check_dtype=False, check_index_type=False)
+    assert per_user.sum() == pandas.backend.row_count()
+
+
+def test_active_users(snaps):
+    pandas, duck = snaps
+    args = (None, None, None, None, pd.Timestamp("2025-03-01"))
+    (users, daily, window), (duck_users, duck_daily, duck_window) = (
+        pandas.backend.active_users(*args), duck.backend.active_users(*args))
+    assert (users, window) == (duck_users, duck_window)
+    # pandas also lists the window's days without orders, as zeros
+    np.testing.assert_array_equal(daily[daily > 0].to_numpy(), duck_daily.to_numpy())
+
+
+@pytest.mark.parametrize("grain", ["week", "month"])
+@pytest.mark.parametrize("value", ["users", "revenue"])
+def test_cohorts(snaps, grain, value):
+    pandas, duck = snaps
+    a, b = cohorts.retention(pandas, grain, value), cohorts.retention(duck, grain, value)
+    pd.testing.assert_frame_equal(a.matrix, b.matrix, check_dtype=False, rtol=1e-6)
+    pd.testing.assert_series_equal(a.cohort_size, b.cohort_size, check_dtype=False)
+
+
+def test_profit_sketch(pandas_snap, duckdb_snap):
+    a, b = pandas_snap.profit_sketch, duckdb_snap.profit_sketch
+    assert a.days.equals(b.days)
+    np.testing.assert_array_equal(a.counts, b.counts)
+    np.testing.assert_allclose(a.minimum, b.minimum, rtol=1e-6)
+    np.testing.assert_allclose(a.maximum, b.maximum, rtol=1e-6)
+
+
+def test_order_batches(snaps):
+    pandas, duck = snaps
+    columns = ["revenue", "marketing_cost", "promo_used"]
+
+    def totals(backend):
+        batches = list(backend.order_batches(columns, 1000))
+        return sum(len(b) for b in batches), [sum(float(b[c].astype("float64").sum()) for b in batches)
+                                              for c in columns]
+
+    (rows, sums), (duck_rows, duck_sums) = totals(pandas.backend), totals(duck.backend)
+    assert rows == duck_rows == pandas.backend.row_count()
+    np.testing.assert_allclose(sums, duck_sums, rtol=1e-6)
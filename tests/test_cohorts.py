@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon import cohorts
+
+
+def pivot(frame, grain, value):
+    """Cohort x offset matrix the way the dashboard used to build it, with pivot_table."""
+    if grain == "week":
+        period = frame["date"].dt.to_period("W").dt.start_time
+        first = period.groupby(frame["customer_id"], observed=True).transform("min")
+        offset = (period - first).dt.days // 7
+    else:
+        period = frame["date"].dt.to_period("M").dt.start_time
+        first = period.groupby(frame["customer_id"], observed=True).transform("min")
+        offset = (period.dt.year - first.dt.year) * 12 + period.dt.month - first.dt.month
+    rows = pd.DataFrame({"cohort": first, "offset": offset, "user": frame["customer_id"].astype(str),
+                         "revenue": frame["revenue"].astype("float64")})
+    values, aggfunc = ("user", "nunique") if value == "users" else ("revenue", "sum")
+    return rows.pivot_table(index="cohort", columns="offset", values=values, aggfunc=aggfunc).fillna(0)
+
+
+@pytest.mark.parametrize("grain", ["week", "month"])
+@pytest.mark.parametrize("value", ["users", "revenue"])
+def test_matches_pivot_table(pandas_snap, grain, value):
+    result = cohorts.retention(pandas_snap, grain, value)
+    expected = pivot(pandas_snap.frame, grain, value)
+    expected = expected.reindex(columns=result.matrix.columns, fill_value=0)
+    np.testing.assert_array_equal(result.matrix.index.to_numpy(), expected.index.to_numpy())
+    np.testing.assert_allclose(result.matrix.to_numpy(), expected.to_numpy(), rtol=1e-6)
+
+
+def test_retention_is_share_of_first_period(pandas_snap):
+    result = cohorts.retention(pandas_snap, "week", "users")
+    np.testing.assert_allclose(result.retention[0].to_numpy(), 1.0)
+    np.testing.assert_array_equal(result.cohort_size.to_numpy(), result.matrix[0].to_numpy())
+    # Offsets past the end of the data are unknown for late cohorts
+    assert np.isnan(result.retention.iloc[-1, -1])
+    assert result.cohort_size.sum() == pandas_snap.frame["customer_id"].nunique()
+
+
+def test_sort_fallback_equals_bitmap(monkeypatch):
+    rng = np.random.default_rng(42)
+    users, periods = rng.integers(0, 300, 20_000), rng.integers(0, 40, 20_000)
+    bitmap = cohorts.distinct_pairs(users, periods, 300, 40)
+    monkeypatch.setattr(cohorts, "BITMAP_BUDGET", 0)
+    np.testing.assert_array_equal(cohorts.distinct_pairs(users, periods, 300, 40), bitmap)
+    np.testing.assert_array_equal(bitmap, np.unique(users.astype("int64") * 40 + periods))
+
+
+def test_unknown_grain():
+    with pytest.raises(ValueError):
+        cohorts.retention(None, "day")
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon.cube import DIMENSIONS, MEASURES, build_cube, rollup
+from bizecon.derived import DerivedColumns
+
+
+def test_cells_match_groupby(pandas_snap):
+    frame, cols = pandas_snap.frame, pandas_snap.cols
+    # The cube sums float32 money columns in float64
+    expected = frame.assign(day=cols["day"]).astype({m: "float64" for m in MEASURES}).groupby(
+        DIMENSIONS, observed=True)[MEASURES].sum()
+    cube = pandas_snap.cube.set_index(DIMENSIONS)
+    np.testing.assert_allclose(cube[MEASURES].to_numpy(), expected.to_numpy(), rtol=1e-9)
+    assert cube["orders"].sum() == len(frame)
+
+
+def test_rows_with_a_missing_dimension_belong_to_no_cell(pandas_snap):
+    frame = pandas_snap.frame.copy()
+    frame.loc[[3, 10, 11], "city"] = np.nan
+    frame.loc[20, "marketing_source"] = np.nan
+    cube = build_cube(frame, DerivedColumns(frame, None, pandas_snap.user_col))
+
+    kept = frame.drop(index=[3, 10, 11, 20])
+    assert cube["orders"].sum() == len(kept)
+    assert rollup(cube)["revenue"] == pytest.approx(kept["revenue"].astype("float64").sum())
+    assert rollup(cube)["revenue_n"] == len(kept)
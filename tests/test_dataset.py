@@ -0,0 +1,58 @@
+"""An append folds only the new rows and answers like a fresh load."""
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon.backends import ROW_KEY
+from bizecon.cube import DIMENSIONS
+from bizecon.dataset import Dataset
+from bizecon.features import customer_orders
+
+
+@pytest.fixture
+def appended(data_dir, tmp_path):
+    """(Dataset refreshed after an append, Dataset loaded from the full CSV)."""
+    lines = (data_dir / "transactions.csv").read_text().splitlines(keepends=True)
+    path = tmp_path / "transactions.csv"
+    path.write_text("".join(lines[:4000]))
+    grown = Dataset(str(path), str(tmp_path / ".cache"))
+    grown.snapshot().backend.row_count()
+    with open(path, "a") as f:
+        f.write("".join(lines[4000:]))
+    assert grown.refresh() == "appended"
+
+    full = tmp_path / "full"
+    full.mkdir()
+    shutil.copy(path, full / "transactions.csv")
+    return grown, Dataset(str(full / "transactions.csv"), str(full / ".cache"))
+
+
+def test_append_leaves_the_rows_unjoined(appended):
+    grown, _ = appended
+    snap = grown.snapshot()
+    assert snap.frame is None and snap.backend._frame is None
+    assert len(snap.backend.head(50)) == 50
+    keys = np.concatenate([b[ROW_KEY].to_numpy() for b in snap.backend.order_batches(["revenue", ROW_KEY], 1000)])
+    np.testing.assert_array_equal(keys, np.arange(snap.backend.row_count()))
+    assert snap.backend._frame is None
+
+
+def test_append_matches_a_fresh_load(appended):
+    grown, fresh = (d.snapshot() for d in appended)
+    assert grown.backend.row_count() == fresh.backend.row_count()
+    a, b = (s.cube.astype({k: str for k in DIMENSIONS}).sort_values(DIMENSIONS).reset_index(drop=True)
+            for s in (grown, fresh))
+    pd.testing.assert_frame_equal(a, b, check_dtype=False, check_categorical=False)
+    # Same cells, not necessarily in the same order (city / source codes are first-seen)
+    (a_keys, a_regs), (b_keys, b_regs) = (
+        (s.sketches.keys.astype(str), s.sketches.registers) for s in (grown, fresh))
+    a_order, b_order = (np.lexsort([k[c] for c in reversed(k.columns)]) for k in (a_keys, b_keys))
+    pd.testing.assert_frame_equal(a_keys.iloc[a_order].reset_index(drop=True),
+                                  b_keys.iloc[b_order].reset_index(drop=True), check_column_type=False)
+    np.testing.assert_array_equal(a_regs[a_order], b_regs[b_order])
+    pd.testing.assert_frame_equal(customer_orders(grown.customers), customer_orders(fresh.customers),
+                                  check_like=True)
+    # Queries that need every row join the pieces
+    pd.testing.assert_frame_equal(grown.backend.daily_operations(), fresh.backend.daily_operations())
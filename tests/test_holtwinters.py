@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from bizecon.holtwinters import PERIOD, fit_holt_winters
+
+
+def reference_fit(y, alpha, beta, gamma, phi, period=PERIOD):
+    """ETS(A,Ad,A) one series at a time, written out from the model equations."""
+    level = y[:period].mean()
+    trend = (y[period:2 * period].mean() - level) / period
+    season = list(y[:period] - level)
+    fitted, sse = [], 0.0
+    for t, value in enumerate(y):
+        pred = level + phi * trend + season[t % period]
+        err = value - pred
+        fitted.append(pred)
+        sse += err * err
+        level = level + phi * trend + alpha * err
+        trend = phi * trend + beta * err
+        season[t % period] += gamma * err
+    return np.array(fitted), level, trend, season, np.sqrt(sse / len(y))
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(42)
+    t = np.arange(120)
+    weekly = np.array([0, 10, 20, 15, 5, -25, -25])
+    return np.stack([200 + 0.5 * k * t + weekly[t % PERIOD] * k + rng.normal(0, 5, len(t)) for k in (1, 2, 3)])
+
+
+def test_matches_reference_recursion(series):
+    model = fit_holt_winters(series)
+    for i, y in enumerate(series):
+        fitted, level, trend, season, sigma = reference_fit(
+            y, model.alpha[i], model.beta[i], model.gamma[i], model.phi[i])
+        np.testing.assert_allclose(model.fitted[i], fitted, rtol=1e-10)
+        assert model.level[i] == pytest.approx(level)
+        assert model.trend[i] == pytest.approx(trend)
+        assert model.sigma[i] == pytest.approx(sigma)
+        # Season column j applies j + 1 steps after the last day
+        n = len(y)
+        expected = [season[(n + j) % PERIOD] for j in range(PERIOD)]
+        np.testing.assert_allclose(model.season[i], expected)
+
+
+def test_batch_equals_one_series_at_a_time(series):
+    batch = fit_holt_winters(series)
+    for i, y in enumerate(series):
+        single = fit_holt_winters(y)
+        np.testing.assert_allclose(batch.fitted[i], single.fitted[0])
+        np.testing.assert_allclose(batch.forecast(14)[0][i], single.forecast(14)[0][0])
+
+
+def test_forecast_continues_trend_and_season():
+    t = np.arange(140)
+    weekly = np.array([0, 10, 20, 15, 5, -25, -25])
+    y = 100 + 2.0 * t + weekly[t % PERIOD]
+    mean, lower, upper = fit_holt_winters(y[:126]).forecast(14)
+    np.testing.assert_allclose(mean[0], y[126:], rtol=0.02)
+    assert np.all(lower <= mean) and np.all(mean <= upper)
+
+
+def test_interval_widens_with_horizon(series):
+    model = fit_holt_winters(series)
+    mean, lower, upper = model.forecast(21)
+    width = upper - lower
+    assert np.all(np.diff(width, axis=1) >= -1e-9)
+    # One step ahead the band is the in-sample one
+    _, in_lower, in_upper = model.in_sample()
+    np.testing.assert_allclose(width[:, 0], (in_upper - in_lower)[:, 0])
+
+
+def test_short_series_fit_without_season():
+    model = fit_holt_winters(np.array([10.0, 12, 11, 13, 12, 14, 13, 15, 14, 16]))
+    assert model.period == 1
+    assert np.all(np.isfinite(model.forecast(5)[0]))
+
+
+def test_needs_two_observations():
+    with pytest.raises(ValueError):
+        fit_holt_winters(np.array([1.0]))
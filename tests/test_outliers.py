@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from bizecon import outliers
+from bizecon.backends import ROW_KEY
+from bizecon.filters import Filters
+
+FILTER = Filters(cities=("Delhi", "Pune"))
+
+
+@pytest.fixture(params=["pandas", "duckdb"])
+def snap(request, pandas_snap):
+    return pandas_snap if request.param == "pandas" else request.getfixturevalue("duckdb_snap")
+
+
+def test_scores_are_placed_by_row_key(snap, tmp_path):
+    filtered = snap.filtered(FILTER)
+    result = outliers.score_orders(filtered.backend, filtered.cube, str(tmp_path / "scores.npy"), workers=1)
+    scores = result.scores()
+    assert len(scores) == snap.backend.row_count()
+    assert result.orders == filtered.backend.row_count() == (~np.isnan(scores)).sum()
+
+    top = result.top
+    np.testing.assert_array_equal(scores[top[ROW_KEY].to_numpy()], top["outlier_score"].to_numpy())
+    assert top["city"].astype(str).isin(FILTER.cities).all()
+    # Every order of the filter, and only those, has a score
+    keys = np.concatenate([b[ROW_KEY].to_numpy() for b in filtered.backend.order_batches([ROW_KEY], 1000)])
+    np.testing.assert_array_equal(np.sort(keys), np.flatnonzero(~np.isnan(scores)))
+
+
+def test_row_key_is_a_stable_position(snap):
+    def orders(backend):
+        rows = next(backend.order_batches(["transaction_id", ROW_KEY], 100_000))
+        return rows.set_index(ROW_KEY)["transaction_id"].astype(str).sort_index()
+
+    everything = orders(snap.backend)
+    np.testing.assert_array_equal(everything.index.to_numpy(), np.arange(snap.backend.key_count()))
+    # A filtered scan names each order by the same key
+    some = orders(snap.filtered(FILTER).backend)
+    assert some.equals(everything.loc[some.index])
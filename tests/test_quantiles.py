@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from bizecon import quantiles
+from bizecon.quantiles import MIN_VALUE, RELATIVE_ACCURACY, ZERO_BUCKET
+
+
+@pytest.fixture
+def profits():
+    rng = np.random.default_rng(42)
+    return np.concatenate([rng.normal(5, 60, 50_000), rng.lognormal(4, 1, 5_000), [0.0] * 100])
+
+
+def counts_of(values):
+    return np.bincount(quantiles.bucket_index(values), minlength=quantiles.N_BUCKETS)
+
+
+def test_bucket_value_within_relative_accuracy(profits):
+    big = profits[np.abs(profits) >= MIN_VALUE]
+    represented = quantiles.bucket_values()[quantiles.bucket_index(big)]
+    np.testing.assert_allclose(represented, big, rtol=RELATIVE_ACCURACY * (1 + 1e-9))
+
+
+def test_sign_is_exact(profits):
+    counts = counts_of(profits)
+    assert counts[:ZERO_BUCKET].sum() == (profits < 0).sum()
+    assert counts[ZERO_BUCKET] == (profits == 0).sum()
+    assert counts[ZERO_BUCKET + 1:].sum() == (profits > 0).sum()
+
+
+@pytest.mark.parametrize("q", [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99])
+def test_quantile_matches_numpy(profits, q):
+    got = quantiles.quantiles(counts_of(profits), profits.min(), profits.max(), [q])[0]
+    expected = np.quantile(profits, q, method="lower")
+    assert got == pytest.approx(expected, rel=RELATIVE_ACCURACY * 1.001, abs=MIN_VALUE)
+
+
+def test_histogram_counts_every_value(profits):
+    counts, edges = quantiles.histogram(counts_of(profits), profits.min(), profits.max(), 40)
+    assert counts.sum() == len(profits)
+    exact, _ = np.histogram(profits, edges)
+    # Only values within RELATIVE_ACCURACY of an edge can change bins
+    assert np.abs(counts - exact).sum() <= 0.02 * len(profits)
+
+
+def test_snapshot_sketch_matches_rows(pandas_snap):
+    sketch, profit = pandas_snap.profit_sketch, pandas_snap.cols["profit_per_order"].to_numpy(dtype="float64")
+    counts, lo, hi = quantiles.select(sketch)
+    assert counts.sum() == len(profit)
+    assert (lo, hi) == (profit.min(), profit.max())
+    np.testing.assert_array_equal(counts, counts_of(profit))
+
+
+def test_merge_equals_one_build(pandas_snap):
+    frame, cols = pandas_snap.frame, pandas_snap.cols
+    half = len(frame) // 2
+    parts = [quantiles.build_profit_sketch(part, cols.subset(part, rows, None))
+             for part, rows in ((frame.iloc[:half], slice(0, half)),
+                                (frame.iloc[half:].reset_index(drop=True), slice(half, len(frame))))]
+    merged = quantiles.merge_profit_sketches(parts)
+    whole = pandas_snap.profit_sketch
+    assert merged.days.equals(whole.days)
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    np.testing.assert_array_equal(merged.minimum, whole.minimum)
+    np.testing.assert_array_equal(merged.maximum, whole.maximum)
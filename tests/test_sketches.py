@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bizecon import sketches
+from bizecon.filters import Filters
+from bizecon.metrics import pro_kpis
+from bizecon.sketches import PRECISION
+
+
+def registers(ids, precision=PRECISION):
+    """One HyperLogLog register row over a set of user ids."""
+    hashes, _ = sketches.user_hashes(pd.DataFrame({"user": ids}), "user")
+    index, rank = sketches._registers(hashes, precision)
+    out = np.zeros(2 ** precision, dtype="uint8")
+    np.maximum.at(out, index, rank)
+    return out
+
+
+@pytest.mark.parametrize("n", [10, 1_000, 50_000, 500_000])
+def test_estimate_within_three_standard_errors(n):
+    ids = np.char.add("user-", np.arange(n).astype(str))
+    error = 1.04 / np.sqrt(2 ** PRECISION)
+    assert sketches.estimate(registers(ids))[0] == pytest.approx(n, rel=3 * error, abs=1)
+
+
+def test_empty_registers_estimate_zero():
+    assert sketches.estimate(np.zeros(2 ** PRECISION, dtype="uint8"))[0] == pytest.approx(0, abs=1e-9)
+
+
+def test_union_is_register_max():
+    ids = np.char.add("user-", np.arange(20_000).astype(str))
+    # Overlapping halves: the union counts shared users once
+    a, b = registers(ids[:12_000]), registers(ids[8_000:])
+    np.testing.assert_array_equal(np.maximum(a, b), registers(ids))
+
+
+def test_duplicates_do_not_count():
+    ids = np.char.add("user-", np.arange(5_000).astype(str))
+    np.testing.assert_array_equal(registers(np.concatenate([ids, ids[::-1]])), registers(ids))
+
+
+def test_snapshot_distinct_users(pandas_snap):
+    sk, frame = pandas_snap.sketches, pandas_snap.frame
+    error = 3 * sk.relative_error
+    everyone = sketches.cell_mask(sk)
+    assert sketches.distinct_users(sk, everyone) == pytest.approx(frame["customer_id"].nunique(), rel=error)
+
+    city = frame["city"].cat.categories[0]
+    in_city = sketches.cell_mask(sk, cities=[city])
+    expected = frame.loc[frame["city"] == city, "customer_id"].nunique()
+    assert sketches.distinct_users(sk, in_city) == pytest.approx(expected, rel=error)
+
+    daily = sketches.daily_users(sk, everyone)
+    exact = frame.groupby(frame["date"].dt.normalize())["customer_id"].nunique()
+    np.testing.assert_allclose(daily.to_numpy(), exact.to_numpy(), rtol=error)
+
+
+def test_merge_equals_one_build(pandas_snap):
+    frame, cols = pandas_snap.frame, pandas_snap.cols
+    half = len(frame) // 2
+    parts = [sketches.build_sketches(part, cols.subset(part, rows, None))
+             for part, rows in ((frame.iloc[:half], slice(0, half)),
+                                (frame.iloc[half:].reset_index(drop=True), slice(half, len(frame))))]
+    merged = sketches.merge_sketches(parts)
+
+    def by_cell(sk):
+        # Cells are sorted by category code, which differs between builds
+        keys = sk.keys.astype({"city": str, "marketing_source": str})
+        order = keys.sort_values(sketches.SKETCH_DIMENSIONS).index.to_numpy()
+        return keys.iloc[order].reset_index(drop=True), sk.registers[order]
+
+    (merged_keys, merged_registers), (keys, expected) = by_cell(merged), by_cell(pandas_snap.sketches)
+    pd.testing.assert_frame_equal(merged_keys, keys, check_column_type=False)
+    np.testing.assert_array_equal(merged_registers, expected)
+
+
+@pytest.mark.parametrize("exact", [False, True])
+def test_pro_kpis_over_filtered_snapshot(pandas_snap, exact):
+    start, end = pd.Timestamp("2025-02-01"), pd.Timestamp("2025-03-31")
+    cities, sources = ("Delhi", "Pune"), ("paid",)
+    filtered = pandas_snap.filtered(Filters(start=start, end=end, cities=cities, sources=sources))
+    assert pro_kpis(filtered, exact=exact) == pro_kpis(pandas_snap, start, end, cities, sources, exact)